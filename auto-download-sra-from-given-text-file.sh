@@ -5,10 +5,9 @@ file_path="kumpulan-sra.txt"
 
 # Check if the file exists
 if [ -e "$file_path" ]; then
-    # Open the file and read line by line
-    while IFS= read -r line; do
-        prefetch "$line" --max-size u
-    done < "$file_path"
+    # prefetch several runs at once and fasterq-dump each one as soon as it lands;
+    # rerunning skips runs that are already converted (state in sra/sra_state.json)
+    python3 "$(dirname "$0")/otomatisasi/sra_fetch.py" "$file_path" --workdir sra
 else
     echo "File not found: $file_path"
-fi
\ No newline at end of file
+fi
@@ -3,12 +3,9 @@
 # Specify the directory path
 directory="/path/to/directory"
 
-# Use a loop to iterate over the files in the directory
-for file in "$directory"/*; do
-    # Check if the item is a file (not a directory)
-    if [[ -f "$file" ]]; then
-        # Extract and print the file name
-        filename=$(basename "$file")
-        tar -cjvf "$filename.tar.bz2" "$filename"
-    fi
-done
\ No newline at end of file
+# Compress every file in the directory to <file>.bz2 on all cores.
+# Each file is split into independent bzip2 streams compressed in parallel;
+# the output is a standard .bz2 (bzip2 -d / bzcat) and
+# "blockzip.py decompress" unpacks it in parallel again.
+python3 "$(dirname "$0")/upload-local-gcp-drive/blockzip.py" compress "$directory" --codec bz2 \
+    --report compress_report.json
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""Streaming SRA -> sorted, indexed BAM/CRAM alignment, run on the worker VM.
+
+    fasterq-dump --stdout | bwa mem -p | samtools sort  ->  <acc>.bam + .bai
+
+No FASTQ, SAM or ZIP is written. Reads flow through pipes and only
+samtools sort spills temporary files. Thread counts come from the
+cores this machine actually has. A JSON report with per-step timings
+and peak extra disk usage is written next to the output.
+
+Standard library only: the worker image needs Python 3, sratoolkit,
+bwa and samtools, nothing from pip.
+"""
+import argparse, json, os, shutil, subprocess, sys, threading, time
+
+FASTERQ_DUMP = '/opt/sratoolkit/bin/fasterq-dump'
+BWA = '/bin/bwa'
+SAMTOOLS = 'samtools'
+REFERENCE = '/opt/ref/GCA_000001405.15_GRCh38_full_analysis_set.fna'
+
+
+def usable_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def mem_available_mb():
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return 0
+
+
+def plan_threads(cores):
+    """bwa does the heavy lifting; the dump only has to keep it fed."""
+    return {
+        'fasterq_dump': max(1, min(6, cores // 4)),
+        'bwa': cores,
+        'sort': max(1, cores),
+    }
+
+
+def sort_mem_per_thread_mb(threads, bwa_index_mb):
+    # leave room for the bwa index (resident while sort fills its buffers) and the OS
+    spare = mem_available_mb() - bwa_index_mb - 512
+    return max(64, min(768, spare // max(1, threads))) if spare > 0 else 64
+
+
+class DiskWatch:
+    """Samples used space on the output filesystem; reports the peak above the starting level."""
+
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self.baseline = shutil.disk_usage(path).used
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, shutil.disk_usage(self.path).used - self.baseline)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, shutil.disk_usage(self.path).used - self.baseline)
+
+
+def run_pipeline(steps, log):
+    """Start `steps` as one pipe chain; returns {name: (exit_code, seconds)}."""
+    procs, started = [], {}
+    upstream = None
+    for i, (name, cmd) in enumerate(steps):
+        last = i == len(steps) - 1
+        log.write(f"[align] {name}: {' '.join(cmd)}\n")
+        log.flush()
+        p = subprocess.Popen(cmd, stdin=upstream, stdout=None if last else subprocess.PIPE, stderr=log)
+        if upstream is not None:
+            upstream.close()  # so the producer gets SIGPIPE if the consumer dies
+        upstream = p.stdout
+        procs.append((name, p))
+        started[name] = time.monotonic()
+    results = {}
+    for name, p in procs:
+        code = p.wait()
+        results[name] = (code, round(time.monotonic() - started[name], 1))
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Align one SRA run to a sorted, indexed BAM/CRAM without intermediate files")
+    ap.add_argument('accession', help="Run name; reads <workdir>/<accession>.sra")
+    ap.add_argument('--workdir', default='/home/sra_to_sam', help="Directory with the .sra (default /home/sra_to_sam)")
+    ap.add_argument('--outdir', default=None, help="Output directory (default <workdir>/output)")
+    ap.add_argument('--reference', default=REFERENCE, help="bwa-indexed FASTA")
+    ap.add_argument('--format', choices=['bam', 'cram'], default='bam', help="Output format (default bam)")
+    ap.add_argument('--threads', type=int, default=0, help="Total cores to use (default: all usable cores)")
+    args = ap.parse_args()
+
+    workdir = args.workdir
+    outdir = args.outdir or os.path.join(workdir, 'output')
+    os.makedirs(outdir, exist_ok=True)
+    tmpdir = os.path.join(workdir, f'.tmp_{args.accession}')
+    os.makedirs(tmpdir, exist_ok=True)
+
+    cores = args.threads or usable_cores()
+    threads = plan_threads(cores)
+    index_mb = sum(os.path.getsize(args.reference + ext) for ext in ('.bwt', '.sa', '.pac')
+                   if os.path.exists(args.reference + ext)) // (1024 * 1024)
+    sort_mem = sort_mem_per_thread_mb(threads['sort'], index_mb)
+
+    sra = os.path.join(workdir, f'{args.accession}.sra')
+    out = os.path.join(outdir, f'{args.accession}.{args.format}')
+    read_group = f"@RG\\tID:{args.accession}\\tSM:{args.accession}\\tPL:ILLUMINA"
+
+    # --split-spot + --stdout interleaves mates; bwa -p pairs adjacent reads with the same name
+    steps = [
+        ('fasterq_dump', [FASTERQ_DUMP, sra, '--split-spot', '--stdout', '--skip-technical',
+                          '--threads', str(threads['fasterq_dump']), '--temp', tmpdir]),
+        ('bwa_mem', [BWA, 'mem', '-p', '-t', str(threads['bwa']), '-R', read_group, args.reference, '-']),
+        ('sort', [SAMTOOLS, 'sort', '-@', str(threads['sort']), '-m', f'{sort_mem}M', '-T', os.path.join(tmpdir, 'sort'),
+                  '-O', args.format] + (['--reference', args.reference] if args.format == 'cram' else []) + ['-o', out, '-']),
+    ]
+
+    report = {'accession': args.accession, 'cores': cores, 'threads': threads, 'sort_mem_per_thread_mb': sort_mem,
+              'format': args.format, 'output': out}
+    t0 = time.monotonic()
+    with DiskWatch(outdir) as disk:
+        results = run_pipeline(steps, sys.stderr)
+        report['steps'] = {name: {'exit_code': code, 'seconds': sec} for name, (code, sec) in results.items()}
+        ok = all(code == 0 for code, _ in results.values())
+        if ok:
+            t = time.monotonic()
+            code = subprocess.call([SAMTOOLS, 'index', '-@', str(cores), out])
+            report['steps']['index'] = {'exit_code': code, 'seconds': round(time.monotonic() - t, 1)}
+            ok = code == 0
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+    report['seconds_total'] = round(time.monotonic() - t0, 1)
+    report['peak_extra_disk_mb'] = round(disk.peak / (1024 * 1024), 1)
+    report['output_mb'] = round(os.path.getsize(out) / (1024 * 1024), 1) if os.path.exists(out) else 0
+    report['ok'] = ok
+    with open(os.path.join(outdir, f'{args.accession}.align.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report))
+    if ok:
+        print(f"Alignment {args.accession} SRA to {args.format.upper()} Success")
+    else:
+        if os.path.exists(out):
+            os.remove(out)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
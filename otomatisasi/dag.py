@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+
+class Step:
+    """One shell command with declared input and output files.
+
+    A step depends on the steps that produce its inputs, plus any named
+    in `after`. It is skipped when every output exists and is newer than
+    every input, as with make. `cpus` and `mem_gb` are what the step is
+    expected to use. The runner only starts it when the budget has that
+    much free.
+    """
+
+    def __init__(self, name, cmd, inputs=(), outputs=(), cpus=1, mem_gb=1, after=()):
+        self.name = name
+        self.cmd = cmd
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.cpus = cpus
+        self.mem_gb = mem_gb
+        self.after = list(after)
+
+    def __repr__(self):
+        return f"Step({self.name})"
+
+
+def scatter(shards, build):
+    """One step per shard: `build(label, shard)` for every (label, shard) pair."""
+    return [build(label, shard) for label, shard in shards]
+
+
+def up_to_date(step):
+    if not step.outputs or not all(os.path.exists(p) for p in step.outputs):
+        return False
+    inputs = [os.path.getmtime(p) for p in step.inputs if os.path.exists(p)]
+    return not inputs or min(os.path.getmtime(p) for p in step.outputs) >= max(inputs)
+
+
+class DagRunner:
+    """Runs Steps in dependency order, in parallel under a CPU/RAM budget.
+
+    Ready steps start in declaration order as long as their `cpus` and
+    `mem_gb` fit in what is left of the budget. A step larger than the
+    whole budget runs alone. A step that exits non-zero, or does not
+    produce its outputs, has its partial outputs removed. Everything
+    downstream of it is marked blocked. Independent branches carry on.
+    Logs go to `<log_dir>/<step>.log`.
+    """
+
+    def __init__(self, steps, cpus=None, mem_gb=None, log_dir='dag_logs', dry_run=False):
+        self.steps = list(steps)
+        self.by_name = {s.name: s for s in self.steps}
+        if len(self.by_name) != len(self.steps):
+            raise ValueError("step names must be unique")
+        self.cpus = cpus or os.cpu_count() or 1
+        self.mem_gb = mem_gb or 1 << 30
+        self.log_dir = log_dir
+        self.dry_run = dry_run
+        self.results = {}  # name -> dict(status, seconds, exit_code, ...)
+        self.deps = self._resolve()
+
+    def _resolve(self):
+        producer = {}
+        for step in self.steps:
+            for path in step.outputs:
+                if path in producer:
+                    raise ValueError(f"{path} is an output of both {producer[path]} and {step.name}")
+                producer[path] = step.name
+        deps = {}
+        for step in self.steps:
+            names = {producer[p] for p in step.inputs if p in producer} | set(step.after)
+            unknown = names - set(self.by_name)
+            if unknown:
+                raise ValueError(f"{step.name} runs after unknown steps {sorted(unknown)}")
+            deps[step.name] = names - {step.name}
+        # a cycle would leave steps that can never become ready
+        order, seen = [], set()
+        while len(order) < len(self.steps):
+            ready = [s.name for s in self.steps if s.name not in seen and deps[s.name] <= seen]
+            if not ready:
+                raise ValueError(f"dependency cycle among {sorted(set(self.by_name) - seen)}")
+            order += ready
+            seen.update(ready)
+        return deps
+
+    def _run_step(self, step):
+        os.makedirs(self.log_dir, exist_ok=True)
+        for path in step.outputs:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        log_path = os.path.join(self.log_dir, f"{step.name}.log")
+        start = time.time()
+        with open(log_path, 'w') as log:
+            log.write(f"[{datetime.now()}] {step.cmd}\n")
+            log.flush()
+            code = subprocess.call(['bash', '-o', 'pipefail', '-c', step.cmd], stdout=log, stderr=subprocess.STDOUT)
+        seconds = round(time.time() - start, 1)
+        missing = [p for p in step.outputs if not os.path.exists(p)]
+        if code != 0 or missing:
+            # like make: never leave a half-written target that looks up to date next time
+            for path in step.outputs:
+                if os.path.isfile(path):
+                    os.remove(path)
+            error = f"exit code {code}" if code != 0 else f"did not produce {', '.join(missing)}"
+            return {'status': 'failed', 'seconds': seconds, 'exit_code': code, 'error': f"{error}, see {log_path}"}
+        return {'status': 'ran', 'seconds': seconds, 'exit_code': code}
+
+    def _settle(self, step):
+        """Decide a step without running it: a final result dict, 'wait', or None when it should run."""
+        states = [self.results.get(d, {}).get('status') for d in self.deps[step.name]]
+        if any(s in ('failed', 'blocked') for s in states):
+            return {'status': 'blocked', 'seconds': 0, 'error': 'a dependency failed'}
+        if not all(s in ('ran', 'skipped', 'dry-run') for s in states):
+            return 'wait'
+        planned = 'dry-run' in states  # upstream only pretended to run; its outputs may not exist
+        if not planned and up_to_date(step):
+            return {'status': 'skipped', 'seconds': 0}
+        missing = [] if planned else [p for p in step.inputs if not os.path.exists(p)]
+        if self.dry_run:
+            # an earlier dry-run phase may be what would create the missing files
+            print(f"[dry-run] {step.name}: {step.cmd}" + (f"  (missing now: {', '.join(missing)})" if missing else ''))
+            return {'status': 'dry-run', 'seconds': 0}
+        if missing:
+            return {'status': 'failed', 'seconds': 0, 'error': f"missing input {', '.join(missing)}"}
+        return None
+
+    def run(self):
+        pending = list(self.steps)
+        running = {}
+        used_cpus = used_mem = 0
+        with ThreadPoolExecutor(max_workers=max(1, len(self.steps))) as pool:
+            while pending or running:
+                progressed = True
+                while progressed:  # a settled step can make steps declared before it ready
+                    progressed = False
+                    for step in list(pending):
+                        decision = self._settle(step)
+                        if decision == 'wait':
+                            continue
+                        if decision is not None:
+                            pending.remove(step)
+                            progressed = True
+                            self.results[step.name] = decision
+                            if decision['status'] in ('skipped', 'blocked', 'failed'):
+                                print(f"[{datetime.now()}] {step.name}: {decision['status']}"
+                                      + (f" ({decision['error']})" if 'error' in decision else ''))
+                            continue
+                        if (used_cpus + step.cpus <= self.cpus and used_mem + step.mem_gb <= self.mem_gb) or not running:
+                            pending.remove(step)
+                            progressed = True
+                            used_cpus += step.cpus
+                            used_mem += step.mem_gb
+                            print(f"[{datetime.now()}] {step.name}: start ({step.cpus} cpu, {step.mem_gb} GB)")
+                            running[pool.submit(self._run_step, step)] = step
+                if not running:
+                    if pending:
+                        raise RuntimeError(f"no runnable steps among {[s.name for s in pending]}")
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    used_cpus -= step.cpus
+                    used_mem -= step.mem_gb
+                    result = future.result()
+                    self.results[step.name] = result
+                    print(f"[{datetime.now()}] {step.name}: {result['status']} in {result['seconds']}s"
+                          + (f" ({result['error']})" if 'error' in result else ''))
+        return self.results
+
+    def rows(self):
+        return [dict(step=s.name, cpus=s.cpus, mem_gb=s.mem_gb, **self.results.get(s.name, {'status': 'not run'}))
+                for s in self.steps]
+
+    def report(self, path=None):
+        return print_report(self.rows(), path)
+
+    @property
+    def ok(self):
+        return all(r['status'] in ('ran', 'skipped', 'dry-run') for r in self.results.values())
+
+
+def print_report(rows, path=None):
+    """Per-step timing table from `DagRunner.rows()`; also written as JSON to `path` when given."""
+    width = max([len(r['step']) for r in rows] + [4])
+    print(f"{'step':<{width}}  {'status':<8} {'seconds':>9} {'cpus':>4} {'mem_gb':>6}")
+    for r in rows:
+        print(f"{r['step']:<{width}}  {r['status']:<8} {r.get('seconds', 0):>9.1f} {r['cpus']:>4} {r['mem_gb']:>6}"
+              + (f"  {r['error']}" if 'error' in r else ''))
+    print(f"total step time {sum(r.get('seconds', 0) for r in rows):.1f}s, "
+          f"{sum(r['status'] == 'ran' for r in rows)} ran, {sum(r['status'] == 'skipped' for r in rows)} skipped, "
+          f"{sum(r['status'] in ('failed', 'blocked') for r in rows)} failed or blocked")
+    if path:
+        with open(path, 'w') as f:
+            json.dump({'finished_local': datetime.now().isoformat(timespec='seconds'), 'steps': rows}, f, indent=2)
+    return rows
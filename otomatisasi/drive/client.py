@@ -0,0 +1,142 @@
+import time
+import threading
+
+import httplib2
+import google_auth_httplib2
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+DRIVE_BATCH_MAX = 100          # Drive rejects batches with more than 100 calls
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+HTTP_TIMEOUT_SEC = 300
+MAX_ATTEMPTS = 5
+
+
+class DriveClient:
+    """Long-lived Drive v3 client shared by every helper in drive.folder.
+
+    The discovery document is loaded once (static discovery bundled with
+    google-api-python-client, no network fetch). httplib2 connections are
+    not thread-safe, so each thread gets its own keep-alive connection,
+    created on first use and reused afterwards.
+    """
+
+    def __init__(self, creds):
+        self.creds = creds
+        self._local = threading.local()
+        self._service = build('drive', 'v3', credentials=creds, static_discovery=True, cache_discovery=False)
+
+    @property
+    def http(self):
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self.creds, http=httplib2.Http(timeout=HTTP_TIMEOUT_SEC))
+            self._local.http = http
+        return http
+
+    @property
+    def service(self):
+        return self._service
+
+    def execute(self, request):
+        """Run one request on this thread's connection, retrying rate limits and 5xx."""
+        return request.execute(http=self.http, num_retries=MAX_ATTEMPTS)
+
+    def batch(self, requests):
+        """Execute many requests with as few HTTP round-trips as possible.
+
+        `requests` maps a caller-chosen key to an unexecuted request. Calls
+        are sent in batches of up to DRIVE_BATCH_MAX; calls failing with a
+        retryable status are re-sent with backoff. Returns `{key: response}`
+        and raises the first non-retryable HttpError.
+        """
+        results = {}
+        pending = dict(requests)
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            retry = {}
+            keys = list(pending)
+            for i in range(0, len(keys), DRIVE_BATCH_MAX):
+                failures = {}
+
+                def callback(request_id, response, exception):
+                    if exception is None:
+                        results[request_id] = response
+                    else:
+                        failures[request_id] = exception
+
+                batch = self._service.new_batch_http_request(callback=callback)
+                for key in keys[i:i + DRIVE_BATCH_MAX]:
+                    batch.add(pending[key], request_id=key)
+                batch.execute(http=self.http)
+
+                for key, exc in failures.items():
+                    status = exc.resp.status if isinstance(exc, HttpError) else None
+                    if status in RETRY_STATUSES and attempt < MAX_ATTEMPTS:
+                        retry[key] = pending[key]
+                    else:
+                        raise exc
+            if not retry:
+                return results
+            pending = retry
+            time.sleep(min(30, 2 ** attempt))
+        return results
+
+    def batch_get(self, file_ids, fields='id, name, parents'):
+        """Fetch metadata for many files; returns `{file_id: metadata}`."""
+        files = self._service.files()
+        return self.batch({fid: files.get(fileId=fid, fields=fields) for fid in file_ids})
+
+    def batch_move(self, file_ids, folder_id):
+        """Move many files into `folder_id` in two batched round-trips.
+
+        One batch reads the current parents of every file, a second
+        batch re-parents them all.
+        """
+        current = self.batch_get(file_ids, fields='id, parents')
+        files = self._service.files()
+        return self.batch({
+            fid: files.update(fileId=fid, addParents=folder_id,
+                              removeParents=','.join(meta.get('parents', [])), fields='id, parents')
+            for fid, meta in current.items()
+        })
+
+    def list_children(self, folder_ids, query='', fields='id, name'):
+        """List the children of many folders at once, following pagination.
+
+        The first page of every folder goes out in one batch, then only the
+        folders with a nextPageToken are queried again. Returns
+        `{folder_id: [file, ...]}`.
+        """
+        files = self._service.files()
+        children = {fid: [] for fid in folder_ids}
+        tokens = {fid: None for fid in folder_ids}
+        while tokens:
+            requests = {
+                fid: files.list(
+                    q=f"'{fid}' in parents and trashed=false" + (f" and {query}" if query else ''),
+                    fields=f"nextPageToken, files({fields})",
+                    pageSize=1000,
+                    pageToken=token,
+                )
+                for fid, token in tokens.items()
+            }
+            tokens = {}
+            for fid, response in self.batch(requests).items():
+                children[fid].extend(response.get('files', []))
+                if response.get('nextPageToken'):
+                    tokens[fid] = response['nextPageToken']
+        return children
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(creds):
+    """Return the shared DriveClient for these credentials, creating it once."""
+    with _clients_lock:
+        client = _clients.get(id(creds))
+        if client is None or client.creds is not creds:
+            client = DriveClient(creds)
+            _clients[id(creds)] = client
+        return client
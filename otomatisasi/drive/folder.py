@@ -1,20 +1,32 @@
+import io
 import os
-import pysftp
+import json
+import time
+import hashlib
+import threading
 import paramiko
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from google.auth.transport.requests import AuthorizedSession
 from googleapiclient.discovery import build
+from googleapiclient.http import MediaIoBaseDownload
+
+try:
+    from .client import get_client
+    from .sshpool import get_pool as get_ssh_pool, put_file, get_file
+except ImportError:  # run from inside drive/ (drive/main.py)
+    from client import get_client
+    from sshpool import get_pool as get_ssh_pool, put_file, get_file
+from tracing import span
 
 def check_folder_for_files(creds, folder_id):
     try:
-        service = build('drive', 'v3', credentials=creds)
-
-        response = service.files().list(
-            q=f"'{folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false",
-            fields="files(id, name)"
-        ).execute()
+        client = get_client(creds)
 
-        folders = response.get('files', [])
+        folders = client.list_children(
+            [folder_id], query="mimeType='application/vnd.google-apps.folder'"
+        )[folder_id]
 
         return folders
 
@@ -24,14 +36,11 @@ def check_folder_for_files(creds, folder_id):
 
 def check_file_in_folder(creds,folder_id,folder_name):
     try:
-        service = build('drive', 'v3', credentials=creds)
+        client = get_client(creds)
 
-        response = service.files().list(
-            q=f"'{folder_id}' in parents and trashed=false and mimeType!='application/vnd.google-apps.folder'",
-            fields="files(id, name)"
-        ).execute()
-
-        files = response.get('files', [])
+        files = client.list_children(
+            [folder_id], query="mimeType!='application/vnd.google-apps.folder'"
+        )[folder_id]
 
         return files
 
@@ -40,85 +49,220 @@ def check_file_in_folder(creds,folder_id,folder_name):
         return False
 
 
-def download_file(creds, file_id, destination_folder):
-    # Create the Drive API client
-    service = build('drive', 'v3', credentials=creds)
+DRIVE_MEDIA_URL = 'https://www.googleapis.com/drive/v3/files/{file_id}?alt=media'
+DOWNLOAD_CHUNK_MB = 16          # streamed piece size, bounds memory per worker
+DOWNLOAD_RANGE_MB = 64          # byte range fetched per request in parallel mode
+DOWNLOAD_PARALLEL_MIN_MB = 256  # files at least this big use parallel ranges
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_ATTEMPTS = 5
+
+
+def download_file(creds, file_id, destination_folder, workers=DOWNLOAD_WORKERS,
+                  parallel_min_mb=DOWNLOAD_PARALLEL_MIN_MB, range_mb=DOWNLOAD_RANGE_MB):
+    """Stream a Drive file to disk without holding it in memory.
+
+    Data goes to `<name>.part` first. Files of at least `parallel_min_mb`
+    are preallocated and fetched as concurrent byte ranges; completed ranges
+    are recorded in `<name>.part.json`, so a rerun after a crash only fetches
+    what is missing. The result is checked against Drive's md5Checksum
+    before it is renamed into place.
+    """
+    # Shared Drive API client
+    client = get_client(creds)
 
     # Get the file metadata
-    file = service.files().get(fileId=file_id).execute()
+    file = client.execute(client.service.files().get(fileId=file_id, fields='id, name, size, md5Checksum'))
+    destination = os.path.join(destination_folder, file['name'])
+    part_path = destination + '.part'
+    size = int(file.get('size') or 0)
+    expected_md5 = file.get('md5Checksum')
 
     # Download the file
     print(f"Start Download File {file['name']} to Disk")
-    request = service.files().get_media(fileId=file_id)
-    with open(os.path.join(destination_folder, file['name']), 'wb') as f:
-        f.write(request.execute())
-    print(f"Download File {file['name']} Complete")
-    
-
-
-def send_to_sftp(creds, file_path, remote_path):
-    # Replace with your SFTP server details
-    SFTP_HOST = '10.184.0.17'
-    SFTP_USERNAME = 'root'
-    SFTP_PASSWORD = '2wsx1qaz.'
-    SFTP_PORT = 22  # Change if your SFTP server uses a different port
+    os.makedirs(destination_folder, exist_ok=True)
+    start = time.time()
+    with span('drive_download', file=file['name']) as download:
+        download.add_bytes(size)
+        if expected_md5 and size >= parallel_min_mb * 1024 * 1024:
+            _download_ranges(creds, file_id, part_path, size, expected_md5, workers, range_mb * 1024 * 1024,
+                             on_retry=download.retry)
+            actual_md5 = _file_md5(part_path)
+        else:
+            actual_md5 = _download_stream(client, file_id, part_path)
+
+        if expected_md5 and actual_md5 != expected_md5:
+            os.remove(part_path)
+            _remove_if_exists(part_path + '.json')
+            raise IOError(f"MD5 mismatch for {file['name']}: expected {expected_md5}, got {actual_md5}")
+        os.replace(part_path, destination)
+        _remove_if_exists(part_path + '.json')
+
+    elapsed = max(time.time() - start, 1e-9)
+    print(f"Download File {file['name']} Complete ({os.path.getsize(destination) / 1024 / 1024 / elapsed:.1f} MB/s)")
+    return destination
+
+
+def _download_stream(client, file_id, part_path):
+    """Sequential chunked download for small files; returns the MD5 of what was written."""
+    md5 = hashlib.md5()
+
+    class _HashingWriter(io.RawIOBase):
+        def __init__(self, f):
+            self.f = f
+
+        def writable(self):
+            return True
+
+        def write(self, b):
+            md5.update(b)
+            return self.f.write(b)
+
+    request = client.service.files().get_media(fileId=file_id)
+    request.http = client.http
+    with open(part_path, 'wb') as f:
+        downloader = MediaIoBaseDownload(_HashingWriter(f), request, chunksize=DOWNLOAD_CHUNK_MB * 1024 * 1024)
+        done = False
+        while not done:
+            _, done = downloader.next_chunk(num_retries=DOWNLOAD_ATTEMPTS)
+    return md5.hexdigest()
+
+
+def _download_ranges(creds, file_id, part_path, size, expected_md5, workers, range_bytes, on_retry=None):
+    """Fetch missing byte ranges of a preallocated .part file concurrently; `on_retry()` counts each retried range."""
+    state_path = part_path + '.json'
+    done = set()
+    if os.path.exists(part_path) and os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        if state.get('size') == size and state.get('md5Checksum') == expected_md5 \
+                and state.get('range_bytes') == range_bytes:
+            done = set(state['done'])
+    if not done:
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+
+    todo = [off for off in range(0, size, range_bytes) if off not in done]
+    if done:
+        print(f"Resume Download {os.path.basename(part_path)}: {len(done)} of {len(done) + len(todo)} ranges already on disk")
+
+    lock = threading.Lock()
+    local = threading.local()
+    url = DRIVE_MEDIA_URL.format(file_id=file_id)
+
+    def save_state():
+        tmp = state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'size': size, 'md5Checksum': expected_md5, 'range_bytes': range_bytes,
+                       'done': sorted(done)}, f)
+        os.replace(tmp, state_path)
+
+    def fetch(offset):
+        if not hasattr(local, 'session'):
+            local.session = AuthorizedSession(creds)
+        end = min(offset + range_bytes, size) - 1
+        for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+            try:
+                with local.session.get(url, headers={'Range': f'bytes={offset}-{end}'}, stream=True, timeout=300) as r:
+                    r.raise_for_status()
+                    if r.status_code != 206:
+                        raise IOError(f"server ignored Range header (HTTP {r.status_code})")
+                    written = 0
+                    with open(part_path, 'r+b') as f:
+                        f.seek(offset)
+                        for piece in r.iter_content(chunk_size=1024 * 1024):
+                            f.write(piece)
+                            written += len(piece)
+                    if written != end - offset + 1:
+                        raise IOError(f"short read at {offset}: {written} of {end - offset + 1} bytes")
+                break
+            except Exception as e:
+                if attempt == DOWNLOAD_ATTEMPTS:
+                    raise
+                print(f"Retry range {offset}-{end} ({attempt}/{DOWNLOAD_ATTEMPTS}): {e}")
+                if on_retry:
+                    on_retry()
+                time.sleep(min(60, 2 ** attempt))
+        with lock:
+            done.add(offset)
+            save_state()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for future in as_completed([pool.submit(fetch, off) for off in todo]):
+            future.result()
+
+
+def _file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(DOWNLOAD_CHUNK_MB * 1024 * 1024), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def _remove_if_exists(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
 
-    with pysftp.Connection(SFTP_HOST, username=SFTP_USERNAME, password=SFTP_PASSWORD, port=SFTP_PORT) as sftp:
-        try:
-            sftp.put(file_path, file_path)
-            print(f"Successfully copied {file_path} to SFTP server.")
-        except Exception as e:
-            print(f"Failed to copy {file_path}: {e}")
 
+# Replace with your SFTP server details
+SFTP_HOST = '10.184.0.17'
+SFTP_USERNAME = 'root'
+SFTP_PASSWORD = '2wsx1qaz.'
+SFTP_PORT = 22  # Change if your SFTP server uses a different port
 
-def get_from_sftp(creds, file_path, remote_path):
-    # Replace with your SFTP server details
-    SFTP_HOST = '10.184.0.17'
-    SFTP_USERNAME = 'root'
-    SFTP_PASSWORD = '2wsx1qaz.'
-    SFTP_PORT = 22  # Change if your SFTP server uses a different port
 
+def send_to_sftp(creds, file_path, remote_path):
+    # Pooled SSH transport; large files go over several SFTP channels in parallel
     try:
-        # Create an SSH client
-        ssh_client = paramiko.SSHClient()
-        ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-        # Connect to the remote host
-        ssh_client.connect(hostname=SFTP_HOST, port=SFTP_PORT, username=SFTP_USERNAME, password=SFTP_PASSWORD)
+        start = time.time()
+        with span('sftp_push', host=SFTP_HOST, path=remote_path) as push:
+            put_file(SFTP_HOST, SFTP_USERNAME, SFTP_PASSWORD, file_path, remote_path, port=SFTP_PORT)
+            push.add_bytes(os.path.getsize(file_path))
+        print(f"Successfully copied {file_path} to SFTP server ({_rate(file_path, start)}).")
+        return True
+    except Exception as e:
+        print(f"Failed to copy {file_path}: {e}")
+        return False
 
-        # Create an SFTP client
-        sftp_client = ssh_client.open_sftp()
 
-        # Download the file from the remote host
-        sftp_client.get(file_path, remote_path)
-        print(f"Successfully copied {file_path} to SFTP server.")
+def get_from_sftp(creds, file_path, remote_path):
+    # file_path is on the SFTP server, remote_path is the local destination
+    try:
+        start = time.time()
+        with span('sftp_pull', host=SFTP_HOST, path=file_path) as pull:
+            get_file(SFTP_HOST, SFTP_USERNAME, SFTP_PASSWORD, file_path, remote_path, port=SFTP_PORT)
+            pull.add_bytes(os.path.getsize(remote_path))
+        print(f"Successfully copied {file_path} from SFTP server ({_rate(remote_path, start)}).")
+        return True
     except Exception as e:
         print(f"Failed to copy {file_path}: {e}")
+        return False
+
+
+def _rate(local_path, start):
+    return f"{os.path.getsize(local_path) / 1024 / 1024 / max(time.time() - start, 1e-9):.1f} MB/s"
 
 def move_file(creds,file_id,folder_id):
-    # Create the Drive API client
-    service = build('drive', 'v3', credentials=creds)
+    move_files(creds, [file_id], folder_id)
 
-    # Get the current parents of the file
-    file = service.files().get(fileId=file_id, fields='parents').execute()
-    previous_parents = ",".join(file.get('parents'))
 
-    # Move the file to the new folder
+def move_files(creds, file_ids, folder_id):
+    # Two batched round-trips for any number of files: read parents, then re-parent
     try:
-        file = service.files().update(
-            fileId=file_id,
-            addParents=folder_id,
-            removeParents=previous_parents,
-            fields='id, parents'
-        ).execute()
-        print(f"File with ID '{file_id}' moved to folder with ID '{folder_id}' successfully.")
+        with span('drive_move', files=len(file_ids)):
+            moved = get_client(creds).batch_move(file_ids, folder_id)
+        for file_id in moved:
+            print(f"File with ID '{file_id}' moved to folder with ID '{folder_id}' successfully.")
+        return moved
     except Exception as e:
         print(f"Error: {e}")
 
 
 def upload_file(creds, file_path, folder_id):
-    # Create the Drive API client
-    service = build('drive', 'v3', credentials=creds)
+    # Shared Drive API client
+    client = get_client(creds)
 
     # Set metadata for the file
     file_metadata = {
@@ -128,45 +272,50 @@ def upload_file(creds, file_path, folder_id):
     
     # Upload the file to Google Drive
     try:
-        media = service.files().create(
-            body=file_metadata,
-            media_body=file_path,
-            fields='id'
-        ).execute()
+        with span('drive_upload', path=file_path) as upload:
+            media = client.execute(client.service.files().create(
+                body=file_metadata,
+                media_body=file_path,
+                fields='id'
+            ))
+            upload.add_bytes(os.path.getsize(file_path))
 
         print(f"File ID: {media['id']}")
         print("File uploaded successfully.")
+        return media['id']
 
     except Exception as e:
         print(f"Error: {e}")
 
-def run_bash_script_on_remote_host(creds,script_name,file_name):
-    ssh_client = paramiko.SSHClient()
-    ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    
-    # Replace with your SFTP server details
-    SFTP_HOST = '10.184.0.17'
-    SFTP_USERNAME = 'root'
-    SFTP_PASSWORD = '2wsx1qaz.'
-    SFTP_PORT = 22  # Change if your SFTP server uses a different port
-    
-    try:
-        # Connect to the remote host
-        ssh_client.connect(SFTP_HOST, username=SFTP_USERNAME, password=SFTP_PASSWORD)
 
-        # Execute the bash script remotely
-        _, stdout, stderr = ssh_client.exec_command(f"bash /home/{script_name}.sh {file_name}")
+def copy_file(creds, file_id, name, folder_id):
+    # Server-side copy: no bytes pass through this host
+    client = get_client(creds)
+    with span('drive_copy', name=name):
+        copied = client.execute(client.service.files().copy(
+            fileId=file_id,
+            body={'name': name, 'parents': [folder_id] if folder_id else None},
+            fields='id'
+        ))
+    print(f"Copied file ID '{file_id}' to '{name}' (File ID: {copied['id']})")
+    return copied['id']
+
+def run_bash_script_on_remote_host(creds,script_name,file_name,host=SFTP_HOST):
+    try:
+        # Reuses the pooled SSH transport instead of a new handshake per call
+        with span('remote_script', host=host, script=script_name) as remote:
+            status, stdout, stderr = get_ssh_pool().exec(
+                host, SFTP_USERNAME, SFTP_PASSWORD, f"bash /home/{script_name}.sh {file_name}", port=SFTP_PORT)
+            remote.set(exit_code=status)
         # Print the output and error messages (if any)
         print("Script output:")
         for line in stdout:
             print(line.strip())
         for line in stderr:
             print(line.strip())
+        return status
 
     except paramiko.AuthenticationException as auth_exc:
         print("Authentication failed. Please check your username and password.")
     except paramiko.SSHException as ssh_exc:
         print("SSH connection failed.")
-    finally:
-        ssh_client.close()
-        
\ No newline at end of file
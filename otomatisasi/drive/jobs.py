@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import threading
+
+try:
+    from .sshpool import get_pool
+except ImportError:  # run from inside drive/ (drive/main.py)
+    from sshpool import get_pool
+from tracing import current_span
+
+REMOTE_JOB_ROOT = '/home/.oto_jobs'
+POLL_MIN_SEC = 1.0
+POLL_MAX_SEC = 15.0
+
+# (vCPU, GiB RAM) per machine type, what the slot scheduler may hand out
+MACHINE_SLOTS = {
+    'e2-micro': (2, 1),
+    'e2-small': (2, 2),
+    'e2-medium': (2, 4),
+    'e2-highcpu-4': (4, 4),
+    'e2-highcpu-8': (8, 8),
+    'e2-highcpu-16': (16, 16),
+    'e2-standard-4': (4, 16),
+    'e2-standard-8': (8, 32),
+    'e2-standard-16': (16, 64),
+}
+
+
+def _quote(value):
+    return "'" + str(value).replace("'", "'\\''") + "'"
+
+
+class Slots:
+    """Counting limiter over declared CPU and memory, like a two-resource semaphore."""
+
+    def __init__(self, cpus, mem_gb):
+        self.cpus = cpus
+        self.mem_gb = mem_gb
+        self._used_cpus = 0
+        self._used_mem = 0
+        self._cond = threading.Condition()
+
+    def resize(self, cpus, mem_gb):
+        with self._cond:
+            self.cpus, self.mem_gb = cpus, mem_gb
+            self._cond.notify_all()
+
+    def acquire(self, cpus, mem_gb):
+        with self._cond:
+            # a job bigger than the whole machine still runs, alone
+            self._cond.wait_for(lambda: (self._used_cpus == 0 and self._used_mem == 0) or
+                                (self._used_cpus + cpus <= self.cpus and self._used_mem + mem_gb <= self.mem_gb))
+            self._used_cpus += cpus
+            self._used_mem += mem_gb
+
+    def release(self, cpus, mem_gb):
+        with self._cond:
+            self._used_cpus -= cpus
+            self._used_mem -= mem_gb
+            self._cond.notify_all()
+
+
+class RemoteJob:
+    def __init__(self, job_id, command, remote_dir, log_offset=0):
+        self.job_id = job_id
+        self.command = command
+        self.remote_dir = remote_dir
+        self.log_offset = log_offset
+        self.exit_code = None
+
+
+class JobRunner:
+    """Detached remote jobs on one SSH host, with live logs and restart reattach.
+
+    Each job gets `<REMOTE_JOB_ROOT>/<job_id>/` on the host holding `pid`,
+    `out.log` and, once the command ends, `exit_code`. The command runs
+    under `setsid nohup`, so it survives a dropped SSH session or an
+    orchestrator restart. Job ids are derived from script and sample, so
+    asking for the same job again reattaches to the running or finished
+    one instead of starting a duplicate. Log offsets are kept in
+    `state_path` so a reattached job streams only new output.
+    """
+
+    def __init__(self, host, username, password, port=22, machine_type='e2-micro',
+                 state_path='remote_jobs.json'):
+        self.host, self.username, self.password, self.port = host, username, password, port
+        self.slots = Slots(*MACHINE_SLOTS.get(machine_type, (1, 1)))
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._state = {}
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self._state = json.load(f)
+
+    def set_machine_type(self, machine_type):
+        self.slots.resize(*MACHINE_SLOTS.get(machine_type, (1, 1)))
+
+    def _exec(self, command):
+        return get_pool().exec(self.host, self.username, self.password, command, self.port)
+
+    def _save(self, job):
+        with self._lock:
+            if job.exit_code is None:
+                self._state[job.job_id] = {'command': job.command, 'log_offset': job.log_offset}
+            else:
+                self._state.pop(job.job_id, None)
+            tmp = self.state_path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self._state, f)
+            os.replace(tmp, self.state_path)
+
+    def launch(self, job_id, command):
+        """Start `command` detached unless `job_id` already exists; returns the RemoteJob."""
+        remote_dir = f"{REMOTE_JOB_ROOT}/{job_id}"
+        saved = self._state.get(job_id, {})
+        job = RemoteJob(job_id, command, remote_dir, saved.get('log_offset', 0))
+        d = _quote(remote_dir)
+        # subshell so redirection and `exit` inside the command cannot skip the exit_code write
+        wrapped = _quote(f"( {command} ) > {remote_dir}/out.log 2>&1; echo $? > {remote_dir}/exit_code.tmp; "
+                         f"mv {remote_dir}/exit_code.tmp {remote_dir}/exit_code")
+        # mkdir is the lock: only the first launcher of a job id starts it
+        status, out, err = self._exec(
+            f"mkdir -p {_quote(REMOTE_JOB_ROOT)} && if mkdir {d} 2>/dev/null; then "
+            f"setsid nohup bash -c {wrapped} > /dev/null 2>&1 < /dev/null & echo $! > {d}/pid; echo started; "
+            f"else echo attached; fi")
+        if status != 0:
+            raise RuntimeError(f"Could not launch job {job_id}: {' '.join(err)}")
+        print(f"[job {job_id}] {out[-1] if out else 'started'}: {command}")
+        self._save(job)
+        return job
+
+    def poll(self, job):
+        """Print new log output; returns the exit code once the job has finished, else None."""
+        d = _quote(job.remote_dir)
+        # one round-trip: log bytes after the offset, then "__OTO__ <log size> <exit code|-> <alive|dead>"
+        status, out, _ = self._exec(
+            f"s=$(stat -c %s {d}/out.log 2>/dev/null || echo 0); "
+            f"tail -c +{job.log_offset + 1} {d}/out.log 2>/dev/null | head -c $(( s - {job.log_offset} )); echo; "
+            f"echo __OTO__ $s $(cat {d}/exit_code 2>/dev/null || echo -) "
+            f"$(kill -0 $(cat {d}/pid 2>/dev/null) 2>/dev/null && echo alive || echo dead)")
+        if status != 0 or not out or not out[-1].startswith('__OTO__'):
+            return None
+        _, size, code, alive = out[-1].split()
+        lines = out[:-1]
+        if lines and lines[-1] == '':
+            lines.pop()
+        for line in lines:
+            print(f"[job {job.job_id}] {line}")
+        job.log_offset = max(job.log_offset, int(size))
+        if code != '-':
+            job.exit_code = int(code)
+        elif alive == 'dead':
+            # the exit code is written just before the process ends; look once more
+            _, again, _ = self._exec(f"cat {d}/exit_code 2>/dev/null")
+            # no exit code and no process: the job was killed or the host rebooted under it
+            job.exit_code = int(again[0]) if again else -1
+        self._save(job)
+        return job.exit_code
+
+    def wait(self, job):
+        """Stream logs until the job exits; polls fast while output flows, slower when quiet."""
+        interval = POLL_MIN_SEC
+        while True:
+            before = job.log_offset
+            if self.poll(job) is not None:
+                return job.exit_code
+            interval = POLL_MIN_SEC if job.log_offset != before else min(POLL_MAX_SEC, interval * 1.5)
+            time.sleep(interval)
+
+    def forget(self, job_id):
+        """Remove the remote job directory so the id can be launched again."""
+        self._exec(f"rm -rf {_quote(f'{REMOTE_JOB_ROOT}/{job_id}')}")
+        with self._lock:
+            self._state.pop(job_id, None)
+
+    def run(self, job_id, command, cpus=1, mem_gb=1):
+        """Launch (or reattach), stream logs, and return the exit code, holding slots meanwhile."""
+        start = time.time()
+        self.slots.acquire(cpus, mem_gb)
+        if current_span():
+            # time queued for CPU/RAM slots on the VM, not spent computing
+            current_span().add_wait(time.time() - start)
+        try:
+            job = self.launch(job_id, command)
+            return self.wait(job)
+        finally:
+            self.slots.release(cpus, mem_gb)
@@ -1,6 +1,7 @@
 from __future__ import print_function
 
 import os.path
+import sys
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -8,6 +9,9 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+# run from inside drive/: the library modules import tracing.py, which sits next to ../main.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from folder import *
 
 # If modifying these scopes, delete the file token.json.
@@ -0,0 +1,207 @@
+import json
+import time
+import queue
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from google.auth.transport.requests import AuthorizedSession
+
+try:
+    from .client import get_client
+    from .sshpool import get_pool, TRANSFER_STREAMS, PARALLEL_MIN_MB
+except ImportError:  # run from inside drive/ (drive/main.py)
+    from client import get_client
+    from sshpool import get_pool, TRANSFER_STREAMS, PARALLEL_MIN_MB
+from tracing import current_span
+
+DRIVE_MEDIA_URL = 'https://www.googleapis.com/drive/v3/files/{file_id}?alt=media'
+DRIVE_UPLOAD_URL = 'https://www.googleapis.com/upload/drive/v3/files?uploadType=resumable&fields=id,md5Checksum,size'
+PIECE_SIZE = 1024 * 1024             # Drive -> SFTP: bytes per streamed piece
+UPLOAD_CHUNK = 16 * 1024 * 1024      # SFTP -> Drive: resumable chunk, a multiple of 256 KiB
+UPLOAD_QUEUE_CHUNKS = 4              # read-ahead; memory is about (this + 1) * UPLOAD_CHUNK
+ATTEMPTS = 5
+
+
+def _quote(path):
+    return "'" + path.replace("'", "'\\''") + "'"
+
+
+def _remote_md5(host, username, password, port, remote_path):
+    status, out, _ = get_pool().exec(host, username, password, f"md5sum -- {_quote(remote_path)}", port)
+    return out[0].split()[0] if status == 0 and out else None
+
+
+def relay_drive_to_sftp(creds, file_id, remote_path, host, username, password, port=22,
+                        streams=TRANSFER_STREAMS, parallel_min_mb=PARALLEL_MIN_MB):
+    """Copy a Drive file straight into a file on the SFTP host, never touching local disk.
+
+    Each byte range is read from Drive with a Range GET and written as it
+    arrives into its own pipelined SFTP channel at the same offset, so the
+    download and the push overlap. Only a few 1 MiB pieces per stream are
+    held in memory. The result is checked by running md5sum on the host
+    and comparing it with Drive's md5Checksum.
+    """
+    client = get_client(creds)
+    meta = client.execute(client.service.files().get(fileId=file_id, fields='id, name, size, md5Checksum'))
+    size = int(meta['size'])
+    url = DRIVE_MEDIA_URL.format(file_id=file_id)
+    pool = get_pool()
+
+    sftp = pool.sftp(host, username, password, port)
+    try:
+        with sftp.open(remote_path, 'wb') as f:
+            f.truncate(size)
+    finally:
+        sftp.close()
+
+    n = streams if size >= parallel_min_mb * 1024 * 1024 else 1
+    part = max(1, -(-size // n))
+    local = threading.local()
+    # range copies run on pool threads, which have no current span of their own
+    span = current_span()
+
+    def copy_range(offset, length):
+        if not hasattr(local, 'session'):
+            local.session = AuthorizedSession(creds)
+        end = offset + length - 1
+        for attempt in range(1, ATTEMPTS + 1):
+            ch = None
+            try:
+                ch = pool.sftp(host, username, password, port)
+                with local.session.get(url, headers={'Range': f'bytes={offset}-{end}'}, stream=True, timeout=300) as r, \
+                        ch.open(remote_path, 'r+b') as dst:
+                    r.raise_for_status()
+                    if r.status_code != 206:
+                        # a full-file answer written at `offset` would overwrite the neighbouring ranges
+                        raise IOError(f"server ignored Range header (HTTP {r.status_code})")
+                    dst.set_pipelined(True)
+                    dst.seek(offset)
+                    written = 0
+                    for piece in r.iter_content(chunk_size=PIECE_SIZE):
+                        dst.write(piece)
+                        written += len(piece)
+                    if written != length:
+                        raise IOError(f"short read at {offset}: {written} of {length} bytes")
+                return
+            except Exception as e:
+                if attempt == ATTEMPTS:
+                    raise
+                print(f"Retry relay range {offset}-{end} ({attempt}/{ATTEMPTS}): {e}")
+                if span:
+                    span.retry()
+                time.sleep(min(60, 2 ** attempt))
+            finally:
+                if ch:
+                    ch.close()
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=n) as executor:
+        for future in [executor.submit(copy_range, off, min(part, size - off)) for off in range(0, size, part)]:
+            future.result()
+
+    remote_md5 = _remote_md5(host, username, password, port, remote_path)
+    if meta.get('md5Checksum') and remote_md5 and remote_md5 != meta['md5Checksum']:
+        raise IOError(f"MD5 mismatch relaying {meta['name']}: drive {meta['md5Checksum']}, remote {remote_md5}")
+    print(f"Relayed {meta['name']} Drive -> {host}:{remote_path} "
+          f"({size / 1024 / 1024 / max(time.time() - start, 1e-9):.1f} MB/s)")
+    return meta
+
+
+def relay_sftp_to_drive(creds, remote_path, folder_id, host, username, password, port=22, name=None):
+    """Upload a file on the SFTP host to Drive through a resumable session, without local staging.
+
+    A reader thread pulls UPLOAD_CHUNK blocks over SFTP into a small bounded
+    queue while the main thread PUTs the previous block to Drive, so both
+    links stay busy. The MD5 is computed in flight and compared with the
+    md5Checksum Drive reports for the finished file.
+    """
+    pool = get_pool()
+    sftp = pool.sftp(host, username, password, port)
+    size = sftp.stat(remote_path).st_size
+    name = name or remote_path.rsplit('/', 1)[-1]
+
+    blocks = queue.Queue(maxsize=UPLOAD_QUEUE_CHUNKS)
+    failure = []
+
+    def reader():
+        try:
+            with sftp.open(remote_path, 'rb') as src:
+                for offset in range(0, size, UPLOAD_CHUNK):
+                    count = min(UPLOAD_CHUNK, size - offset)
+                    chunks = [(o, min(32768, offset + count - o)) for o in range(offset, offset + count, 32768)]
+                    blocks.put(b''.join(src.readv(chunks)))
+        except Exception as e:
+            failure.append(e)
+        finally:
+            blocks.put(None)
+            sftp.close()
+
+    session = AuthorizedSession(creds)
+    body = {'name': name, 'parents': [folder_id] if folder_id else None}
+    r = session.post(DRIVE_UPLOAD_URL, data=json.dumps(body),
+                     headers={'Content-Type': 'application/json; charset=UTF-8', 'X-Upload-Content-Length': str(size)})
+    r.raise_for_status()
+    session_url = r.headers['Location']
+
+    threading.Thread(target=reader, name=f"relay-read-{name}", daemon=True).start()
+    md5 = hashlib.md5()
+    offset = 0
+    start = time.time()
+    result = None
+    if size == 0:
+        result = session.put(session_url, headers={'Content-Range': 'bytes */0'}).json()
+    try:
+        while True:
+            block = blocks.get()
+            if block is None:
+                break
+            md5.update(block)
+            sent = 0
+            for attempt in range(1, ATTEMPTS + 1):
+                last = offset + len(block) - 1
+                try:
+                    r = session.put(session_url, data=block[sent:],
+                                    headers={'Content-Range': f'bytes {offset + sent}-{last}/{size}'}, timeout=300)
+                except Exception as e:
+                    r, error = None, e
+                if r is not None and r.status_code in (200, 201):
+                    result = r.json()
+                    break
+                if r is not None and r.status_code == 308:
+                    committed = int(r.headers['Range'].rsplit('-', 1)[1]) + 1 if 'Range' in r.headers else 0
+                    if committed > last:
+                        break
+                    sent = committed - offset
+                    continue
+                if r is not None and r.status_code not in (429, 500, 502, 503, 504):
+                    r.raise_for_status()
+                if attempt == ATTEMPTS:
+                    raise error if r is None else IOError(f"upload of {name} failed: HTTP {r.status_code}")
+                if current_span():
+                    current_span().retry()
+                time.sleep(min(60, 2 ** attempt))
+                # ask Drive how much of this block it actually kept before resending
+                q = session.put(session_url, headers={'Content-Range': f'bytes */{size}'})
+                if q.status_code in (200, 201):
+                    result = q.json()
+                    break
+                committed = int(q.headers['Range'].rsplit('-', 1)[1]) + 1 if 'Range' in q.headers else 0
+                sent = max(0, committed - offset)
+            else:
+                raise IOError(f"upload of {name} stalled at byte {offset + sent}")
+            offset += len(block)
+    except BaseException:
+        # let the reader run to completion so its SFTP channel is closed
+        threading.Thread(target=lambda: list(iter(blocks.get, None)), daemon=True).start()
+        raise
+
+    if failure:
+        raise failure[0]
+    if result is None:
+        raise IOError(f"upload of {name} ended without a file resource")
+    if result.get('md5Checksum') and result['md5Checksum'] != md5.hexdigest():
+        raise IOError(f"MD5 mismatch uploading {name}: drive {result['md5Checksum']}, source {md5.hexdigest()}")
+    print(f"Relayed {host}:{remote_path} -> Drive file ID {result['id']} "
+          f"({size / 1024 / 1024 / max(time.time() - start, 1e-9):.1f} MB/s)")
+    return result
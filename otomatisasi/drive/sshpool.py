@@ -0,0 +1,208 @@
+import os
+import time
+import socket
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import paramiko
+
+WINDOW_SIZE = 64 * 1024 * 1024      # per-channel flow-control window (paramiko default is 2 MiB)
+MAX_PACKET_SIZE = 256 * 1024
+KEEPALIVE_SEC = 30
+CONNECT_TIMEOUT_SEC = 30
+PARALLEL_MIN_MB = 64                # files at least this big are split across channels
+TRANSFER_STREAMS = 4
+BLOCK_SIZE = 8 * 1024 * 1024        # bounds memory per stream
+TRANSFER_ATTEMPTS = 3
+
+
+class SSHPool:
+    """One authenticated SSH transport per (host, port, username), reused across calls.
+
+    Handshakes and auth happen once; later calls only open a cheap channel
+    on the live transport. Transports send keepalives and are rebuilt
+    transparently if the peer drops them.
+    """
+
+    def __init__(self):
+        self._transports = {}
+        self._lock = threading.Lock()
+
+    def transport(self, host, username, password, port=22):
+        key = (host, port, username)
+        with self._lock:
+            t = self._transports.get(key)
+            if t is not None and t.is_active():
+                return t
+            if t is not None:
+                t.close()
+            sock = socket.create_connection((host, port), timeout=CONNECT_TIMEOUT_SEC)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            t = paramiko.Transport(sock, default_window_size=WINDOW_SIZE, default_max_packet_size=MAX_PACKET_SIZE)
+            t.set_keepalive(KEEPALIVE_SEC)
+            t.connect(username=username, password=password)
+            self._transports[key] = t
+            return t
+
+    def sftp(self, host, username, password, port=22):
+        """New SFTP channel on the pooled transport; close it when done."""
+        for attempt in (1, 2):
+            t = self.transport(host, username, password, port)
+            try:
+                return paramiko.SFTPClient.from_transport(t, window_size=WINDOW_SIZE, max_packet_size=MAX_PACKET_SIZE)
+            except (paramiko.SSHException, EOFError, OSError):
+                # other threads' channels share this transport: a dead one is rebuilt by
+                # transport() on the next pass, a live one is left alone and the open retried
+                if attempt == 2:
+                    raise
+
+    def exec(self, host, username, password, command, port=22, timeout=None):
+        """Run `command`; returns (exit_status, stdout_lines, stderr_lines)."""
+        t = self.transport(host, username, password, port)
+        chan = t.open_session(window_size=WINDOW_SIZE, max_packet_size=MAX_PACKET_SIZE)
+        try:
+            if timeout:
+                chan.settimeout(timeout)
+            chan.exec_command(command)
+            stdout = chan.makefile('rb').read().decode(errors='replace').splitlines()
+            stderr = chan.makefile_stderr('rb').read().decode(errors='replace').splitlines()
+            return chan.recv_exit_status(), stdout, stderr
+        finally:
+            chan.close()
+
+    def close(self):
+        with self._lock:
+            for t in self._transports.values():
+                t.close()
+            self._transports.clear()
+
+
+_pool = SSHPool()
+
+
+def get_pool():
+    return _pool
+
+
+def _ranges(size, streams):
+    part = max(1, -(-size // streams))
+    return [(off, min(part, size - off)) for off in range(0, size, part)]
+
+
+def _retry(fn, label):
+    for attempt in range(1, TRANSFER_ATTEMPTS + 1):
+        try:
+            return fn()
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            if attempt == TRANSFER_ATTEMPTS:
+                raise
+            print(f"Retry {label} ({attempt}/{TRANSFER_ATTEMPTS}): {e}")
+            time.sleep(2 ** attempt)
+
+
+def put_file(host, username, password, local_path, remote_path, port=22,
+             streams=TRANSFER_STREAMS, parallel_min_mb=PARALLEL_MIN_MB, verify=True):
+    """Upload `local_path`, splitting large files into ranges sent over parallel SFTP channels."""
+    size = os.path.getsize(local_path)
+    n = streams if size >= parallel_min_mb * 1024 * 1024 else 1
+
+    sftp = _pool.sftp(host, username, password, port)
+    try:
+        with sftp.open(remote_path, 'wb') as f:
+            f.truncate(size)
+    finally:
+        sftp.close()
+
+    def send(offset, length):
+        def attempt():
+            ch = _pool.sftp(host, username, password, port)
+            try:
+                with open(local_path, 'rb') as src, ch.open(remote_path, 'r+b') as dst:
+                    dst.set_pipelined(True)
+                    src.seek(offset)
+                    dst.seek(offset)
+                    left = length
+                    while left:
+                        block = src.read(min(BLOCK_SIZE, left))
+                        if not block:
+                            raise EOFError(f"{local_path} shrank during upload")
+                        dst.write(block)
+                        left -= len(block)
+            finally:
+                ch.close()
+        _retry(attempt, f"put {remote_path} @{offset}")
+
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        for future in [pool.submit(send, off, length) for off, length in _ranges(size, n)]:
+            future.result()
+
+    if verify:
+        _verify(host, username, password, port, local_path, remote_path, size)
+
+
+def get_file(host, username, password, remote_path, local_path, port=22,
+             streams=TRANSFER_STREAMS, parallel_min_mb=PARALLEL_MIN_MB, verify=True):
+    """Download `remote_path` with pipelined range reads over parallel SFTP channels."""
+    sftp = _pool.sftp(host, username, password, port)
+    try:
+        size = sftp.stat(remote_path).st_size
+    finally:
+        sftp.close()
+    n = streams if size >= parallel_min_mb * 1024 * 1024 else 1
+
+    os.makedirs(os.path.dirname(local_path) or '.', exist_ok=True)
+    with open(local_path, 'wb') as f:
+        f.truncate(size)
+
+    def fetch(offset, length):
+        def attempt():
+            ch = _pool.sftp(host, username, password, port)
+            try:
+                with ch.open(remote_path, 'rb') as src, open(local_path, 'r+b') as dst:
+                    dst.seek(offset)
+                    end = offset + length
+                    for start in range(offset, end, BLOCK_SIZE):
+                        # readv pipelines many 32 KiB SFTP reads instead of one round-trip each
+                        count = min(BLOCK_SIZE, end - start)
+                        chunks = [(o, min(32768, start + count - o)) for o in range(start, start + count, 32768)]
+                        for data in src.readv(chunks):
+                            dst.write(data)
+            finally:
+                ch.close()
+        _retry(attempt, f"get {remote_path} @{offset}")
+
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        for future in [pool.submit(fetch, off, length) for off, length in _ranges(size, n)]:
+            future.result()
+
+    if verify:
+        _verify(host, username, password, port, local_path, remote_path, size)
+
+
+def _file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def _verify(host, username, password, port, local_path, remote_path, size):
+    """Size check over SFTP, then md5sum on the far side against the local file."""
+    sftp = _pool.sftp(host, username, password, port)
+    try:
+        remote_size = sftp.stat(remote_path).st_size
+    finally:
+        sftp.close()
+    if remote_size != size or os.path.getsize(local_path) != size:
+        raise IOError(f"Size mismatch for {remote_path}: local {os.path.getsize(local_path)}, remote {remote_size}")
+    quoted = "'" + remote_path.replace("'", "'\\''") + "'"
+    status, out, err = _pool.exec(host, username, password, f"md5sum -- {quoted}", port)
+    if status != 0 or not out:
+        print(f"Skipping checksum for {remote_path}: md5sum unavailable ({' '.join(err)})")
+        return
+    remote_md5 = out[0].split()[0]
+    local_md5 = _file_md5(local_path)
+    if remote_md5 != local_md5:
+        raise IOError(f"MD5 mismatch for {remote_path}: local {local_md5}, remote {remote_md5}")
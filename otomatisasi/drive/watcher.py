@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import threading
+
+try:
+    from .client import get_client
+except ImportError:  # run from inside drive/ (drive/main.py)
+    from client import get_client
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+CHANGE_FIELDS = ('nextPageToken, newStartPageToken, changes(fileId, removed, '
+                 'file(id, name, mimeType, parents, trashed, md5Checksum, modifiedTime))')
+
+
+class DriveWatcher:
+    """Yield files that appear or change in the subfolders of a Drive folder.
+
+    Mirrors what start_pipeline used to find by relisting: files that sit
+    directly inside a subfolder of `root_id`. Instead of relisting, the
+    watcher reads the Drive Changes API from a saved page token. The
+    subfolder tree and the files already handed out are kept in
+    `state_path`, so a restart continues where the last run stopped.
+
+    The state is saved only after the consumer has finished with every
+    file from a poll. A crash while a file is being processed replays
+    that poll, so each file is delivered at least once.
+
+    With `watch(auto_ack=False)` a file counts as handled only once
+    `ack(file)` is called, which may happen on another thread later.
+    Files handed out but not yet acked are saved as pending and are
+    yielded again after a restart.
+    """
+
+    def __init__(self, creds, root_id, state_path='drive_watch_state.json',
+                 min_interval=2.0, max_interval=60.0, backoff=1.5):
+        self.client = get_client(creds)
+        self.root_id = root_id
+        self.state_path = state_path
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.page_token = None
+        self.folders = {}   # subfolder id -> name
+        self._committed_folders = {}  # tree as of page_token, what gets saved
+        self.seen = {}      # file id -> md5Checksum or modifiedTime when last emitted
+        self.pending = {}   # file id -> (folder, file) handed out but not acked yet
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.state_path):
+            return
+        with open(self.state_path) as f:
+            state = json.load(f)
+        if state.get('root_id') != self.root_id:
+            return
+        self.page_token = state.get('page_token')
+        self.folders = state.get('folders', {})
+        self._committed_folders = dict(self.folders)
+        self.seen = state.get('seen', {})
+        self.pending = {fid: tuple(event) for fid, event in state.get('pending', {}).items()}
+
+    def _save(self):
+        with self._lock:
+            tmp = self.state_path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'root_id': self.root_id, 'page_token': self.page_token,
+                           'folders': self._committed_folders, 'seen': dict(self.seen),
+                           'pending': dict(self.pending)}, f)
+            os.replace(tmp, self.state_path)
+
+    def ack(self, file):
+        """Mark `file` as fully handled (only needed with auto_ack=False)."""
+        with self._lock:
+            self.pending.pop(file['id'], None)
+            self.seen[file['id']] = self._version(file)
+        self._save()
+
+    @staticmethod
+    def _version(file):
+        return file.get('md5Checksum') or file.get('modifiedTime') or ''
+
+    def _fresh(self, file):
+        """True if `file` was never emitted or its content changed since."""
+        version = self._version(file)
+        queued = self.pending.get(file['id'])
+        if queued is not None and self._version(queued[1]) == version:
+            return False
+        return self.seen.get(file['id']) != version
+
+    def _crawl(self, folder_ids):
+        """Full listing of the given subfolders; used at bootstrap and when a folder moves in."""
+        listing = self.client.list_children(
+            folder_ids, query=f"mimeType!='{FOLDER_MIME}'",
+            fields='id, name, parents, md5Checksum, modifiedTime')
+        events = []
+        for folder_id, files in listing.items():
+            for file in files:
+                if self._fresh(file):
+                    events.append(({'id': folder_id, 'name': self.folders[folder_id]}, file))
+        return events
+
+    def bootstrap(self):
+        """Take the change token first, then list, so nothing created in between is lost."""
+        service = self.client.service
+        token = self.client.execute(service.changes().getStartPageToken())['startPageToken']
+        subfolders = self.client.list_children([self.root_id], query=f"mimeType='{FOLDER_MIME}'")[self.root_id]
+        self.folders = {f['id']: f['name'] for f in subfolders}
+        events = self._crawl(list(self.folders))
+        return token, events
+
+    def poll(self):
+        """Read all pending changes; returns (next_page_token, [(folder, file), ...])."""
+        changes = self.client.service.changes()
+        token = self.page_token
+        events, moved_in = {}, []
+        while True:
+            response = self.client.execute(changes.list(
+                pageToken=token, fields=CHANGE_FIELDS, pageSize=1000,
+                includeRemoved=True, spaces='drive'))
+            for change in response.get('changes', []):
+                file = change.get('file') or {}
+                gone = change.get('removed') or file.get('trashed')
+                parents = file.get('parents', [])
+                if file.get('mimeType') == FOLDER_MIME:
+                    inside = self.root_id in parents
+                    if gone or not inside:
+                        self.folders.pop(change['fileId'], None)
+                    else:
+                        if change['fileId'] not in self.folders:
+                            moved_in.append(change['fileId'])
+                        self.folders[change['fileId']] = file['name']
+                    continue
+                events.pop(change['fileId'], None)
+                parent = None if gone else next((p for p in parents if p in self.folders), None)
+                if parent is None:
+                    # deleted or moved out (e.g. to the done folder): forget it
+                    with self._lock:
+                        self.seen.pop(change['fileId'], None)
+                elif self._fresh(file):
+                    events[change['fileId']] = ({'id': parent, 'name': self.folders[parent]}, file)
+            if 'newStartPageToken' in response:
+                token = response['newStartPageToken']
+                break
+            token = response['nextPageToken']
+
+        # Files inside a folder that was moved under the root produce no change of their own
+        moved_in = [fid for fid in moved_in if fid in self.folders]
+        if moved_in:
+            for folder, file in self._crawl(moved_in):
+                events.setdefault(file['id'], (folder, file))
+        return token, list(events.values())
+
+    def watch(self, auto_ack=True):
+        """Generator of (folder, file) pairs, polling with an adaptive interval.
+
+        The interval drops to `min_interval` after any activity and grows by
+        `backoff` per idle poll up to `max_interval`.
+        """
+        replay = list(self.pending.values())
+        if self.page_token is None:
+            token, events = self.bootstrap()
+        else:
+            token, events = self.poll()
+        events = replay + events
+        interval = self.min_interval
+        while True:
+            for folder, file in events:
+                with self._lock:
+                    self.pending[file['id']] = (folder, file)
+                yield folder, file
+                if auto_ack:
+                    self.ack(file)
+            self.page_token = token
+            self._committed_folders = dict(self.folders)
+            self._save()
+
+            interval = self.min_interval if events else min(self.max_interval, interval * self.backoff)
+            time.sleep(interval)
+            token, events = self.poll()
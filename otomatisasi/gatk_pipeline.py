@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""The runing_benchmark_score.ipynb variant-calling steps as a DAG.
+
+    bwa index / CreateSequenceDictionary / samtools faidx
+    bwa mem -> SortSam -> MarkDuplicates -> AddOrReplaceReadGroups
+    per shard: HaplotypeCaller -> bcftools index -> [annotate --rename-chrs] -> annotate -c ID -> filter
+    gather:    <Sample>.vcf.gz, <Sample>_annotated.vcf.gz, <Sample>_filtered.vcf
+
+Shards are contiguous runs of reference contigs (from the .fai, or
+--intervals), balanced by length. Concatenating them in shard order
+therefore stays coordinate-sorted. Steps whose outputs are newer than
+their inputs are skipped, so a rerun picks up where the last one failed.
+
+    python3 gatk_pipeline.py --reference ref.fa.gz --fastq SRR1 --sample S1 --vcf-ref dbsnp --threads 16
+"""
+import os
+import sys
+import argparse
+
+from dag import DagRunner, Step, scatter, print_report
+
+
+def mem_total_gb():
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) // (1024 * 1024)
+    except OSError:
+        pass
+    return 0
+
+
+def dict_path(reference):
+    """Where GATK looks for the sequence dictionary of `reference`."""
+    base = reference[:-3] if reference.endswith('.gz') else reference
+    for ext in ('.fasta', '.fa', '.fna'):
+        if base.endswith(ext):
+            return base[:-len(ext)] + '.dict'
+    return base + '.dict'
+
+
+def read_fai(path):
+    with open(path) as f:
+        return [(cols[0], int(cols[1])) for cols in (line.split('\t') for line in f) if len(cols) > 1]
+
+
+def plan_shards(contigs, shards):
+    """Split ordered (name, length) contigs into at most `shards` contiguous groups of similar total length."""
+    total = sum(length for _, length in contigs)
+    target = total / max(1, shards)
+    groups, current, size = [], [], 0
+    for name, length in contigs:
+        current.append(name)
+        size += length
+        if size >= target and len(groups) < shards - 1:
+            groups.append(current)
+            current, size = [], 0
+    if current:
+        groups.append(current)
+    return groups
+
+
+def java(min_ram, max_ram):
+    return f'--java-options "-Xms{min_ram}g -Xmx{max_ram}g"'
+
+
+def prepare_steps(o):
+    ref = o.reference
+    return [
+        Step('bwa_index', f"{o.bwa} index {ref}", [ref], [ref + ext for ext in ('.amb', '.ann', '.bwt', '.pac', '.sa')],
+             cpus=1, mem_gb=5),
+        Step('sequence_dictionary', f"{o.gatk} {java(o.min_ram, o.max_ram)} CreateSequenceDictionary -R {ref} -O {dict_path(ref)}",
+             [ref], [dict_path(ref)], cpus=1, mem_gb=o.max_ram + 1),
+        Step('faidx', f"{o.samtools} faidx {ref}", [ref], [ref + '.fai'], cpus=1, mem_gb=1),
+    ]
+
+
+def calling_steps(o, shards):
+    ref, s, t = o.reference, o.sample, o.threads
+    gatk = f"{o.gatk} {java(o.min_ram, o.max_ram)}"
+    bam = lambda stage: os.path.join(o.workdir, f"{s}.{stage}.bam")
+    bai = lambda stage: os.path.join(o.workdir, f"{s}.{stage}.bai")
+    out = lambda name: os.path.join(o.workdir, name)
+    shard_dir = os.path.join(o.workdir, 'shards')
+    ref_files = [ref, ref + '.fai', dict_path(ref)] + [ref + ext for ext in ('.amb', '.ann', '.bwt', '.pac', '.sa')]
+    fq = [f"{o.fastq}_1.filt.fastq.gz", f"{o.fastq}_2.filt.fastq.gz"]
+    vcf_ref = f"{o.vcf_ref}.vcf.gz"
+
+    steps = [
+        Step('align', f"{o.bwa} mem -t {t} {ref} {fq[0]} {fq[1]} -o {out(s + '.bam')}",
+             ref_files + fq, [out(s + '.bam')], cpus=t, mem_gb=6),
+        Step('sort_sam', f"{gatk} SortSam -CREATE_INDEX true -I {out(s + '.bam')} -O {bam('sorted')} -SO coordinate",
+             [out(s + '.bam')], [bam('sorted'), bai('sorted')], cpus=1, mem_gb=o.max_ram + 1),
+        Step('mark_duplicates', f"{gatk} MarkDuplicates -CREATE_INDEX true -I {bam('sorted')} -O {bam('marked')} "
+                                f"-M {out(s + '_Matric.txt')} --REMOVE_SEQUENCING_DUPLICATES true",
+             [bam('sorted'), bai('sorted')], [bam('marked'), bai('marked'), out(s + '_Matric.txt')],
+             cpus=1, mem_gb=o.max_ram + 1),
+        Step('replace_read_groups', f"{gatk} AddOrReplaceReadGroups -CREATE_INDEX true -I {bam('marked')} -O {bam('replace')} "
+                                    f"-RGID 1 -RGPL ILLUMINA -RGLB lib1 -RGPU unit1 -RGSM {s}",
+             [bam('marked'), bai('marked')], [bam('replace'), bai('replace')], cpus=1, mem_gb=o.max_ram + 1),
+        Step('index_vcf_ref', f"{o.bcftools} index --force --output {vcf_ref}.csi {vcf_ref}",
+             [vcf_ref], [vcf_ref + '.csi'], cpus=1, mem_gb=1),
+    ]
+
+    labelled = [(f"{i:03d}", contigs) for i, contigs in enumerate(shards)]
+    shard = lambda label, suffix: os.path.join(shard_dir, f"{s}.{label}{suffix}")
+    hc_java = java(min(o.min_ram, o.hc_mem_gb), o.hc_mem_gb)
+
+    def interval_file(label, contigs):
+        path = shard(label, '.intervals')
+        os.makedirs(shard_dir, exist_ok=True)
+        # rewrite only on change, so an unchanged plan keeps the calls up to date
+        body = ''.join(c + '\n' for c in contigs)
+        if not os.path.exists(path) or open(path).read() != body:
+            with open(path, 'w') as f:
+                f.write(body)
+        return path
+
+    def call(label, contigs):
+        intervals = interval_file(label, contigs)
+        return Step(f'haplotype_caller_{label}',
+                    f"{o.gatk} {hc_java} HaplotypeCaller -R {ref} -I {bam('replace')} -L {intervals} "
+                    f"-O {shard(label, '.vcf.gz')} --native-pair-hmm-threads {o.hc_threads}",
+                    ref_files + [bam('replace'), bai('replace'), intervals],
+                    [shard(label, '.vcf.gz'), shard(label, '.vcf.gz.tbi')], cpus=o.hc_threads, mem_gb=o.hc_mem_gb + 1)
+
+    def annotate(label, _):
+        steps = []
+        current = shard(label, '.vcf.gz')
+        if o.chr_names:
+            steps.append(Step(f'rename_chrs_{label}',
+                              f"{o.bcftools} annotate --rename-chrs {o.chr_names} {current} -Oz -o {shard(label, '_rename.vcf.gz')} "
+                              f"&& {o.bcftools} index --force {shard(label, '_rename.vcf.gz')}",
+                              [current, o.chr_names], [shard(label, '_rename.vcf.gz'), shard(label, '_rename.vcf.gz.csi')]))
+            current = shard(label, '_rename.vcf.gz')
+        steps.append(Step(f'annotate_{label}',
+                          f"{o.bcftools} annotate -a {vcf_ref} -c ID -O z -o {shard(label, '_annotated.vcf.gz')} {current}",
+                          [current, vcf_ref, vcf_ref + '.csi'], [shard(label, '_annotated.vcf.gz')]))
+        steps.append(Step(f'filter_{label}',
+                          f"{o.bcftools} filter -e 'ID=\".\"' {shard(label, '_annotated.vcf.gz')} -Oz -o {shard(label, '_filtered.vcf.gz')}",
+                          [shard(label, '_annotated.vcf.gz')], [shard(label, '_filtered.vcf.gz')]))
+        return steps
+
+    calls = scatter(labelled, call)
+    annotations = [step for steps in scatter(labelled, annotate) for step in steps]
+
+    def gather(name, suffix, output, fmt):
+        parts = [shard(label, suffix) for label, _ in labelled]
+        return Step(name, f"{o.bcftools} concat --threads {t} {' '.join(parts)} -O{fmt} -o {output}",
+                    parts, [output], cpus=t, mem_gb=1)
+
+    gathers = [
+        gather('gather_vcf', '.vcf.gz', out(s + '.vcf.gz'), 'z'),
+        Step('index_vcf', f"{o.bcftools} index --force --output {out(s + '.vcf.gz.csi')} {out(s + '.vcf.gz')}",
+             [out(s + '.vcf.gz')], [out(s + '.vcf.gz.csi')]),
+        gather('gather_annotated', '_annotated.vcf.gz', out(s + '_annotated.vcf.gz'), 'z'),
+        gather('gather_filtered', '_filtered.vcf.gz', out(s + '_filtered.vcf'), 'v'),
+    ]
+    return steps + calls + annotations + gathers
+
+
+def run(o):
+    """Prepare the reference, plan shards from its .fai, then align, call, annotate and gather."""
+    cpus, mem = o.cpus or os.cpu_count() or 1, o.mem_gb or mem_total_gb() or None
+    log_dir = os.path.join(o.workdir, 'dag_logs')
+    prepare = DagRunner(prepare_steps(o), cpus, mem, log_dir, o.dry_run)
+    prepare.run()
+    if not prepare.ok:
+        print_report(prepare.rows(), o.report)
+        return False
+    if o.intervals:
+        contigs = [(c, 1) for c in o.intervals.split(',')]
+    elif os.path.exists(o.reference + '.fai'):
+        contigs = read_fai(o.reference + '.fai')
+    else:  # only in --dry-run, before faidx has ever run
+        contigs = [('<all>', 1)]
+    shards = plan_shards(contigs, o.shards or max(1, cpus // o.hc_threads))
+    calling = DagRunner(calling_steps(o, shards), cpus, mem, log_dir, o.dry_run)
+    calling.run()
+    print_report(prepare.rows() + calling.rows(), o.report)
+    return calling.ok
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="GATK germline calling from the benchmark notebook, as a parallel DAG")
+    ap.add_argument('--reference', required=True, help="Reference FASTA (as in the notebook, including .gz)")
+    ap.add_argument('--fastq', required=True, help="FASTQ prefix; reads <prefix>_1.filt.fastq.gz and _2.filt.fastq.gz")
+    ap.add_argument('--sample', required=True, help="Output name of the sample")
+    ap.add_argument('--vcf-ref', required=True, help="Annotation VCF without .vcf.gz")
+    ap.add_argument('--min-ram', type=int, default=4, help="Java -Xms in GB (default 4)")
+    ap.add_argument('--max-ram', type=int, default=8, help="Java -Xmx in GB for the whole-BAM steps (default 8)")
+    ap.add_argument('--threads', type=int, default=os.cpu_count() or 1, help="Threads for bwa mem and gathers (default: CPU count)")
+    ap.add_argument('--shards', type=int, default=0, help="HaplotypeCaller/bcftools shards (default: --cpus / --hc-threads)")
+    ap.add_argument('--intervals', default=None, help="Comma-separated contigs to call, instead of every contig in the .fai")
+    ap.add_argument('--hc-threads', type=int, default=2, help="--native-pair-hmm-threads per shard (default 2)")
+    ap.add_argument('--hc-mem-gb', type=int, default=4, help="Java -Xmx per HaplotypeCaller shard (default 4)")
+    ap.add_argument('--chr-names', default='chr_names.txt' if os.path.exists('chr_names.txt') else None,
+                    help="bcftools --rename-chrs map (default chr_names.txt if present, else no renaming)")
+    ap.add_argument('--workdir', default='.', help="Directory for BAM/VCF outputs, shards and logs (default .)")
+    ap.add_argument('--cpus', type=int, default=0, help="CPU budget for concurrent steps (default: CPU count)")
+    ap.add_argument('--mem-gb', type=int, default=0, help="RAM budget in GB for concurrent steps (default: MemTotal)")
+    ap.add_argument('--report', default=None, help="Also write the per-step timing report as JSON here")
+    ap.add_argument('--dry-run', action='store_true', help="Print the commands that would run")
+    ap.add_argument('--gatk', default='gatk')
+    ap.add_argument('--bwa', default='bwa')
+    ap.add_argument('--samtools', default='samtools')
+    ap.add_argument('--bcftools', default='bcftools')
+    return ap.parse_args(argv)
+
+
+def run_pipeline(Reference, fastq, Sample, vcf_ref, min_ram, max_ram, thread, *extra):
+    """Notebook entry point, taking the notebook's input() values."""
+    o = parse_args(['--reference', Reference, '--fastq', fastq, '--sample', Sample, '--vcf-ref', vcf_ref,
+                    '--min-ram', str(min_ram), '--max-ram', str(max_ram), '--threads', str(thread), *extra])
+    return run(o)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if run(parse_args()) else 1)
@@ -9,22 +9,26 @@ from gcp.restart_vms import *
 
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from google.cloud import compute_v1
 
+from tracing import span
+
 # Create Service account , download keys and add your key file path below 
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "omics-training-12e59ce0a89f.json"
 
 # I am creating function to create VM instance and this function is being called from main.py
 def create_gce_instance(vm_name, zone, machine_type, vm_image):
-    vm_instance_list = get_vm_instance_list(project, zone)
-    vm_exists = False
-    for instance in vm_instance_list.get('items', []):
-        if instance['name'] == vm_name:
-            vm_exists = True
-            break
+    try:
+        get_instance_cached(project, zone, vm_name)
+        vm_exists = True
+    except HttpError as e:
+        if e.resp.status != 404:
+            raise
+        vm_exists = False
 
     if not vm_exists:
-        compute_service = build('compute', 'v1')
+        compute_service = get_compute_service()
         config = {
             'name': vm_name,
             'machineType': 'zones/{}/machineTypes/{}'.format(zone, machine_type),
@@ -52,27 +56,42 @@ def create_gce_instance(vm_name, zone, machine_type, vm_image):
     else:
         print(f'VM instance {vm_name} already exist')
 
-def update_instance_machine_type(project_id, zone, instance_name, machine_type):
-    # Get the current instance configuration
-    compute_client = build('compute', 'v1')
-    stop_instance(project_id,zone,instance_name)
-    time.sleep(5)
-            
-    # Get the current instance configuration
-    vm_instance_list = get_vm_instance_list(project_id, zone)
-    for instance in vm_instance_list.get('items', []):
-        if instance['name'] == instance_name:
-            #print(instance)
-            # Update the machine type
-        
-            instance['machineType'] = f"zones/{zone}/machineTypes/{machine_type}"
-            # Apply the update to the instance
-            operation = compute_client.instances().update(project=project_id, zone=zone, instance=instance_name, body=instance)
-            # Wait for the operation to complete
-            operation.execute()
-            time.sleep(10)
-            print(f"Instance {instance_name} updated successfully to machine type {machine_type}.")
-            time.sleep(5)
-            start_instance(project_id,zone,instance_name)
-            break
+def update_instance_machine_type(project_id, zone, instance_name, machine_type, ready_check=None):
+    # Spans for stop / set / start show which part of a resize is slow
+    with span('vm_resize', instance=instance_name, machine_type=machine_type) as resize:
+        # Direct get (cached for a few seconds) instead of listing every VM in the zone
+        instance = get_instance_cached(project_id, zone, instance_name)
+        if instance['machineType'].rsplit('/', 1)[-1] == machine_type:
+            print(f"Instance {instance_name} already has machine type {machine_type}.")
+            resize.set(unchanged=True)
+            # fresh status: a cached RUNNING may predate a stop from a resize that then failed
+            invalidate_instance(project_id, zone, instance_name)
+            if get_instance_cached(project_id, zone, instance_name)['status'] != 'RUNNING':
+                # e.g. an earlier resize stopped it and then failed: callers expect a reachable VM
+                with span('vm_start', instance=instance_name):
+                    start_instance(project_id,zone,instance_name,ready_check=ready_check)
+                invalidate_instance(project_id, zone, instance_name)
+            return
+
+        if instance['status'] not in ('TERMINATED', 'STOPPED'):
+            with span('vm_stop', instance=instance_name):
+                stop_instance(project_id,zone,instance_name)
+
+        # setMachineType only needs the new type, and .result() waits for the operation
+        with span('vm_set_machine_type', instance=instance_name, machine_type=machine_type):
+            operation = get_instances_client().set_machine_type(
+                project=project_id,
+                zone=zone,
+                instance=instance_name,
+                instances_set_machine_type_request_resource=compute_v1.InstancesSetMachineTypeRequest(
+                    machine_type=f"zones/{zone}/machineTypes/{machine_type}"
+                ),
+            )
+            operation.result(timeout=OPERATION_TIMEOUT_SEC)
+        invalidate_instance(project_id, zone, instance_name)
+        print(f"Instance {instance_name} updated successfully to machine type {machine_type}.")
 
+        # Returns once the guest answers on SSH (and ready_check passes), not after a fixed sleep
+        with span('vm_start', instance=instance_name):
+            start_instance(project_id,zone,instance_name,ready_check=ready_check)
+        invalidate_instance(project_id, zone, instance_name)
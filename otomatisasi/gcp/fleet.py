@@ -0,0 +1,237 @@
+import time
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from gcp.var import *
+
+FLEET_LABEL = 'oto-fleet'
+
+
+class GCEBackend:
+    """Creates and deletes worker VMs from a template dict shaped like `vm_configs` entries."""
+
+    def __init__(self, project_id=project, ready_check=None):
+        self.project_id = project_id
+        self.ready_check = ready_check
+
+    def create(self, name, template):
+        # GCE client imported here so the fleet runs against FakeComputeBackend without it
+        from google.cloud import compute_v1
+        from gcp.restart_vms import get_instances_client, wait_for_guest, OPERATION_TIMEOUT_SEC
+        zone = template['zone']
+        region = zone.rsplit('-', 1)[0]
+        instance = compute_v1.Instance(
+            name=name,
+            machine_type=f"zones/{zone}/machineTypes/{template['machine_type']}",
+            labels={FLEET_LABEL: template['name']},
+            disks=[compute_v1.AttachedDisk(
+                boot=True,
+                auto_delete=True,
+                initialize_params=compute_v1.AttachedDiskInitializeParams(
+                    source_image=template['vm_image'], disk_size_gb=template.get('disk_gb', 50)),
+            )],
+            network_interfaces=[compute_v1.NetworkInterface(
+                subnetwork=f"regions/{region}/subnetworks/{template['subnet_name']}",
+                access_configs=[compute_v1.AccessConfig(type_='ONE_TO_ONE_NAT', name='External NAT')],
+            )],
+        )
+        get_instances_client().insert(project=self.project_id, zone=zone, instance_resource=instance) \
+            .result(timeout=OPERATION_TIMEOUT_SEC)
+        ip = get_instances_client().get(project=self.project_id, zone=zone, instance=name).network_interfaces[0].network_i_p
+        wait_for_guest(ip, ready_check=self.ready_check)
+        return ip
+
+    def delete(self, name, template):
+        from gcp.restart_vms import get_instances_client, OPERATION_TIMEOUT_SEC
+        get_instances_client().delete(project=self.project_id, zone=template['zone'], instance=name) \
+            .result(timeout=OPERATION_TIMEOUT_SEC)
+
+    def list(self, template):
+        """Running workers of this template as (name, ip), to adopt after a restart."""
+        from gcp.restart_vms import get_instances_client
+        found = get_instances_client().list(project=self.project_id, zone=template['zone'],
+                                            filter=f'labels.{FLEET_LABEL} = "{template["name"]}"')
+        return [(i.name, i.network_interfaces[0].network_i_p) for i in found if i.status == 'RUNNING']
+
+
+class FakeComputeBackend:
+    """In-memory stand-in for GCE: boots take `boot_sec`, IPs are fake. For tests and dry runs."""
+
+    def __init__(self, boot_sec=0.0, delete_sec=0.0):
+        self.boot_sec = boot_sec
+        self.delete_sec = delete_sec
+        self.instances = {}
+        self.created = 0
+        self.deleted = 0
+        self._lock = threading.Lock()
+        self._ips = itertools.count(2)
+
+    def create(self, name, template):
+        time.sleep(self.boot_sec)
+        with self._lock:
+            ip = f"10.0.0.{next(self._ips)}"
+            self.instances[name] = {'template': template['name'], 'ip': ip}
+            self.created += 1
+        return ip
+
+    def delete(self, name, template):
+        time.sleep(self.delete_sec)
+        with self._lock:
+            self.instances.pop(name, None)
+            self.deleted += 1
+
+    def list(self, template):
+        with self._lock:
+            return [(n, i['ip']) for n, i in self.instances.items() if i['template'] == template['name']]
+
+
+class Worker:
+    def __init__(self, name, template, ip):
+        self.name = name
+        self.template = template
+        self.ip = ip
+        self.busy = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def host(self):
+        return self.ip
+
+    def __repr__(self):
+        return f"Worker({self.name}, {self.ip}, busy={self.busy})"
+
+
+class Fleet:
+    """Autoscaled pool of worker VMs driven by how many samples are waiting.
+
+    `acquire()` hands out a worker with a free job slot, blocking while
+    none is free. A scaler thread compares waiting samples with free
+    slots and VMs still booting, and creates workers from `template` up
+    to `max_workers`. A worker idle for `idle_sec` is deleted, down to
+    `min_workers`, so back-to-back samples reuse warm machines instead of
+    paying a create or resize each time. Workers left running by a
+    previous orchestrator run are adopted at start.
+    """
+
+    def __init__(self, backend, template, max_workers=4, min_workers=0, idle_sec=600,
+                 jobs_per_worker=1, tick_sec=2.0):
+        self.backend = backend
+        self.template = template
+        self.max_workers = max_workers
+        self.min_workers = min_workers
+        self.idle_sec = idle_sec
+        self.jobs_per_worker = jobs_per_worker
+        self.tick_sec = tick_sec
+        self.workers = {}
+        self.booting = 0
+        self.waiting = 0
+        self._names = itertools.count(1)
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='fleet')
+        self._thread = None
+
+    def start(self):
+        for name, ip in self.backend.list(self.template):
+            self.workers[name] = Worker(name, self.template, ip)
+            print(f"Fleet: adopted {name} ({ip})")
+        taken = {int(n.rsplit('-', 1)[1]) for n in self.workers if n.rsplit('-', 1)[1].isdigit()}
+        self._names = itertools.count(max(taken, default=0) + 1)
+        self._thread = threading.Thread(target=self._run, name='fleet-scaler', daemon=True)
+        self._thread.start()
+        return self
+
+    def _free_worker(self):
+        free = [w for w in self.workers.values() if w.busy < self.jobs_per_worker]
+        # least loaded first, then most recently used so the rest can go idle and be reclaimed
+        return min(free, key=lambda w: (w.busy, -w.last_used), default=None)
+
+    def acquire(self, timeout=None):
+        with self._cond:
+            self.waiting += 1
+            self._cond.notify_all()
+            try:
+                if not self._cond.wait_for(lambda: self._free_worker() is not None or self._stop.is_set(), timeout):
+                    raise TimeoutError("no worker became free")
+                if self._stop.is_set():
+                    raise RuntimeError("fleet is shutting down")
+                worker = self._free_worker()
+                worker.busy += 1
+                worker.last_used = time.monotonic()
+                return worker
+            finally:
+                self.waiting -= 1
+
+    def release(self, worker):
+        with self._cond:
+            worker.busy -= 1
+            worker.last_used = time.monotonic()
+            self._cond.notify_all()
+
+    def status(self):
+        with self._cond:
+            return {'workers': len(self.workers), 'busy': sum(1 for w in self.workers.values() if w.busy),
+                    'booting': self.booting, 'waiting': self.waiting}
+
+    def _create(self, name):
+        try:
+            ip = self.backend.create(name, self.template)
+            print(f"Fleet: created {name} ({ip})")
+            with self._cond:
+                self.workers[name] = Worker(name, self.template, ip)
+        except Exception as e:
+            print(f"Fleet: create {name} failed: {e}")
+        finally:
+            with self._cond:
+                self.booting -= 1
+                self._cond.notify_all()
+
+    def _delete(self, worker):
+        try:
+            self.backend.delete(worker.name, self.template)
+            print(f"Fleet: deleted idle {worker.name}")
+        except Exception as e:
+            print(f"Fleet: delete {worker.name} failed: {e}")
+
+    def scale_once(self):
+        """One scaling decision; the scaler thread calls this every tick."""
+        with self._cond:
+            free_slots = sum(self.jobs_per_worker - w.busy for w in self.workers.values())
+            incoming = self.booting * self.jobs_per_worker
+            room = self.max_workers - len(self.workers) - self.booting
+            shortfall = self.waiting - free_slots - incoming
+            want = min(room, -(-shortfall // self.jobs_per_worker)) if shortfall > 0 else 0
+            want = max(want, min(room, self.min_workers - len(self.workers) - self.booting))
+            names = [f"{self.template['name']}-{next(self._names)}" for _ in range(max(0, want))]
+            self.booting += len(names)
+
+            now = time.monotonic()
+            idle = sorted((w for w in self.workers.values() if w.busy == 0 and now - w.last_used >= self.idle_sec),
+                          key=lambda w: w.last_used)
+            surplus = len(self.workers) - self.min_workers
+            retire = idle[:max(0, surplus)] if self.waiting == 0 else []
+            for w in retire:
+                del self.workers[w.name]
+        for name in names:
+            self._pool.submit(self._create, name)
+        for w in retire:
+            self._pool.submit(self._delete, w)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.scale_once()
+            with self._cond:
+                self._cond.wait(self.tick_sec)
+
+    def shutdown(self, delete=False):
+        """Stop scaling; with delete=True also remove every worker VM."""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+            workers = list(self.workers.values()) if delete else []
+            if delete:
+                self.workers.clear()
+        for w in workers:
+            self._pool.submit(self._delete, w)
+        self._pool.shutdown(wait=True)
@@ -1,21 +1,51 @@
 from googleapiclient.discovery import build
 import os
+import time
+import threading
+from functools import lru_cache
 from gcp.var import *
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "omics-training-12e59ce0a89f.json"
 
-compute_service = build('compute', 'v1')
+INSTANCE_CACHE_TTL_SEC = 15
+
+# Built on first use instead of at import, so importing gcp.* stays cheap
+@lru_cache(maxsize=None)
+def get_compute_service():
+    return build('compute', 'v1', cache_discovery=False)
+
 #Fetch existing VPC List
 def get_vpc_list(project):
-    vpcs_request = compute_service.networks().list(project=project)
+    vpcs_request = get_compute_service().networks().list(project=project)
     vpcs_list = vpcs_request.execute()
     return vpcs_list
 
 #Fetch existing VM list
 def get_vm_instance_list(project,zone):
-    instance_request = compute_service.instances().list(project=project,zone=zone)
+    instance_request = get_compute_service().instances().list(project=project,zone=zone)
     instance_list = instance_request.execute()
     return instance_list
 
 #Fetch existing VM list
 def get_vm_instance(project,zone,instance_name):
-    return compute_service.instances().get(project=project,zone=zone, instance=instance_name)
\ No newline at end of file
+    return get_compute_service().instances().get(project=project,zone=zone, instance=instance_name)
+
+_instance_cache = {}
+_instance_cache_lock = threading.Lock()
+
+#Fetch one VM by name with a direct get, cached for a few seconds
+def get_instance_cached(project, zone, instance_name, ttl=INSTANCE_CACHE_TTL_SEC):
+    key = (project, zone, instance_name)
+    now = time.monotonic()
+    with _instance_cache_lock:
+        hit = _instance_cache.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+    instance = get_vm_instance(project, zone, instance_name).execute()
+    with _instance_cache_lock:
+        _instance_cache[key] = (now + ttl, instance)
+    return instance
+
+#Drop the cached VM after anything that changes it
+def invalidate_instance(project, zone, instance_name):
+    with _instance_cache_lock:
+        _instance_cache.pop((project, zone, instance_name), None)
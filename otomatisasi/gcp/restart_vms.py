@@ -1,31 +1,65 @@
 from google.cloud import compute_v1
+from functools import lru_cache
 import os
 import time
+import socket
 
 PROJECT_ID = 'omics-training'
 ZONE = 'asia-southeast2'
 
-compute_client = compute_v1.InstancesClient()
+OPERATION_TIMEOUT_SEC = 600
+READY_TIMEOUT_SEC = 300
+SSH_PORT = 22
 
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] =  "omics-training-12e59ce0a89f.json"
 
-def stop_instance(project_id,zone,instance_name):
-    stop_instance_request=  compute_client.stop(
+# Created on first use: the env var above is set before the client reads it
+@lru_cache(maxsize=None)
+def get_instances_client():
+    return compute_v1.InstancesClient()
+
+def stop_instance(project_id,zone,instance_name,timeout=OPERATION_TIMEOUT_SEC):
+    stop_instance_request=  get_instances_client().stop(
         project=project_id,
         zone=zone,
         instance=instance_name
     )
-    time.sleep(5)
-    stop_instance_request.result()
+    # Blocks until GCE reports the operation DONE (instance TERMINATED)
+    stop_instance_request.result(timeout=timeout)
     print(f'Stoped VM instance: {instance_name}')
 
-def start_instance(project_id,zone,instance_name):
-    start_instance_request = compute_client.start(
+def start_instance(project_id,zone,instance_name,timeout=OPERATION_TIMEOUT_SEC,
+                   wait_ready=True,ready_timeout=READY_TIMEOUT_SEC,ready_check=None):
+    start_instance_request = get_instances_client().start(
         project=project_id,
         zone=zone,
         instance=instance_name
     )
-    time.sleep(5)
-    start_instance_request.result()
+    start_instance_request.result(timeout=timeout)
     print(f'Start VM instance: {instance_name}')
-  
\ No newline at end of file
+    if wait_ready:
+        instance = get_instances_client().get(project=project_id, zone=zone, instance=instance_name)
+        wait_for_guest(instance.network_interfaces[0].network_i_p, timeout=ready_timeout, ready_check=ready_check)
+        print(f'VM instance {instance_name} is ready')
+
+def wait_for_guest(host, port=SSH_PORT, timeout=READY_TIMEOUT_SEC, ready_check=None):
+    """Poll until `host:port` accepts TCP and `ready_check()` (if given) returns truthy.
+
+    RUNNING only means the VM booted; sshd and the guest's services come up
+    later. Polls quickly at first and backs off to 5s.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.5
+    while True:
+        try:
+            with socket.create_connection((host, port), timeout=5):
+                pass
+            if ready_check is None or ready_check():
+                return
+        except Exception:
+            # connection refused/timeout, or the health check itself failed
+            pass
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f'{host}:{port} not ready after {timeout}s')
+        time.sleep(delay)
+        delay = min(5.0, delay * 2)
@@ -0,0 +1,110 @@
+"""Fleet scaling against FakeComputeBackend: scale-up, warm reuse, idle reclaim, adoption.
+
+Run from otomatisasi/: python -m unittest gcp.test_fleet
+"""
+import time
+import threading
+import unittest
+
+from gcp.fleet import Fleet, FakeComputeBackend
+
+TEMPLATE = {'name': 'oto-worker', 'zone': 'test-zone-a', 'machine_type': 'e2-highcpu-8'}
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached in time")
+        time.sleep(0.01)
+
+
+class FleetTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = FakeComputeBackend()
+        self.acquired = []
+        self.lock = threading.Lock()
+
+    def fleet(self, **kwargs):
+        # scale_once is driven by hand instead of by the scaler thread, so every decision is deterministic
+        fleet = Fleet(self.backend, TEMPLATE, **kwargs)
+        self.addCleanup(fleet.shutdown)
+        return fleet
+
+    def acquire_in_background(self, fleet, n):
+        def take():
+            worker = fleet.acquire(timeout=5)
+            with self.lock:
+                self.acquired.append(worker)
+        threads = [threading.Thread(target=take, daemon=True) for _ in range(n)]
+        for t in threads:
+            t.start()
+        wait_until(lambda: fleet.waiting == n)
+        return threads
+
+    def test_scales_up_to_max_and_reuses_warm_workers(self):
+        fleet = self.fleet(max_workers=2, jobs_per_worker=1, idle_sec=600)
+        threads = self.acquire_in_background(fleet, 3)
+
+        fleet.scale_once()
+        wait_until(lambda: len(self.acquired) == 2)
+        self.assertEqual(self.backend.created, 2)
+        self.assertEqual(fleet.waiting, 1)
+        self.assertEqual({w.name for w in self.acquired}, {'oto-worker-1', 'oto-worker-2'})
+
+        # at max_workers: the third sample waits for a slot instead of a new VM
+        fleet.scale_once()
+        self.assertEqual(fleet.booting, 0)
+        fleet.release(self.acquired[0])
+        for t in threads:
+            t.join(5)
+        self.assertEqual(len(self.acquired), 3)
+        self.assertIs(self.acquired[2], self.acquired[0])
+        self.assertEqual(self.backend.created, 2)
+
+    def test_packs_jobs_per_worker_before_creating_more(self):
+        fleet = self.fleet(max_workers=4, jobs_per_worker=2, idle_sec=600)
+        threads = self.acquire_in_background(fleet, 3)
+        fleet.scale_once()
+        for t in threads:
+            t.join(5)
+        self.assertEqual(self.backend.created, 2)
+        self.assertEqual(sorted(w.busy for w in fleet.workers.values()), [1, 2])
+
+    def test_reclaims_idle_workers_down_to_min(self):
+        fleet = self.fleet(max_workers=3, min_workers=1, jobs_per_worker=1, idle_sec=0.2)
+        threads = self.acquire_in_background(fleet, 3)
+        fleet.scale_once()
+        for t in threads:
+            t.join(5)
+        self.assertEqual(self.backend.created, 3)
+
+        fleet.release(self.acquired[0])
+        fleet.scale_once()
+        self.assertEqual(len(fleet.workers), 3, "a worker is kept until it has been idle for idle_sec")
+
+        for w in self.acquired[1:]:
+            fleet.release(w)
+        time.sleep(0.3)
+        fleet.scale_once()
+        wait_until(lambda: self.backend.deleted == 2)
+        self.assertEqual(len(fleet.workers), 1)
+        self.assertEqual(len(self.backend.instances), 1)
+
+    def test_adopts_running_workers_at_start(self):
+        self.backend.create('oto-worker-7', TEMPLATE)
+        self.backend.create('other-1', {'name': 'other'})
+        fleet = self.fleet(max_workers=2, jobs_per_worker=1, idle_sec=600, tick_sec=60).start()
+        self.assertEqual(list(fleet.workers), ['oto-worker-7'])
+
+        worker = fleet.acquire(timeout=5)
+        self.assertEqual(worker.name, 'oto-worker-7')
+        threads = self.acquire_in_background(fleet, 1)
+        fleet.scale_once()
+        for t in threads:
+            t.join(5)
+        self.assertEqual(self.acquired[0].name, 'oto-worker-8')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,22 +10,11 @@ vm_configs = [
     {'name': 'oto-instance', 'zone':'asia-southeast2-a','subnet_name':'asia-subnet','machine_type': 'e2-micro', 'vm_image': ubuntu_image}
 ]
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+# Worker fleet (main.USE_FLEET): VMs created from this template on demand.
+# The image must already contain sratoolkit, bwa, the reference and /home/<script>.sh,
+# and accept the same SSH login as the SFTP host.
+worker_image = ubuntu_image
+worker_template = {'name': 'oto-worker', 'zone': zone, 'subnet_name': 'asia-subnet', 'machine_type': 'e2-highcpu-8', 'vm_image': worker_image}
+fleet_max_workers = 4
+fleet_min_workers = 0
+fleet_idle_sec = 600
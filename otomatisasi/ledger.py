@@ -0,0 +1,117 @@
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+
+# Per-sample progress, in pipeline order
+STAGES = ['queued', 'downloaded', 'staged', 'aligned', 'uploaded', 'archived']
+
+
+def cache_key(input_md5, reference, script_version):
+    """Identity of an alignment result: same input bytes, reference and script -> same output."""
+    return hashlib.sha256(f"{input_md5}|{reference}|{script_version}".encode()).hexdigest()
+
+
+def script_version(path):
+    """Content hash of a pipeline script; editing the script invalidates cached results."""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+class Ledger:
+    """Local SQLite record of every sample's furthest completed stage, plus a result cache.
+
+    A restarted orchestrator reads `stage` to skip work that already
+    finished. The cache maps `cache_key(...)` to the Drive file ID of a
+    finished output, so a re-submitted identical input can be answered
+    with a Drive copy instead of a new alignment. Shared by all pipeline
+    threads.
+    """
+
+    def __init__(self, path='pipeline_ledger.sqlite'):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS samples ("
+                " file_id TEXT PRIMARY KEY, name TEXT NOT NULL, folder TEXT NOT NULL,"
+                " input_md5 TEXT, stage TEXT NOT NULL, host TEXT, output_file_id TEXT,"
+                " error TEXT, updated_local TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " cache_key TEXT PRIMARY KEY, output_file_id TEXT NOT NULL,"
+                " source_name TEXT NOT NULL, created_local TEXT NOT NULL, index_file_id TEXT)"
+            )
+            columns = [c[1] for c in self._conn.execute("PRAGMA table_info(results)")]
+            if 'index_file_id' not in columns:  # ledgers written before outputs had an index
+                self._conn.execute("ALTER TABLE results ADD COLUMN index_file_id TEXT")
+            self._conn.commit()
+
+    @staticmethod
+    def _now():
+        return datetime.now().isoformat(timespec='seconds')
+
+    def _write(self, sql, params):
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._conn.commit()
+
+    def get(self, file_id):
+        """dict of the sample row, or None if never seen."""
+        with self._lock:
+            cur = self._conn.execute("SELECT * FROM samples WHERE file_id = ?", (file_id,))
+            row = cur.fetchone()
+            return dict(zip([c[0] for c in cur.description], row)) if row else None
+
+    def reached(self, file_id, stage, host=None):
+        """True if the sample already completed `stage` (on `host`, when host-bound)."""
+        row = self.get(file_id)
+        if row is None or STAGES.index(row['stage']) < STAGES.index(stage):
+            return False
+        return host is None or row['host'] in (None, host)
+
+    def register(self, file_id, name, folder, input_md5):
+        """Record a new sample; a changed input (different md5) starts over from 'queued'."""
+        row = self.get(file_id)
+        if row is not None and row['input_md5'] == input_md5:
+            return
+        self._write(
+            "INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, 'queued', NULL, NULL, NULL, ?)",
+            (file_id, name, folder, input_md5, self._now()),
+        )
+
+    def advance(self, file_id, stage, host=None, output_file_id=None):
+        self._write(
+            "UPDATE samples SET stage = ?, host = COALESCE(?, host),"
+            " output_file_id = COALESCE(?, output_file_id), error = NULL, updated_local = ?"
+            " WHERE file_id = ?",
+            (stage, host, output_file_id, self._now(), file_id),
+        )
+
+    def fail(self, file_id, error):
+        self._write("UPDATE samples SET error = ?, updated_local = ? WHERE file_id = ?",
+                    (str(error)[:1000], self._now(), file_id))
+
+    def cached(self, key):
+        """(output, index) Drive file IDs of a finished result for this cache key, or None.
+
+        Results stored without an index count as a miss, so a hit always
+        publishes the same files as a fresh run.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT output_file_id, index_file_id FROM results WHERE cache_key = ?",
+                                     (key,)).fetchone()
+            return row if row and row[1] else None
+
+    def store(self, key, output_file_id, index_file_id, source_name):
+        self._write("INSERT OR REPLACE INTO results (cache_key, output_file_id, source_name, created_local,"
+                    " index_file_id) VALUES (?, ?, ?, ?, ?)",
+                    (key, output_file_id, source_name, self._now(), index_file_id))
+
+    def forget_result(self, key):
+        self._write("DELETE FROM results WHERE cache_key = ?", (key,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
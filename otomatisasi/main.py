@@ -8,6 +8,7 @@ import os
 import os.path
 import time
 import subprocess
+import threading
 from datetime import datetime
 
 from google.auth.transport.requests import Request
@@ -19,6 +20,13 @@ from googleapiclient.errors import HttpError
 from gcp.var import *
 from gcp.compute import *
 from drive.folder import *
+from drive.watcher import DriveWatcher
+from drive.relay import relay_drive_to_sftp, relay_sftp_to_drive
+from drive.jobs import JobRunner, MACHINE_SLOTS
+from gcp.fleet import Fleet, GCEBackend
+from pipeline import Pipeline, Stage
+from ledger import Ledger, cache_key, script_version
+from tracing import Tracer, TRACE_FILE, set_tracer, span
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/drive']
@@ -49,64 +57,375 @@ def main():
 
     return creds
 
+DONE_FOLDER_ID = '1CtZzLvgAd2RhMohITmg7GYT9Wwntx3kW'
+OUTPUT_FOLDER_ID = '1P1u6zm4ijl8DIbplFpyAC3BFTqQvo4U_'
+
+# Per-stage worker counts; compute workers only wait on detached remote jobs,
+# how many actually run at once is decided by the VM's CPU/RAM slots below
+FETCH_WORKERS = 2
+COMPUTE_WORKERS = 4
+PUBLISH_WORKERS = 2
+STAGE_QUEUE_SIZE = 2
+
+# Stream Drive <-> worker VM through memory instead of staging files under /home on this host
+STREAM_RELAY = True
+
+COMPUTE_MACHINE_TYPE = 'e2-highcpu-8'
+IDLE_MACHINE_TYPE = 'e2-micro'
+# Downgrade only after no sample has needed the VM for this long, not between every sample
+IDLE_GRACE_SEC = 300
+# Declared footprint of one sra_to_sam.sh run, passed on as align.py --threads so a job uses
+# exactly the cores it holds; bwa keeps the ~5.5 GiB GRCh38 index resident, so an
+# e2-highcpu-8 fits one job on all 8 vCPUs and a 16-vCPU/16 GiB type runs two side by side
+ALIGN_CPUS = 8
+ALIGN_MEM_GB = 6
+# align.py output: sorted BAM (+ .bai) or CRAM (+ .crai)
+OUTPUT_FORMAT = 'bam'
+OUTPUT_INDEX_EXT = {'bam': '.bai', 'cram': '.crai'}
+ALIGN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'align.py')
+# Standard-library tools copied to every worker VM: local path -> remote path
+WORKER_SCRIPTS = {
+    ALIGN_SCRIPT: '/home/align.py',
+    # block-parallel bz2/gzip/BGZF, for remote jobs: python3 /home/blockzip.py compress <dir>
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'upload-local-gcp-drive', 'blockzip.py'):
+        '/home/blockzip.py',
+}
+
+# Autoscaled worker VMs from gcp.var.worker_template instead of resizing the single
+# SFTP host; needs STREAM_RELAY and a worker image that already has the tools installed
+USE_FLEET = False
+
+# Part of the result-cache key, together with the input md5 and the script version
+REFERENCE = 'GCA_000001405.15_GRCh38_full_analysis_set'
+
+
 def start_pipeline(creds, folder_id):
-    while True:
-        folders = check_folder_for_files(creds, folder_id)      
-        if folders:
-            print("Folders found with the specified parent folder ID:")
-            for folder in folders:
-                print(f"Folder ID: {folder['id']}, Folder Name: {folder['name']}")
-                files = check_file_in_folder(creds,folder['id'],folder['name'])
-                if files:
-                    print("files found with the specified parent folder ID:")
-                    for file in files:
-                        print("Start Time : ", datetime.now())
-
-                        print(f"file ID: {file['id']}, file Name: {file['name']}")
-                        download_file(creds,file['id'],f"/home/{folder['name']}")
-                        time.sleep(5)
-                        
-                        send_to_sftp(creds, f"/home/{folder['name']}/{file['name']}", f"/home/{folder['name']}/{file['name']}")
-                        time.sleep(5)
-
-                        upgrade_instance()
-                        time.sleep(30)
-                        
-                        name, extension = os.path.splitext(file['name'])
-                        run_bash_script_on_remote_host(creds,folder['name'],name)
-                        time.sleep(5)
-                        
-                        get_from_sftp(creds,f"/home/{folder['name']}/output/{name}.zip",f"/home/{folder['name']}/output/{name}.zip")
-                        time.sleep(5)
-                        
-                        upload_file(creds,f"/home/{folder['name']}/output/{name}.zip",'1P1u6zm4ijl8DIbplFpyAC3BFTqQvo4U_')
-                        time.sleep(5)
-
-                        downgrade_instance()
-                        time.sleep(30)
-                        
-                        run_bash_script_on_remote_host(creds,f"rm_{folder['name']}",name)
-                        move_file(creds, file['id'], '1CtZzLvgAd2RhMohITmg7GYT9Wwntx3kW')
-                        os.remove(f"/home/{folder['name']}/{file['name']}")
-                        os.remove(f"/home/{folder['name']}/output/{name}.zip")
-                        time.sleep(10)
-                        print("End Time : ",datetime.now())
-                        print("Done")
-                else:
-                    print("No files found.")
+    # Changes-API watcher: reacts within seconds, near-zero API calls while idle
+    watcher = DriveWatcher(creds, folder_id)
+    # Per-sample stage ledger + result cache: restarts resume, repeated inputs skip the VM
+    ledger = Ledger()
+    # One span per stage per sample in TRACE_FILE; summarise with: python tracing.py report
+    tracer = Tracer(TRACE_FILE)
+    set_tracer(tracer)
+    if USE_FLEET:
+        cpus, mem_gb = MACHINE_SLOTS.get(worker_template['machine_type'], (ALIGN_CPUS, ALIGN_MEM_GB))
+        fleet = Fleet(GCEBackend(), worker_template, max_workers=fleet_max_workers,
+                      min_workers=fleet_min_workers, idle_sec=fleet_idle_sec,
+                      jobs_per_worker=max(1, min(cpus // ALIGN_CPUS, mem_gb // ALIGN_MEM_GB))).start()
+        vm = None
+    else:
+        fleet = None
+        vm = InstanceSizer(runner_for(SFTP_HOST, IDLE_MACHINE_TYPE))
+
+    def on_error(stage, job, exc):
+        Pipeline.print_error(stage, job, exc)
+        release_worker(fleet, job)
+        if isinstance(job, dict):
+            ledger.fail(job['file']['id'], exc)
+            job['trace'].end(exc)
+            if vm:
+                vm.release()
+
+    def on_done(job):
+        release_worker(fleet, job)
+        watcher.ack(job['file'])
+        job['trace'].end()
+        if vm:
+            vm.release()
+
+    pipeline = Pipeline([
+        Stage('fetch', traced('fetch', lambda job: fetch_stage(creds, job, fleet, ledger)),
+              FETCH_WORKERS, STAGE_QUEUE_SIZE),
+        Stage('compute', traced('compute', lambda job: compute_stage(creds, job, vm, ledger)),
+              COMPUTE_WORKERS, STAGE_QUEUE_SIZE),
+        Stage('publish', traced('publish', lambda job: publish_stage(creds, job, ledger)),
+              PUBLISH_WORKERS, STAGE_QUEUE_SIZE),
+    ], on_error=on_error, on_done=on_done).start()
+
+    # Samples handed out before a restart and never acked are replayed first; their compute
+    # stage asks for the same remote job id and so reattaches to the job still on the VM
+    print("Waiting for folders and files")
+    try:
+        for folder, file in watcher.watch(auto_ack=False):
+            name, extension = os.path.splitext(file['name'])
+            ledger.register(file['id'], file['name'], folder['name'], file.get('md5Checksum'))
+            if ledger.reached(file['id'], 'archived'):
+                # finished before a crash, only the watcher ack was lost
+                watcher.ack(file)
+                continue
+            print(f"Queued file ID: {file['id']}, file Name: {file['name']}  {pipeline.status()}")
+            trace = tracer.start('sample', sample=file['name'], file_id=file['id'], folder=folder['name'])
+            trace.add_bytes(file.get('size'))
+            if vm:
+                # fetch pushes to the VM and publish reads from it, so the hold spans the whole pipeline
+                vm.hold()
+            pipeline.submit({'folder': folder, 'file': file, 'name': name, 'start': datetime.now(),
+                             'cache_key': result_key(folder, file), 'trace': trace, 'handoff': time.time()})
+    except KeyboardInterrupt:
+        print("Stopping: finishing samples already in the pipeline")
+        pipeline.close()
+        if fleet:
+            fleet.shutdown()
+
+
+def traced(name, fn):
+    # Stage span under the sample's trace; time spent queued since the previous stage counts as wait
+    def run(job):
+        with job['trace'].child(name) as stage:
+            stage.add_wait(time.time() - job['handoff'])
+            try:
+                return fn(job)
+            finally:
+                job['handoff'] = time.time()
+    return run
+
+
+_runners = {}
+_runners_lock = threading.Lock()
+
+
+def runner_for(host, machine_type):
+    # One JobRunner (and job state file) per worker host
+    with _runners_lock:
+        if host not in _runners:
+            _runners[host] = JobRunner(host, SFTP_USERNAME, SFTP_PASSWORD, port=SFTP_PORT,
+                                       machine_type=machine_type, state_path=f"remote_jobs_{host}.json")
+        return _runners[host]
+
+
+def result_key(folder, file):
+    # Drive's md5 identifies the input; the local copies of the scripts identify the pipeline
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{folder['name']}.sh")
+    version = folder['name']
+    if os.path.exists(script):
+        version = script_version(script) + script_version(ALIGN_SCRIPT) + OUTPUT_FORMAT
+    return cache_key(file.get('md5Checksum') or file['id'], REFERENCE, version)
+
+
+def output_paths(folder, name):
+    output = f"/home/{folder['name']}/output/{name}.{OUTPUT_FORMAT}"
+    return output, output + OUTPUT_INDEX_EXT[OUTPUT_FORMAT]
+
+
+_staged_scripts = set()
+
+
+def stage_worker_scripts(host):
+    # Ship the worker tools with every orchestrator version so the VM never runs a stale copy
+    if host not in _staged_scripts:
+        for local, remote in WORKER_SCRIPTS.items():
+            put_file(host, SFTP_USERNAME, SFTP_PASSWORD, local, remote, port=SFTP_PORT)
+        _staged_scripts.add(host)
+
+
+def job_host(job):
+    return job['worker'].host if 'worker' in job else SFTP_HOST
+
+
+def job_runner(job):
+    # The cached runner compute_stage used: the sizer's for the shared VM, the template's for a fleet worker
+    machine_type = job['worker'].template['machine_type'] if 'worker' in job else IDLE_MACHINE_TYPE
+    return runner_for(job_host(job), machine_type)
+
+
+def remote_job_id(job):
+    # The input's md5 keeps a re-uploaded file with the same name from reattaching to the old finished job
+    file = job['file']
+    return f"{job['folder']['name']}-{job['name']}-{(file.get('md5Checksum') or file['id'])[:12]}"
+
+
+def release_worker(fleet, job):
+    if fleet and isinstance(job, dict) and job.get('worker'):
+        fleet.release(job.pop('worker'))
+
+
+def fetch_stage(creds, job, fleet, ledger):
+    folder, file = job['folder'], job['file']
+    print(f"[{file['name']}] Start Time : ", job['start'])
+    cached = ledger.cached(job['cache_key'])
+    if cached:
+        # same input, reference and script already aligned once: no transfer, no VM
+        print(f"[{file['name']}] Result cache hit, reusing Drive file IDs {', '.join(cached)}")
+        job['cached_output'] = cached
+        job['trace'].set(cached=True)
+        return job
+    if fleet:
+        # the sample stays on this worker until it is published
+        with span('fleet_acquire'):
+            job['worker'] = fleet.acquire()
+        print(f"[{file['name']}] Assigned to {job['worker'].name}  {fleet.status()}")
+    host = job_host(job)
+    if ledger.reached(file['id'], 'staged', host):
+        print(f"[{file['name']}] Already staged on {host}, skipping transfer")
+        return job
+    remote_input = f"/home/{folder['name']}/{file['name']}"
+    if STREAM_RELAY:
+        # Drive -> worker VM directly, no scratch copy on this host
+        with span('drive_to_sftp', host=host) as relay:
+            meta = relay_drive_to_sftp(creds, file['id'], remote_input, host, SFTP_USERNAME, SFTP_PASSWORD,
+                                       port=SFTP_PORT)
+            relay.add_bytes(meta['size'])
+        ledger.advance(file['id'], 'staged', host)
+        return job
+    # Drive -> orchestrator disk -> worker VM, overlaps with the previous sample's compute
+    if not (ledger.reached(file['id'], 'downloaded') and os.path.exists(remote_input)):
+        download_file(creds,file['id'],f"/home/{folder['name']}")
+        ledger.advance(file['id'], 'downloaded')
+    if not send_to_sftp(creds, remote_input, remote_input):
+        raise IOError(f"SFTP push of {file['name']} failed")
+    ledger.advance(file['id'], 'staged', host)
+    return job
+
+
+def compute_stage(creds, job, vm, ledger):
+    folder, file, name = job['folder'], job['file'], job['name']
+    if 'cached_output' in job:
+        return job
+    outputs = output_paths(folder, name)
+    if ledger.reached(file['id'], 'aligned', job_host(job)):
+        print(f"[{file['name']}] Already aligned on {job_host(job)}")
+    else:
+        if vm:
+            vm.up()
+            runner = vm.runner
         else:
-            print("No folders found.")
-            print("Waiting for folders and files")
+            runner = job_runner(job)
+        stage_worker_scripts(job_host(job))
+        # Detached on the VM: survives SSH drops and orchestrator restarts (same job id reattaches)
+        job_id = remote_job_id(job)
+        with span('align', host=job_host(job), cpus=ALIGN_CPUS, mem_gb=ALIGN_MEM_GB):
+            exit_code = runner.run(job_id, f"bash /home/{folder['name']}.sh {name} {OUTPUT_FORMAT} {ALIGN_CPUS}",
+                                   cpus=ALIGN_CPUS, mem_gb=ALIGN_MEM_GB)
+        if exit_code != 0:
+            runner.forget(job_id)
+            raise RuntimeError(f"{folder['name']}.sh {name} exited with {exit_code}")
+        ledger.advance(file['id'], 'aligned', job_host(job))
+    if STREAM_RELAY:
+        return job
+    for output in outputs:
+        if not get_from_sftp(creds,output,output):
+            raise FileNotFoundError(f"{output} was not produced")
+    return job
+
+
+def publish_stage(creds, job, ledger):
+    folder, file, name = job['folder'], job['file'], job['name']
+    output, index = output_paths(folder, name)
+    row = ledger.get(file['id'])
+    if 'cached_output' in job:
+        # the same output + index pair a fresh run uploads
+        try:
+            output_id, _ = [copy_file(creds, file_id, os.path.basename(path), OUTPUT_FOLDER_ID)
+                            for file_id, path in zip(job['cached_output'], (output, index))]
+        except HttpError as e:
+            if e.resp.status == 404:
+                # cached output or index was deleted from Drive: drop it so the replay aligns again
+                ledger.forget_result(job['cache_key'])
+            raise
+        ledger.advance(file['id'], 'uploaded', output_file_id=output_id)
+    elif row and row['stage'] in ('uploaded', 'archived') and row['output_file_id']:
+        print(f"[{file['name']}] Already uploaded as Drive file ID {row['output_file_id']}")
+    else:
+        uploaded = []
+        for path in (output, index):
+            if STREAM_RELAY:
+                with span('sftp_to_drive', host=job_host(job), path=path) as relay:
+                    result = relay_sftp_to_drive(creds, path, OUTPUT_FOLDER_ID, job_host(job), SFTP_USERNAME,
+                                                 SFTP_PASSWORD, port=SFTP_PORT)
+                    relay.add_bytes(result.get('size'))
+                uploaded.append(result['id'])
+            else:
+                uploaded.append(upload_file(creds,path,OUTPUT_FOLDER_ID))
+                if not uploaded[-1]:
+                    raise IOError(f"Upload of {path} failed")
+        output_id = uploaded[0]
+        ledger.advance(file['id'], 'uploaded', output_file_id=output_id)
+        ledger.store(job['cache_key'], output_id, uploaded[1], file['name'])
+        run_bash_script_on_remote_host(creds,f"rm_{folder['name']}",name,host=job_host(job))
+        # the outputs are gone, so the finished job record must not answer a later run of this id
+        job_runner(job).forget(remote_job_id(job))
+    move_file(creds, file['id'], DONE_FOLDER_ID)
+    ledger.advance(file['id'], 'archived')
+    if not STREAM_RELAY:
+        for path in (f"/home/{folder['name']}/{file['name']}", output, index):
+            if os.path.exists(path):
+                os.remove(path)
+    print(f"[{file['name']}] End Time : ",datetime.now())
+    print(f"[{file['name']}] Done")
+    return job
+
+
+class InstanceSizer:
+    """Upgrade the worker VM once before a batch, downgrade once no sample needs it.
+
+    Every sample holds the VM from submission until it leaves the
+    pipeline, since fetch pushes to it and publish streams from it. The
+    downgrade runs `grace_sec` after the last hold is released, and only
+    if no new hold was taken meanwhile. That check is made under the same
+    lock `up()` takes, so a job that was just launched is never stopped.
+    """
+
+    def __init__(self, runner, grace_sec=IDLE_GRACE_SEC):
+        self.lock = threading.Lock()
+        self.runner = runner
+        self.upgraded = False
+        self.grace_sec = grace_sec
+        self.users = 0
+        self._idle_since = 0  # bumped on every release that leaves the VM unused
+
+    def hold(self):
+        with self.lock:
+            self.users += 1
+
+    def release(self):
+        with self.lock:
+            self.users -= 1
+            if self.users:
+                return
+            self._idle_since += 1
+            generation = self._idle_since
+        timer = threading.Timer(self.grace_sec, self._down_if_idle, args=(generation,))
+        timer.daemon = True
+        timer.start()
+
+    def _down_if_idle(self, generation):
+        try:
+            self.down(generation)
+        except Exception as e:
+            print(f"[{datetime.now()}] Downgrading the worker VM failed: {e}")
+
+    def up(self):
+        with span('vm_up', machine_type=COMPUTE_MACHINE_TYPE) as vm_up:
+            # another compute worker may be resizing right now
+            with vm_up.waiting():
+                self.lock.acquire()
+            try:
+                if not self.upgraded:
+                    # returns once the VM answers on SSH, no fixed settle time
+                    upgrade_instance()
+                    self.runner.set_machine_type(COMPUTE_MACHINE_TYPE)
+                    self.upgraded = True
+            finally:
+                self.lock.release()
 
-        time.sleep(60)
+    def down(self, generation=None):
+        with self.lock:
+            # a sample arrived (and maybe released again) during the grace period
+            if self.users or (generation is not None and generation != self._idle_since):
+                return
+            if self.upgraded:
+                with span('vm_down', machine_type=IDLE_MACHINE_TYPE):
+                    self.runner.set_machine_type(IDLE_MACHINE_TYPE)
+                    downgrade_instance()
+                self.upgraded = False
 
 
 def downgrade_instance():
-    machine_type='e2-micro'
+    machine_type=IDLE_MACHINE_TYPE
     update_instance_machine_type(project,zone,instance_name,machine_type)
 
 def upgrade_instance():
-    machine_type='e2-highcpu-8'
+    machine_type=COMPUTE_MACHINE_TYPE
     update_instance_machine_type(project,zone,instance_name,machine_type)
 
 if __name__ == '__main__':
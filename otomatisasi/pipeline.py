@@ -0,0 +1,124 @@
+import queue
+import threading
+import traceback
+from datetime import datetime
+
+_STOP = object()
+
+
+class Stage:
+    """One step of the pipeline: `fn(item)` run by `workers` threads.
+
+    `fn` returns the item handed to the next stage (usually the same
+    dict, enriched). `queue_size` bounds the inbox, so a slow stage
+    applies back-pressure upstream instead of buffering unbounded work.
+    `on_idle` is called when a worker finds the inbox empty after
+    finishing an item, e.g. to scale a VM down between batches.
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=2, on_idle=None):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.inbox = queue.Queue(maxsize=queue_size)
+        self.on_idle = on_idle
+        self.busy = 0
+        self.done = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+
+class Pipeline:
+    """Stages connected by bounded queues, so different samples overlap.
+
+    While sample N runs on the compute stage, sample N+1 can be
+    downloading and sample N-1 uploading. A failure in one stage only
+    drops that item: it is passed to `on_error(stage, item, exc)` and
+    the workers carry on with the next item. `close()` drains every
+    queue in order and joins all threads.
+    """
+
+    def __init__(self, stages, on_error=None, on_done=None):
+        self.stages = stages
+        self.on_error = on_error or self.print_error
+        self.on_done = on_done
+        self.threads = []
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def print_error(stage, item, exc):
+        print(f"[{datetime.now()}] Stage {stage.name} failed for {item.get('name', item) if isinstance(item, dict) else item}: {exc}")
+        traceback.print_exception(type(exc), exc, exc.__traceback__)
+
+    def start(self):
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                t = threading.Thread(target=self._worker, args=(index,), name=f"{stage.name}-{n}", daemon=True)
+                t.start()
+                self.threads.append(t)
+        return self
+
+    def submit(self, item):
+        """Queue an item at the first stage; blocks while that stage is full."""
+        with self._cond:
+            self.in_flight += 1
+        self.stages[0].inbox.put(item)
+
+    def _finish(self, item, ok):
+        if ok and self.on_done:
+            self.on_done(item)
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def _worker(self, index):
+        stage = self.stages[index]
+        nxt = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            item = stage.inbox.get()
+            if item is _STOP:
+                return
+            with stage.lock:
+                stage.busy += 1
+            try:
+                result = stage.fn(item)
+            except Exception as e:
+                with stage.lock:
+                    stage.failed += 1
+                self.on_error(stage, item, e)
+                self._finish(item, ok=False)
+            else:
+                with stage.lock:
+                    stage.done += 1
+                if nxt is not None:
+                    nxt.inbox.put(result)
+                else:
+                    self._finish(result, ok=True)
+            finally:
+                with stage.lock:
+                    stage.busy -= 1
+                    idle = stage.busy == 0 and stage.inbox.empty()
+            if idle and stage.on_idle:
+                try:
+                    stage.on_idle()
+                except Exception as e:
+                    self.on_error(stage, None, e)
+
+    def status(self):
+        return {s.name: {'queued': s.inbox.qsize(), 'busy': s.busy, 'done': s.done, 'failed': s.failed}
+                for s in self.stages}
+
+    def drain(self):
+        """Block until every submitted item has left the pipeline."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.in_flight == 0)
+
+    def close(self):
+        """Finish all queued work, then stop the workers stage by stage."""
+        self.drain()
+        for stage in self.stages:
+            for _ in range(stage.workers):
+                stage.inbox.put(_STOP)
+        for t in self.threads:
+            t.join()
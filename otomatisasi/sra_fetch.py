@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""Download SRA runs with prefetch and convert them with fasterq-dump, overlapping both.
+
+Replaces running auto-download-sra-from-given-text-file.sh and then
+sra-to-fasqt.sh one after the other. Downloads run `--downloads` at a
+time. Each run goes to fasterq-dump as soon as its download finishes,
+so the network and the CPUs are busy together.
+
+Every run reserves scratch space for its whole life before it starts:
+the .sra plus `--fastq-factor` times that for the FASTQ output and the
+fasterq-dump temp files. A run only starts when the free space, minus
+what running work may still write, covers its reservation. The .sra
+size comes from `vdb-dump --info` when it answers, otherwise from the
+largest download so far. A run whose size is only guessed is admitted
+on its own when nothing else is running, and the guess is replaced by
+its real size once it lands. State is
+kept in `<workdir>/sra_state.json`, so a rerun skips converted runs and
+converts already-downloaded ones without fetching them again.
+
+    python3 sra_fetch.py kumpulan-sra.txt --workdir /data/sra --outdir /data/fastq
+"""
+import argparse, json, os, re, shutil, subprocess, sys, threading, time
+from datetime import datetime
+
+from pipeline import Pipeline, Stage
+
+GiB = 1024 ** 3
+
+
+def usable_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def mem_available_mb():
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return 0
+
+
+def read_accessions(path):
+    """Accessions from a text file, one per line; blank lines and '#' comments ignored, duplicates dropped."""
+    seen = []
+    with open(path) as f:
+        for line in f:
+            acc = line.split('#', 1)[0].strip()
+            if acc and acc not in seen:
+                seen.append(acc)
+    return seen
+
+
+def du(paths):
+    """Bytes currently on disk under `paths` (files or directories, missing ones count as 0)."""
+    total = 0
+    for path in paths:
+        if os.path.isfile(path):
+            total += os.path.getsize(path)
+        elif os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in files:
+                    try:
+                        total += os.path.getsize(os.path.join(root, name))
+                    except OSError:
+                        pass
+    return total
+
+
+class DiskBudget:
+    """Admits work only while the scratch filesystem can hold it.
+
+    `reserve(key, nbytes, paths)` blocks until free space minus `floor`
+    minus what running work may still write covers `nbytes`. What a
+    reservation may still write is its size minus what is already on
+    disk under its `paths`. So bytes are not counted twice as files grow.
+
+    A reservation with `exact=False` is only a guess. If nothing is held
+    it is admitted anyway, capped at the free space, because waiting
+    would never make more room and the real size is only learned by
+    running it. An exact one that cannot fit raises instead.
+    """
+
+    def __init__(self, path, floor_bytes, poll_sec=5.0):
+        self.path = path
+        self.floor = floor_bytes
+        self.poll_sec = poll_sec
+        self._held = {}  # key -> [nbytes, paths]
+        self._cond = threading.Condition()
+
+    def _outstanding(self):
+        return sum(max(0, nbytes - du(paths)) for nbytes, paths in self._held.values())
+
+    def available(self):
+        with self._cond:
+            return shutil.disk_usage(self.path).free - self.floor - self._outstanding()
+
+    def reserve(self, key, nbytes, paths, exact=True):
+        with self._cond:
+            while True:
+                free = shutil.disk_usage(self.path).free - self.floor - self._outstanding()
+                if nbytes <= free:
+                    self._held[key] = [nbytes, list(paths)]
+                    return
+                if not self._held and not exact:
+                    print(f"[{datetime.now()}] {key}: size unknown, guessed {nbytes / GiB:.1f} GiB but only "
+                          f"{max(0, free) / GiB:.1f} GiB free; running it alone to learn its size")
+                    self._held[key] = [max(0, free), list(paths)]
+                    return
+                if not self._held:
+                    # nothing running will give space back; waiting would hang forever
+                    raise OSError(f"{key} needs {nbytes / GiB:.1f} GiB of scratch, only {max(0, free) / GiB:.1f} GiB free")
+                self._cond.wait(self.poll_sec)
+
+    def resize(self, key, nbytes):
+        with self._cond:
+            if key in self._held:
+                self._held[key][0] = nbytes
+            self._cond.notify_all()
+
+    def release(self, key):
+        with self._cond:
+            self._held.pop(key, None)
+            self._cond.notify_all()
+
+
+class RunState:
+    """Per-accession progress in a JSON file, rewritten atomically after every change."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.runs = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.runs = json.load(f)
+
+    def get(self, acc):
+        with self._lock:
+            return dict(self.runs.get(acc, {}))
+
+    def update(self, acc, **fields):
+        with self._lock:
+            self.runs.setdefault(acc, {}).update(fields, updated_local=datetime.now().isoformat(timespec='seconds'))
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.runs, f, indent=1)
+            os.replace(tmp, self.path)
+
+
+class SraFetcher:
+    def __init__(self, workdir, outdir, prefetch='prefetch', fasterq_dump='fasterq-dump',
+                 downloads=3, converts=None, threads=None, sra_size_gb=4.0, fastq_factor=8.0,
+                 floor_gb=10.0, keep_sra=False, retries=2, vdb_dump='vdb-dump'):
+        self.workdir = workdir
+        self.outdir = outdir
+        self.tmpdir = os.path.join(workdir, 'tmp')
+        self.logdir = os.path.join(workdir, 'logs')
+        for d in (workdir, outdir, self.tmpdir, self.logdir):
+            os.makedirs(d, exist_ok=True)
+        self.prefetch = prefetch
+        self.fasterq_dump = fasterq_dump
+        self.vdb_dump = vdb_dump
+        self.downloads = downloads
+        cores = usable_cores()
+        # fasterq-dump gains little past ~8 threads; more cores go to more conversions at once
+        self.converts = converts or max(1, cores // 8)
+        self.threads = threads or max(1, cores // self.converts)
+        self.mem_mb = max(100, min(4096, mem_available_mb() // (2 * self.converts)))
+        self.sra_size = int(sra_size_gb * GiB)
+        self.fastq_factor = fastq_factor
+        self.keep_sra = keep_sra
+        self.retries = retries
+        self.state = RunState(os.path.join(workdir, 'sra_state.json'))
+        self.disk = DiskBudget(workdir, int(floor_gb * GiB))
+        self._sizes = []  # downloaded .sra sizes, to estimate the next ones
+
+    def _estimate(self):
+        # the largest download so far, until then the configured guess
+        return max(self._sizes) if self._sizes else self.sra_size
+
+    def remote_size(self, acc):
+        """Size of the run's .sra as reported by `vdb-dump --info`, or None if it cannot say."""
+        known = self.state.get(acc).get('remote_bytes')
+        if known:
+            return known
+        try:
+            out = subprocess.run([self.vdb_dump, '--info', acc], capture_output=True, text=True, timeout=120).stdout
+        except (OSError, subprocess.SubprocessError):
+            return None
+        m = re.search(r'^size\s*:\s*([\d,]+)', out, re.M)
+        if not m:
+            return None
+        size = int(m.group(1).replace(',', ''))
+        self.state.update(acc, remote_bytes=size)
+        return size
+
+    def _paths(self, acc):
+        return [os.path.join(self.workdir, acc), os.path.join(self.tmpdir, acc),
+                os.path.join(self.outdir, f'{acc}.fastq'), os.path.join(self.outdir, f'{acc}_1.fastq'),
+                os.path.join(self.outdir, f'{acc}_2.fastq')]
+
+    def find_sra(self, acc):
+        for path in (os.path.join(self.workdir, acc, f'{acc}.sra'), os.path.join(self.workdir, acc, f'{acc}.sralite'),
+                     os.path.join(self.workdir, f'{acc}.sra')):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def fastq_files(self, acc):
+        return sorted(os.path.join(self.outdir, name) for name in os.listdir(self.outdir)
+                      if name.startswith(acc) and name[len(acc):] in ('.fastq', '_1.fastq', '_2.fastq'))
+
+    def _run(self, acc, step, cmd):
+        log_path = os.path.join(self.logdir, f'{acc}.{step}.log')
+        with open(log_path, 'a') as log:
+            log.write(f"[{datetime.now()}] {' '.join(cmd)}\n")
+            log.flush()
+            code = subprocess.call(cmd, stdout=log, stderr=subprocess.STDOUT)
+        if code != 0:
+            raise RuntimeError(f"{step} {acc} exited with {code}, see {log_path}")
+
+    def download(self, acc):
+        row = self.state.get(acc)
+        sra = self.find_sra(acc)
+        size = os.path.getsize(sra) if sra else self.remote_size(acc)
+        estimate = size or self._estimate()
+        self.disk.reserve(acc, int(estimate * (1 + self.fastq_factor)), self._paths(acc), exact=size is not None)
+        try:
+            # a .sra of the size recorded after its download finished needs no second fetch
+            if sra is None or row.get('sra_bytes') != os.path.getsize(sra):
+                self.state.update(acc, stage='downloading', error=None)
+                start = time.time()
+                for attempt in range(self.retries + 1):
+                    try:
+                        self._run(acc, 'prefetch', [self.prefetch, acc, '--max-size', 'u', '-O', self.workdir])
+                        break
+                    except RuntimeError:
+                        if attempt == self.retries:
+                            raise
+                        time.sleep(min(60, 5 * 2 ** attempt))
+                sra = self.find_sra(acc)
+                if sra is None:
+                    raise FileNotFoundError(f"prefetch {acc} succeeded but no .sra was found under {self.workdir}")
+                self.state.update(acc, stage='downloaded', sra=sra, sra_bytes=os.path.getsize(sra),
+                                  download_sec=round(time.time() - start, 1))
+                print(f"[{datetime.now()}] Downloaded {acc}: {os.path.getsize(sra) / GiB:.2f} GiB "
+                      f"in {time.time() - start:.1f}s")
+            size = os.path.getsize(sra)
+            self._sizes.append(size)
+            self.disk.resize(acc, int(size * (1 + self.fastq_factor)))
+        except BaseException:
+            self.disk.release(acc)
+            raise
+        return acc
+
+    def convert(self, acc):
+        try:
+            sra = self.find_sra(acc)
+            temp = os.path.join(self.tmpdir, acc)
+            os.makedirs(temp, exist_ok=True)
+            self.state.update(acc, stage='converting', error=None)
+            start = time.time()
+            self._run(acc, 'fasterq-dump', [self.fasterq_dump, sra, '--split-3', '--threads', str(self.threads),
+                                            '--mem', f'{self.mem_mb}MB', '--temp', temp, '-O', self.outdir])
+            shutil.rmtree(temp, ignore_errors=True)
+            fastq = self.fastq_files(acc)
+            if not fastq:
+                raise FileNotFoundError(f"fasterq-dump {acc} succeeded but wrote no FASTQ to {self.outdir}")
+            if not self.keep_sra:
+                shutil.rmtree(os.path.join(self.workdir, acc), ignore_errors=True)
+                if os.path.isfile(sra):
+                    os.remove(sra)
+            seconds = time.time() - start
+            self.state.update(acc, stage='converted', fastq=fastq, fastq_bytes=sum(map(os.path.getsize, fastq)),
+                              convert_sec=round(seconds, 1), threads=self.threads)
+            print(f"[{datetime.now()}] Converted {acc}: {len(fastq)} FASTQ in {seconds:.1f}s ({self.threads} threads)")
+        finally:
+            self.disk.release(acc)
+        return acc
+
+    def on_error(self, stage, acc, exc):
+        if acc is None:
+            return Pipeline.print_error(stage, acc, exc)
+        self.state.update(acc, stage='failed', failed_stage=stage.name, error=str(exc)[:1000])
+        print(f"[{datetime.now()}] {stage.name} {acc} failed: {exc}")
+
+    def run(self, accessions):
+        todo = [acc for acc in accessions if self.state.get(acc).get('stage') != 'converted']
+        print(f"[{datetime.now()}] {len(accessions) - len(todo)} of {len(accessions)} runs already converted; "
+              f"{self.downloads} downloads, {self.converts} conversions x {self.threads} threads")
+        pipeline = Pipeline([
+            Stage('download', self.download, workers=self.downloads, queue_size=self.downloads),
+            Stage('convert', self.convert, workers=self.converts, queue_size=self.converts),
+        ], on_error=self.on_error).start()
+        for acc in todo:
+            pipeline.submit(acc)
+        pipeline.close()
+        return pipeline.status()
+
+    def report(self, accessions):
+        rows = [(acc, self.state.get(acc)) for acc in accessions]
+        print(f"{'accession':<14} {'stage':<10} {'sra_GiB':>8} {'download_s':>11} {'fastq_GiB':>10} {'convert_s':>10}")
+        for acc, r in rows:
+            print(f"{acc:<14} {r.get('stage', '-'):<10} {r.get('sra_bytes', 0) / GiB:>8.2f} "
+                  f"{r.get('download_sec', 0):>11.1f} {r.get('fastq_bytes', 0) / GiB:>10.2f} {r.get('convert_sec', 0):>10.1f}"
+                  + (f"  {r['error']}" if r.get('stage') == 'failed' else ''))
+        return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Concurrent, disk-aware prefetch + fasterq-dump for a list of SRA runs")
+    ap.add_argument('accessions', nargs='?', default='kumpulan-sra.txt', help="Text file, one accession per line (default kumpulan-sra.txt)")
+    ap.add_argument('--workdir', default='sra', help="Scratch directory for .sra, temp files, logs and state (default ./sra)")
+    ap.add_argument('--outdir', default=None, help="FASTQ output directory (default <workdir>/fastq)")
+    ap.add_argument('--downloads', type=int, default=3, help="Concurrent prefetch downloads (default 3)")
+    ap.add_argument('--converts', type=int, default=0, help="Concurrent fasterq-dump runs (default: cores // 8, at least 1)")
+    ap.add_argument('--threads', type=int, default=0, help="Threads per fasterq-dump (default: cores // --converts)")
+    ap.add_argument('--sra-size-gb', type=float, default=4.0, help="Assumed .sra size when vdb-dump cannot tell and nothing was downloaded yet (default 4)")
+    ap.add_argument('--fastq-factor', type=float, default=8.0, help="Scratch for FASTQ + temp, as a multiple of the .sra size (default 8)")
+    ap.add_argument('--floor-gb', type=float, default=10.0, help="Free space always left on the scratch filesystem (default 10)")
+    ap.add_argument('--keep-sra', action='store_true', help="Keep each .sra after a successful conversion")
+    ap.add_argument('--retries', type=int, default=2, help="Extra prefetch attempts per run (default 2)")
+    ap.add_argument('--prefetch', default=os.environ.get('PREFETCH', 'prefetch'), help="prefetch executable (env PREFETCH)")
+    ap.add_argument('--fasterq-dump', default=os.environ.get('FASTERQ_DUMP', 'fasterq-dump'), help="fasterq-dump executable (env FASTERQ_DUMP)")
+    ap.add_argument('--vdb-dump', default=os.environ.get('VDB_DUMP', 'vdb-dump'), help="vdb-dump executable, to look up .sra sizes (env VDB_DUMP)")
+    args = ap.parse_args()
+
+    if not os.path.exists(args.accessions):
+        print(f"File not found: {args.accessions}")
+        sys.exit(1)
+    accessions = read_accessions(args.accessions)
+    fetcher = SraFetcher(args.workdir, args.outdir or os.path.join(args.workdir, 'fastq'), args.prefetch,
+                         args.fasterq_dump, args.downloads, args.converts or None, args.threads or None,
+                         args.sra_size_gb, args.fastq_factor, args.floor_gb, args.keep_sra, args.retries,
+                         args.vdb_dump)
+    start = time.time()
+    fetcher.run(accessions)
+    rows = fetcher.report(accessions)
+    failed = [acc for acc, r in rows if r.get('stage') != 'converted']
+    print(f"Done in {time.time() - start:.1f}s: {len(rows) - len(failed)}/{len(rows)} converted")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,14 +8,9 @@ fi
 
 # Access the parameters
 param1=$1
-param2=$2
+param2=${2:-bam}
+param3=${3:-0}
 
-# Run Fasterq Dump SRA to Fastq
-/opt/sratoolkit/bin/fasterq-dump /home/sra_to_sam/$param1.sra -O /home/sra_to_sam/
-
-# Run Fastq to Sam
-/bin/bwa mem -t 4 /opt/ref/GCA_000001405.15_GRCh38_full_analysis_set.fna /home/sra_to_sam/$param1.fastq > /home/sra_to_sam/output/$param1.sam
-
-# Compress to Zip
-/bin/zip /home/sra_to_sam/output/$param1.zip /home/sra_to_sam/output/$param1.sam
-echo "Alignment $param1 SRA to SAM Success"
+# Stream SRA -> bwa mem -> sorted, indexed BAM (or CRAM with param2=cram) on param3 cores
+# (0 = all), no intermediate FASTQ/SAM/ZIP; timings and peak disk go to output/$param1.align.json
+exec python3 /home/align.py "$param1" --workdir /home/sra_to_sam --format "$param2" --threads "$param3"
@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+TRACE_FILE = 'pipeline_trace.jsonl'
+
+_local = threading.local()
+
+
+class Span:
+    """One timed operation, written to the trace file as a JSON line when it ends.
+
+    Carries what the stage moved and how long it was held up: `bytes`,
+    `retries` and `wait_sec` (queue, lock or slot wait, excluded from
+    the throughput). Used as a context manager it becomes the current
+    span of the thread, so code further down can reach it through
+    `current_span()` without it being passed around. A child inherits
+    the trace id and the `sample` attribute of its parent.
+    """
+
+    def __init__(self, tracer, name, parent=None, **attrs):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = dict(attrs)
+        if parent and 'sample' in parent.attrs:
+            self.attrs.setdefault('sample', parent.attrs['sample'])
+        self.bytes = 0
+        self.retries = 0
+        self.wait_sec = 0.0
+        self.start = time.time()
+        self.end_time = None
+        self._lock = threading.Lock()
+
+    def child(self, name, **attrs):
+        return Span(self.tracer, name, self, **attrs)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add_bytes(self, n):
+        with self._lock:
+            self.bytes += int(n or 0)
+
+    def retry(self, n=1):
+        # called from transfer worker threads as well
+        with self._lock:
+            self.retries += n
+
+    def add_wait(self, seconds):
+        with self._lock:
+            self.wait_sec += max(0.0, seconds)
+
+    @contextmanager
+    def waiting(self):
+        start = time.time()
+        try:
+            yield self
+        finally:
+            self.add_wait(time.time() - start)
+
+    def end(self, error=None):
+        if self.end_time is not None:
+            return
+        self.end_time = time.time()
+        if self.tracer:
+            self.tracer.write(self.record(error))
+
+    def record(self, error=None):
+        seconds = (self.end_time or time.time()) - self.start
+        attrs = dict(self.attrs, duration_sec=round(seconds, 3), bytes=self.bytes, retries=self.retries,
+                     wait_sec=round(self.wait_sec, 3))
+        if self.bytes:
+            attrs['throughput_mbps'] = round(self.bytes / 1024 / 1024 / max(seconds - self.wait_sec, 1e-6), 2)
+        # field names follow the OTLP JSON span encoding; attributes are a flat object
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'startTimeUnixNano': int(self.start * 1e9),
+            'endTimeUnixNano': int((self.end_time or time.time()) * 1e9),
+            'status': {'code': 'STATUS_CODE_ERROR', 'message': str(error)} if error else {'code': 'STATUS_CODE_OK'},
+            'attributes': attrs,
+        }
+
+    def __enter__(self):
+        _stack().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        self.end(exc)
+        return False
+
+
+class Tracer:
+    """Appends finished spans to a JSONL file; with no path, spans are timed but not written."""
+
+    def __init__(self, path=TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def start(self, name, parent=None, **attrs):
+        """A span that is not bound to this thread, e.g. a sample that moves between stage workers."""
+        return Span(self, name, parent, **attrs)
+
+    def span(self, name, parent=None, **attrs):
+        return Span(self, name, parent or current_span(), **attrs)
+
+    def write(self, record):
+        if not self.path:
+            return
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+
+
+_tracer = Tracer(None)
+
+
+def set_tracer(tracer):
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def current_span():
+    """The innermost span entered on this thread, or None."""
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def span(name, **attrs):
+    """Child of the current span (or a new trace) on the process-wide tracer: `with span('upload') as s:`."""
+    return _tracer.span(name, **attrs)
+
+
+def load(path):
+    spans = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+    return spans
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered), max(1, math.ceil(q / 100 * len(ordered)))) - 1]
+
+
+def _seconds(s):
+    return (s['endTimeUnixNano'] - s['startTimeUnixNano']) / 1e9
+
+
+def stage_stats(spans):
+    """Per span name: count, errors, p50/p95/max duration and wait, bytes, throughput, retries."""
+    groups = defaultdict(list)
+    for s in spans:
+        groups[s['name']].append(s)
+    rows = []
+    for name, group in groups.items():
+        durations = [_seconds(s) for s in group]
+        waits = [s['attributes'].get('wait_sec', 0) for s in group]
+        rates = [s['attributes']['throughput_mbps'] for s in group if 'throughput_mbps' in s['attributes']]
+        rows.append({
+            'name': name, 'count': len(group),
+            'errors': sum(s['status']['code'] == 'STATUS_CODE_ERROR' for s in group),
+            'p50_sec': percentile(durations, 50), 'p95_sec': percentile(durations, 95), 'max_sec': max(durations),
+            'wait_p50_sec': percentile(waits, 50), 'wait_p95_sec': percentile(waits, 95),
+            'bytes': sum(s['attributes'].get('bytes', 0) for s in group),
+            'throughput_p50_mbps': percentile(rates, 50) if rates else None,
+            'retries': sum(s['attributes'].get('retries', 0) for s in group),
+        })
+    return sorted(rows, key=lambda r: -r['p95_sec'])
+
+
+def critical_path(spans, root='sample'):
+    """Chain of stage spans that decided when the last sample finished.
+
+    Stage spans are the direct children of the `root` spans. Walking
+    back from the stage that ended last, each step's predecessor is
+    whichever ended latest before it started: the previous stage of the
+    same sample, or the same stage of another sample (its workers were
+    busy). Gaps between the two are reported as queue wait.
+    """
+    roots = {s['spanId'] for s in spans if s['name'] == root}
+    stages = [s for s in spans if s['parentSpanId'] in roots]
+    if not stages:
+        return []
+    current = max(stages, key=lambda s: s['endTimeUnixNano'])
+    path = [current]
+    while True:
+        before = [s for s in stages if s is not current and s['endTimeUnixNano'] <= current['startTimeUnixNano'] + 1e6
+                  and (s['traceId'] == current['traceId'] or s['name'] == current['name'])]
+        if not before:
+            break
+        current = max(before, key=lambda s: s['endTimeUnixNano'])
+        path.append(current)
+    return path[::-1]
+
+
+def report(path, json_path=None, slowest=3):
+    spans = load(path)
+    if not spans:
+        print(f"No spans in {path}")
+        return {}
+    stats = stage_stats(spans)
+    width = max(len(r['name']) for r in stats + [{'name': 'stage'}])
+    print(f"{'stage':<{width}} {'n':>5} {'err':>4} {'p50 s':>9} {'p95 s':>9} {'max s':>9} "
+          f"{'wait p50':>9} {'wait p95':>9} {'GiB':>8} {'MB/s p50':>9} {'retries':>7}")
+    for r in stats:
+        rate = f"{r['throughput_p50_mbps']:.1f}" if r['throughput_p50_mbps'] is not None else '-'
+        print(f"{r['name']:<{width}} {r['count']:>5} {r['errors']:>4} {r['p50_sec']:>9.1f} {r['p95_sec']:>9.1f} "
+              f"{r['max_sec']:>9.1f} {r['wait_p50_sec']:>9.1f} {r['wait_p95_sec']:>9.1f} "
+              f"{r['bytes'] / 1024 ** 3:>8.2f} {rate:>9} {r['retries']:>7}")
+
+    # where the slowest samples spent their time, stage by stage, queue waits included
+    samples = sorted((s for s in spans if s['name'] == 'sample'), key=_seconds, reverse=True)
+    children = defaultdict(list)
+    for s in spans:
+        children[s['parentSpanId']].append(s)
+    breakdown = []
+    for sample in samples[:slowest]:
+        parts = sorted(children[sample['spanId']], key=lambda s: s['startTimeUnixNano'])
+        breakdown.append({'sample': sample['attributes'].get('sample'), 'seconds': _seconds(sample),
+                          'stages': [{'name': p['name'], 'seconds': _seconds(p),
+                                      'wait_sec': p['attributes'].get('wait_sec', 0),
+                                      'steps': {c['name']: round(_seconds(c), 1) for c in children[p['spanId']]}}
+                                     for p in parts]})
+    if breakdown:
+        print(f"\nSlowest samples (of {len(samples)}; end-to-end p50 {percentile([_seconds(s) for s in samples], 50):.1f}s, "
+              f"p95 {percentile([_seconds(s) for s in samples], 95):.1f}s)")
+        for b in breakdown:
+            print(f"  {b['sample']}: {b['seconds']:.1f}s")
+            for p in b['stages']:
+                steps = ', '.join(f"{k} {v}s" for k, v in p['steps'].items())
+                print(f"    {p['name']:<10} {p['seconds']:>9.1f}s  queued {p['wait_sec']:.1f}s" + (f"  ({steps})" if steps else ''))
+
+    path_spans = critical_path(spans)
+    on_path = []
+    if path_spans:
+        makespan = (path_spans[-1]['endTimeUnixNano'] - path_spans[0]['startTimeUnixNano']) / 1e9
+        per_stage = defaultdict(float)
+        print(f"\nCritical path ({makespan:.1f}s from first to last stage on it)")
+        previous = None
+        for s in path_spans:
+            if previous is not None:
+                gap = (s['startTimeUnixNano'] - previous['endTimeUnixNano']) / 1e9
+                if gap > 0.5:
+                    per_stage['(queue)'] += gap
+                    print(f"  {'(queue)':<10} {gap:>9.1f}s")
+            per_stage[s['name']] += _seconds(s)
+            on_path.append({'stage': s['name'], 'sample': s['attributes'].get('sample'), 'seconds': _seconds(s)})
+            print(f"  {s['name']:<10} {_seconds(s):>9.1f}s  {s['attributes'].get('sample')}")
+            previous = s
+        for name, seconds in sorted(per_stage.items(), key=lambda kv: -kv[1]):
+            print(f"  >> {name}: {seconds:.1f}s ({100 * seconds / max(makespan, 1e-9):.0f}% of the critical path)")
+
+    result = {'stages': stats, 'slowest_samples': breakdown, 'critical_path': on_path}
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(result, f, indent=2)
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Summarise a pipeline trace: p50/p95 per stage and the critical path")
+    sub = ap.add_subparsers(dest='command', required=True)
+    rp = sub.add_parser('report', help="Per-stage percentiles, slowest samples and critical path")
+    rp.add_argument('trace', nargs='?', default=TRACE_FILE, help=f"Trace JSONL (default {TRACE_FILE})")
+    rp.add_argument('--slowest', type=int, default=3, help="How many of the slowest samples to break down (default 3)")
+    rp.add_argument('--json', default=None, help="Also write the summary as JSON here")
+    args = ap.parse_args()
+    if not os.path.exists(args.trace):
+        sys.exit(f"{args.trace} not found")
+    report(args.trace, args.json, args.slowest)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""Benchmark upload-to-gcp.py against an in-process fake GCS server.
+
+The fake speaks just enough of the GCS JSON API for the uploader (multipart
+and resumable uploads, status queries, compose, get/patch/delete, list) and
+can add per-request latency, a shared bandwidth cap, injected 5xx responses
+and hung requests. Each sweep point runs the real uploader as a subprocess
+with STORAGE_EMULATOR_HOST pointing at the fake, and the results are written
+as one JSON report so runs before and after a change can be compared.
+"""
+import argparse, base64, csv, hashlib, itertools, json, os, random, re, subprocess, sys, tempfile, threading, time, uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlparse
+
+import google_crc32c
+
+MiB = 1024 * 1024
+UPLOADER = Path(__file__).with_name("upload-to-gcp.py")
+
+# name -> list of (file_count, file_size_bytes), scaled by --scale
+DISTRIBUTIONS = {
+    "small": [(2000, 16 * 1024)],
+    "mixed": [(500, 64 * 1024), (40, 4 * MiB), (2, 96 * MiB)],
+    "large": [(4, 128 * MiB)],
+}
+
+def b64_crc32c(data: bytes) -> str:
+    return base64.b64encode(google_crc32c.value(data).to_bytes(4, "big")).decode("ascii")
+
+class Throttle:
+    """Token bucket shared by all connections: caps aggregate ingest bandwidth."""
+
+    def __init__(self, rate_bytes_per_sec: float):
+        self.rate = rate_bytes_per_sec
+        self._lock = threading.Lock()
+        self._next = time.perf_counter()
+
+    def consume(self, n: int):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.perf_counter()
+            self._next = max(self._next, now) + n / self.rate
+            delay = self._next - now
+        if delay > 0:
+            time.sleep(delay)
+
+class FakeGCS:
+    """In-memory bucket store plus request counters for the report."""
+
+    def __init__(self, latency_ms=0.0, bandwidth_mbps=0.0, error_rate=0.0, hang_rate=0.0, hang_sec=30.0, seed=None):
+        self.latency = latency_ms / 1000.0
+        self.throttle = Throttle(bandwidth_mbps * MiB)
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_sec = hang_sec
+        self.rng = random.Random(seed)
+        self.objects = {}
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "bytes_in": 0, "injected_5xx": 0, "injected_hangs": 0}
+        self.server = None
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def roll(self, rate):
+        with self.lock:
+            return rate > 0 and self.rng.random() < rate
+
+    def store(self, bucket, name, data, meta, composite=False):
+        o = {
+            "data": bytes(data),
+            "generation": time.time_ns() // 1000,
+            "metadata": meta.get("metadata") or {},
+            "contentType": meta.get("contentType"),
+            "contentEncoding": meta.get("contentEncoding"),
+            "composite": composite,
+        }
+        with self.lock:
+            self.objects[(bucket, name)] = o
+        return self.resource(bucket, name, o)
+
+    @staticmethod
+    def resource(bucket, name, o):
+        d = {
+            "kind": "storage#object",
+            "id": f"{bucket}/{name}/{o['generation']}",
+            "bucket": bucket,
+            "name": name,
+            "size": str(len(o["data"])),
+            "generation": str(o["generation"]),
+            "metageneration": "1",
+            "contentType": o.get("contentType") or "application/octet-stream",
+            "crc32c": b64_crc32c(o["data"]),
+            "metadata": o.get("metadata") or {},
+        }
+        if o.get("contentEncoding"):
+            d["contentEncoding"] = o["contentEncoding"]
+        if not o.get("composite"):
+            d["md5Hash"] = base64.b64encode(hashlib.md5(o["data"]).digest()).decode("ascii")
+        return d
+
+    def start(self, port=0):
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(self))
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="fake-gcs", daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+def make_handler(gcs: FakeGCS):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def read_body(self):
+            remaining = int(self.headers.get("Content-Length") or 0)
+            parts = []
+            while remaining:
+                chunk = self.rfile.read(min(remaining, 256 * 1024))
+                if not chunk:
+                    break
+                gcs.throttle.consume(len(chunk))
+                parts.append(chunk)
+                remaining -= len(chunk)
+            body = b"".join(parts)
+            gcs.count("bytes_in", len(body))
+            return body
+
+        def reply(self, code, payload=None, headers=None, raw=None):
+            body = raw if raw is not None else (json.dumps(payload).encode() if payload is not None else b"")
+            self.send_response(code)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            if raw is None and payload is not None:
+                self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def error(self, code, message):
+            self.reply(code, {"error": {"code": code, "message": message}})
+
+        def handle_any(self, method):
+            gcs.count("requests")
+            if gcs.latency:
+                time.sleep(gcs.latency)
+            url = urlparse(self.path)
+            q = {k: v[0] for k, v in parse_qs(url.query).items()}
+            body = self.read_body()
+            if gcs.roll(gcs.hang_rate):
+                gcs.count("injected_hangs")
+                time.sleep(gcs.hang_sec)
+                self.close_connection = True
+                return
+            if gcs.roll(gcs.error_rate):
+                gcs.count("injected_5xx")
+                return self.error(503, "injected by bench")
+            try:
+                self.route(method, url.path, q, body)
+            except Exception as e:  # keep the fake alive, surface as 500
+                self.error(500, f"fake-gcs: {e}")
+
+        def route(self, method, path, q, body):
+            m = re.match(r"^/upload/storage/v1/b/([^/]+)/o$", path)
+            if m:
+                bucket = m.group(1)
+                if method == "POST" and q.get("uploadType") == "multipart":
+                    return self.multipart(bucket, q, body)
+                if method == "POST" and q.get("uploadType") == "resumable":
+                    meta = json.loads(body or b"{}")
+                    sid = uuid.uuid4().hex
+                    with gcs.lock:
+                        gcs.sessions[sid] = {"bucket": bucket, "name": meta.get("name") or q.get("name"),
+                                             "meta": meta, "data": bytearray()}
+                    location = f"http://{self.headers['Host']}/upload/storage/v1/b/{bucket}/o?uploadType=resumable&upload_id={sid}"
+                    return self.reply(200, {}, {"Location": location})
+                if method == "PUT" and "upload_id" in q:
+                    return self.resumable_put(q["upload_id"], body)
+
+            m = re.match(r"^/storage/v1/b/([^/]+)/o/(.+)/compose$", path)
+            if m and method == "POST":
+                bucket, name = m.group(1), unquote(m.group(2))
+                req = json.loads(body)
+                with gcs.lock:
+                    data = b"".join(gcs.objects[(bucket, s["name"])]["data"] for s in req["sourceObjects"])
+                return self.reply(200, gcs.store(bucket, name, data, req.get("destination") or {}, composite=True))
+
+            m = re.match(r"^/(?:download/)?storage/v1/b/([^/]+)/o/(.+)$", path)
+            if m:
+                return self.object(method, m.group(1), unquote(m.group(2)), q, body)
+
+            m = re.match(r"^/storage/v1/b/([^/]+)/o$", path)
+            if m and method == "GET":
+                return self.listing(m.group(1), q)
+
+            return self.error(404, f"fake-gcs: no route for {method} {path}")
+
+        def multipart(self, bucket, q, body):
+            boundary = self.headers["Content-Type"].split("boundary=", 1)[1].strip('"').encode()
+            sections = body.split(b"--" + boundary)
+            meta = json.loads(sections[1].split(b"\r\n\r\n", 1)[1].strip())
+            data = sections[2].split(b"\r\n\r\n", 1)[1]
+            if data.endswith(b"\r\n"):
+                data = data[:-2]
+            return self.reply(200, gcs.store(bucket, meta.get("name") or q.get("name"), data, meta))
+
+        def resumable_put(self, sid, body):
+            with gcs.lock:
+                s = gcs.sessions.get(sid)
+            if s is None:
+                return self.error(404, "upload session not found")
+            m = re.match(r"bytes (?:\*|(\d+)-(\d+))/(\*|\d+)", self.headers.get("Content-Range", ""))
+            if not m:
+                return self.error(400, "bad Content-Range")
+            if m.group(1) is not None:
+                start = int(m.group(1))
+                if start > len(s["data"]):
+                    return self.error(400, "non-contiguous chunk")
+                s["data"][start:] = body
+            total = m.group(3)
+            if total != "*" and len(s["data"]) == int(total):
+                with gcs.lock:
+                    gcs.sessions.pop(sid, None)
+                return self.reply(200, gcs.store(s["bucket"], s["name"], s["data"], s["meta"]))
+            headers = {"Range": f"bytes=0-{len(s['data']) - 1}"} if s["data"] else {}
+            return self.reply(308, None, headers, raw=b"")
+
+        def object(self, method, bucket, name, q, body):
+            with gcs.lock:
+                o = gcs.objects.get((bucket, name))
+            if o is None:
+                return self.error(404, "No such object")
+            if method == "DELETE":
+                with gcs.lock:
+                    gcs.objects.pop((bucket, name), None)
+                return self.reply(204, None, raw=b"")
+            if method == "PATCH":
+                patch = json.loads(body or b"{}")
+                if "metadata" in patch:
+                    o["metadata"] = {**(o.get("metadata") or {}), **(patch["metadata"] or {})}
+                return self.reply(200, gcs.resource(bucket, name, o))
+            if q.get("alt") == "media":
+                data = o["data"]
+                rng = self.headers.get("Range")
+                if rng:
+                    a, _, b = rng.split("=", 1)[1].partition("-")
+                    a, b = int(a), int(b) if b else len(data) - 1
+                    part = data[a:b + 1]
+                    return self.reply(206, None, {"Content-Range": f"bytes {a}-{a + len(part) - 1}/{len(data)}"}, raw=part)
+                return self.reply(200, None, {"x-goog-hash": f"crc32c={b64_crc32c(data)}"}, raw=data)
+            return self.reply(200, gcs.resource(bucket, name, o))
+
+        def listing(self, bucket, q):
+            prefix = q.get("prefix", "")
+            with gcs.lock:
+                names = sorted(n for (b, n) in gcs.objects if b == bucket and n.startswith(prefix))
+                start = int(q.get("pageToken", 0))
+                size = int(q.get("maxResults", 1000))
+                items = [gcs.resource(bucket, n, gcs.objects[(bucket, n)]) for n in names[start:start + size]]
+            resp = {"kind": "storage#objects", "items": items}
+            if start + size < len(names):
+                resp["nextPageToken"] = str(start + size)
+            return self.reply(200, resp)
+
+        def do_GET(self):
+            self.handle_any("GET")
+
+        def do_POST(self):
+            self.handle_any("POST")
+
+        def do_PUT(self):
+            self.handle_any("PUT")
+
+        def do_PATCH(self):
+            self.handle_any("PATCH")
+
+        def do_DELETE(self):
+            self.handle_any("DELETE")
+
+    return Handler
+
+def make_dataset(root: Path, distribution: str, scale: float, seed: int):
+    """Write the files for one distribution once; random bytes so compression cannot cheat."""
+    rng = random.Random(seed)
+    total = 0
+    for group, (count, size) in enumerate(DISTRIBUTIONS[distribution]):
+        count = max(1, int(count * scale))
+        size = max(1, int(size * scale)) if size > MiB else size
+        d = root / f"g{group}"
+        d.mkdir(parents=True, exist_ok=True)
+        block = rng.randbytes(min(size, 4 * MiB))
+        for i in range(count):
+            with open(d / f"f{i:06d}.bin", "wb") as f:
+                left = size
+                while left:
+                    n = min(left, len(block))
+                    f.write(block[:n])
+                    left -= n
+            total += size
+    return total
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+def run_point(fake_args, src: Path, distribution: str, dataset_bytes: int, workers: int, chunk_mb: int, extra, timeout_sec: float):
+    gcs = FakeGCS(**fake_args)
+    endpoint = gcs.start()
+    with tempfile.TemporaryDirectory(prefix="bench_run_") as run_dir:
+        log = Path(run_dir) / "upload.csv"
+        cmd = [
+            sys.executable, str(UPLOADER), str(src), "bench-bucket",
+            "--prefix", f"{distribution}/w{workers}-c{chunk_mb}",
+            "--workers", str(workers), "--chunk-mb", str(chunk_mb),
+            "--timeout-sec", str(timeout_sec),
+            "--journal", str(Path(run_dir) / "journal.sqlite"),
+            "--log", str(log),
+        ] + list(extra)
+        env = {**os.environ, "STORAGE_EMULATOR_HOST": endpoint}
+        t0 = time.perf_counter()
+        proc = subprocess.run(cmd, env=env, cwd=run_dir, capture_output=True, text=True)
+        wall = time.perf_counter() - t0
+        gcs.stop()
+
+        rows = list(csv.DictReader(open(log))) if log.exists() else []
+    uploaded = [r for r in rows if r["status"] == "uploaded"]
+    durations = [float(r["duration_sec"]) for r in uploaded]
+    result = {
+        "distribution": distribution,
+        "workers": workers,
+        "chunk_mb": chunk_mb,
+        "extra_args": list(extra),
+        "exit_code": proc.returncode,
+        "wall_sec": round(wall, 3),
+        "dataset_bytes": dataset_bytes,
+        "effective_MBps": round(dataset_bytes / MiB / wall, 2) if wall > 0 else 0.0,
+        "rows": len(rows),
+        "objects_uploaded": len(uploaded),
+        "retries": sum(int(r.get("retries") or 0) for r in uploaded),
+        "file_latency_p50_sec": percentile(durations, 0.50),
+        "file_latency_p95_sec": percentile(durations, 0.95),
+        "server": dict(gcs.stats),
+    }
+    if proc.returncode != 0:
+        result["stderr_tail"] = proc.stderr[-2000:]
+    return result
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark upload-to-gcp.py against a local fake GCS endpoint")
+    ap.add_argument("--distributions", default="small,mixed,large", help=f"Comma-separated, from: {','.join(DISTRIBUTIONS)}")
+    ap.add_argument("--scale", type=float, default=0.1, help="Scale file counts and large-file sizes (default 0.1)")
+    ap.add_argument("--workers", default="1,4,8", help="Comma-separated worker counts to sweep (default 1,4,8)")
+    ap.add_argument("--chunk-mb", default="8", help="Comma-separated chunk sizes in MiB to sweep (default 8)")
+    ap.add_argument("--latency-ms", type=float, default=20, help="Added latency per request (default 20)")
+    ap.add_argument("--bandwidth-mbps", type=float, default=0, help="Aggregate ingest cap in MiB/s (default 0=unlimited)")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503 (default 0)")
+    ap.add_argument("--hang-rate", type=float, default=0.0, help="Fraction of requests that hang then drop (default 0)")
+    ap.add_argument("--hang-sec", type=float, default=10, help="How long a hung request stalls (default 10)")
+    ap.add_argument("--timeout-sec", type=float, default=5, help="Uploader --timeout-sec, keep below --hang-sec (default 5)")
+    ap.add_argument("--seed", type=int, default=1, help="Seed for datasets and fault injection (default 1)")
+    ap.add_argument("--out", default=None, help="JSON report path (default: ./logs/bench_<timestamp>.json)")
+    ap.add_argument("extra", nargs=argparse.REMAINDER, help="Extra uploader args after --, e.g. -- --auto --slice-threshold-mb 32")
+    args = ap.parse_args()
+
+    extra = args.extra[1:] if args.extra[:1] == ["--"] else args.extra
+    fake_args = dict(latency_ms=args.latency_ms, bandwidth_mbps=args.bandwidth_mbps, error_rate=args.error_rate,
+                     hang_rate=args.hang_rate, hang_sec=args.hang_sec, seed=args.seed)
+    workers = [int(w) for w in args.workers.split(",")]
+    chunks = [int(c) for c in args.chunk_mb.split(",")]
+
+    ts_name = time.strftime("%Y%m%d_%H%M%S", time.localtime())
+    out = Path(args.out) if args.out else Path("./logs") / f"bench_{ts_name}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_data_") as data_root:
+        for dist in args.distributions.split(","):
+            src = Path(data_root) / dist
+            dataset_bytes = make_dataset(src, dist, args.scale, args.seed)
+            for w, c in itertools.product(workers, chunks):
+                r = run_point(fake_args, src, dist, dataset_bytes, w, c, extra, args.timeout_sec)
+                results.append(r)
+                print(f"[BENCH] {dist:<6} workers={w:<3} chunk={c:<4}MiB -> {r['effective_MBps']:>8} MB/s "
+                      f"wall {r['wall_sec']}s, retries {r['retries']}, p95 {r['file_latency_p95_sec']}s"
+                      + ("" if r["exit_code"] == 0 else f" (exit {r['exit_code']})"))
+
+    report = {
+        "timestamp_local": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime()),
+        "python": sys.version.split()[0],
+        "fake_gcs": fake_args,
+        "scale": args.scale,
+        "timeout_sec": args.timeout_sec,
+        "results": results,
+    }
+    out.write_text(json.dumps(report, indent=2))
+    print(f"Report: {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""Block-parallel bz2 / gzip / BGZF compression on every core.
+
+Each file is cut into independent blocks. Blocks are compressed on a
+process pool and written back in order. The result is a standard
+stream that other tools can read:
+
+  bz2   one bzip2 stream per block, concatenated (bzip2 -d, bzcat, Python bz2)
+  gzip  one gzip member per block (gzip -d, zcat). A 'PZ' extra field
+        records each member's size so the members can be found again
+  bgzf  BGZF, the blocked gzip used by samtools/htslib (bgzip -d, tabix, zcat)
+
+Output written here decompresses in parallel too. gzip and BGZF members
+are found from their headers. bzip2 streams are found by their start
+magic. Any other .gz/.bz2 falls back to a single-stream decode.
+
+Standard library only, so it can be copied to a worker VM as is.
+"""
+import argparse, bz2, gzip, json, os, struct, sys, time, zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+MiB = 1024 * 1024
+CODECS = ("bz2", "gzip", "bgzf")
+SUFFIX = {"bz2": ".bz2", "gzip": ".gz", "bgzf": ".gz"}
+DEFAULT_LEVEL = {"bz2": 9, "gzip": 6, "bgzf": 6}
+# bz2 works on 900 KiB blocks internally, so 8 MiB streams cost almost no ratio
+DEFAULT_BLOCK_MB = {"bz2": 8, "gzip": 4, "bgzf": 4}
+
+BGZF_MAX_INPUT = 0xff00  # what htslib puts in one BGZF block
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+BZ2_STREAM_MAGIC = b"1AY&SY"  # first block header, right after "BZh<level>"
+GZIP_MEMBER_FIELD = b"PZ"
+
+
+# ---- block codecs (run inside pool workers) ----
+
+def _deflate(data: bytes, level: int) -> bytes:
+    c = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return c.compress(data) + c.flush()
+
+
+def _gzip_member(data: bytes, level: int, field: bytes, size_fmt: str, size_adjust: int) -> bytes:
+    body = _deflate(data, level)
+    xlen = 4 + struct.calcsize(size_fmt)
+    total = 12 + xlen + len(body) + 8
+    header = (b"\x1f\x8b\x08\x04" + b"\x00\x00\x00\x00" + b"\x00\xff" + struct.pack("<H", xlen)
+              + field + struct.pack("<H", struct.calcsize(size_fmt)) + struct.pack(size_fmt, total - size_adjust))
+    return header + body + struct.pack("<II", zlib.crc32(data), len(data) & 0xffffffff)
+
+
+def compress_block(codec: str, level: int, data: bytes) -> bytes:
+    """Compress one block into a self-contained stream of `codec`."""
+    if codec == "bz2":
+        return bz2.compress(data, level)
+    if codec == "gzip":
+        return _gzip_member(data, level, GZIP_MEMBER_FIELD, "<I", 0)
+    if codec == "bgzf":
+        # BSIZE is the block size minus one
+        return b"".join(_gzip_member(data[i:i + BGZF_MAX_INPUT], level, b"BC", "<H", 1)
+                        for i in range(0, len(data), BGZF_MAX_INPUT))
+    raise ValueError(f"unknown codec {codec!r}")
+
+
+def stream_trailer(codec: str) -> bytes:
+    """Bytes that close a stream: the empty EOF block for bgzf, nothing otherwise."""
+    return BGZF_EOF if codec == "bgzf" else b""
+
+
+def _compress_range(codec, level, path, offset, length):
+    t = time.process_time()
+    with open(path, "rb") as f:
+        f.seek(offset)
+        out = compress_block(codec, level, f.read(length))
+    return out, time.process_time() - t
+
+
+def _decompress_members(data: bytes) -> bytes:
+    out = []
+    while data:
+        d = zlib.decompressobj(31)
+        out.append(d.decompress(data))
+        if not d.eof:
+            raise ValueError("truncated gzip member")
+        data = d.unused_data
+    return b"".join(out)
+
+
+def _decompress_bz2_streams(data: bytes) -> bytes:
+    out = []
+    while data:
+        d = bz2.BZ2Decompressor()
+        out.append(d.decompress(data))
+        if not d.eof:
+            raise ValueError("truncated bzip2 stream")
+        data = d.unused_data
+    return b"".join(out)
+
+
+def _decompress_range(codec, path, offset, length):
+    t = time.process_time()
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    out = _decompress_bz2_streams(data) if codec == "bz2" else _decompress_members(data)
+    return out, time.process_time() - t
+
+
+# ---- streaming API (used by upload-to-gcp.py --compress) ----
+
+def compress_blocks(read, codec, executor, level=None, block_size=None, window=None):
+    """Yield the compressed stream of `read()` chunks, blocks compressed on `executor`.
+
+    `read(n)` is called sequentially, so a hashing reader sees the file in
+    order. At most `window` blocks are in flight (default 2 per pool
+    worker) so memory stays bounded.
+    """
+    level = DEFAULT_LEVEL[codec] if level is None else level
+    block_size = block_size or DEFAULT_BLOCK_MB[codec] * MiB
+    window = window or 2 * getattr(executor, "_max_workers", os.cpu_count() or 1)
+    pending = deque()
+    seen = False
+    for block in iter(lambda: read(block_size), b""):
+        seen = True
+        pending.append(executor.submit(compress_block, codec, level, bytes(block)))
+        while len(pending) > window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+    if not seen:
+        yield compress_block(codec, level, b"")
+    trailer = stream_trailer(codec)
+    if trailer:
+        yield trailer
+
+
+# ---- file API ----
+
+class FileJob:
+    """One file moving through the pool: its ordered block results land in `dst`."""
+
+    def __init__(self, src, dst, size):
+        self.src = src
+        self.dst = dst
+        self.size = size
+        self.tmp = dst + ".part"
+        self.out = open(self.tmp, "wb")
+        self.bytes_out = 0
+        self.cpu_sec = 0.0
+        self.started = time.perf_counter()
+
+    def write(self, data, cpu_sec):
+        self.out.write(data)
+        self.bytes_out += len(data)
+        self.cpu_sec += cpu_sec
+
+    def finish(self, trailer=b""):
+        if trailer:
+            self.out.write(trailer)
+            self.bytes_out += len(trailer)
+        self.out.close()
+        os.replace(self.tmp, self.dst)
+        seconds = time.perf_counter() - self.started
+        return {
+            "source": self.src,
+            "output": self.dst,
+            "size_in": self.size,
+            "size_out": self.bytes_out,
+            "seconds": round(seconds, 3),
+            "cpu_sec": round(self.cpu_sec, 3),
+        }
+
+    def abort(self):
+        self.out.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+
+def _rates(report, raw_key):
+    seconds = max(report["seconds"], 1e-6)
+    packed = report["size_out"] if raw_key == "size_in" else report["size_in"]
+    report["ratio"] = round(report[raw_key] / packed, 3) if packed else 0.0
+    report["MBps"] = round(report[raw_key] / MiB / seconds, 2)
+    # average cores kept busy while this file was in flight
+    report["cpu_cores"] = round(report["cpu_sec"] / seconds, 2)
+    return report
+
+
+def _run_ordered(executor, jobs, window, raw_key, on_file=None):
+    """Submit (FileJob, fn, tasks, trailer) work, write results in order, report each finished file."""
+    pending = deque()
+    reports = []
+
+    def drain_one():
+        job, future, last, trailer = pending.popleft()
+        try:
+            data, cpu = future.result()
+        except Exception:
+            job.abort()
+            raise
+        job.write(data, cpu)
+        if last:
+            report = _rates(job.finish(trailer), raw_key)
+            reports.append(report)
+            if on_file:
+                on_file(report)
+
+    for job, fn, tasks, trailer in jobs:
+        for i, args in enumerate(tasks):
+            pending.append((job, executor.submit(fn, *args), i == len(tasks) - 1, trailer))
+            while len(pending) > window:
+                drain_one()
+    while pending:
+        drain_one()
+    return reports
+
+
+def iter_files(paths, suffixes=()):
+    """Regular files under `paths` (files or directories), skipping names ending in `suffixes`."""
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if suffixes and name.lower().endswith(suffixes):
+                    continue
+                yield os.path.join(root, name)
+
+
+def _output_path(src, root, outdir, suffix):
+    if outdir is None:
+        return src + suffix
+    rel = os.path.relpath(src, root) if root and os.path.isdir(root) else os.path.basename(src)
+    dst = os.path.join(outdir, rel + suffix)
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    return dst
+
+
+def compress_paths(paths, codec="bz2", level=None, block_mb=None, workers=None, outdir=None,
+                   skip_ext=(".bz2", ".gz", ".bgz", ".zst", ".xz", ".zip", ".bam", ".cram", ".sra", ".part"),
+                   on_file=None):
+    """Compress every file under `paths` to `<file><suffix>` (or under `outdir`) on a process pool.
+
+    Blocks of all files share one pool, so a directory of small files
+    keeps every core busy just like one large file does. Returns one
+    report dict per file: sizes, ratio, seconds, MB/s and cpu_cores.
+    """
+    level = DEFAULT_LEVEL[codec] if level is None else level
+    block_size = (block_mb or DEFAULT_BLOCK_MB[codec]) * MiB
+    workers = workers or os.cpu_count() or 1
+    suffix = SUFFIX[codec]
+    skip = tuple(e.lower() for e in skip_ext)
+
+    def jobs():
+        for root in paths:
+            for src in iter_files([root], skip):
+                size = os.path.getsize(src)
+                job = FileJob(src, _output_path(src, root, outdir, suffix), size)
+                # an empty file still gets one (empty) block, so the output is a valid stream
+                tasks = [(codec, level, src, off, min(block_size, size - off))
+                         for off in range(0, max(size, 1), block_size)]
+                yield job, _compress_range, tasks, stream_trailer(codec)
+
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        return _run_ordered(ex, jobs(), 2 * workers, "size_in", on_file)
+
+
+def detect_codec(path):
+    """'bz2', 'gzip' or 'bgzf' for streams this module can split, 'gzip-plain' for other gzip, else None."""
+    with open(path, "rb") as f:
+        head = f.read(18)
+    if head[:3] == b"BZh":
+        return "bz2"
+    if head[:2] != b"\x1f\x8b":
+        return None
+    if len(head) >= 16 and head[3] & 4:
+        if head[12:14] == b"BC":
+            return "bgzf"
+        if head[12:14] == GZIP_MEMBER_FIELD:
+            return "gzip"
+    return "gzip-plain"
+
+
+def _member_ranges(path, group_bytes):
+    """(offset, length) groups of whole gzip members, found by walking the BC/PZ size fields."""
+    size = os.path.getsize(path)
+    offset, start = 0, 0
+    with open(path, "rb") as f:
+        while offset < size:
+            f.seek(offset)
+            head = f.read(12)
+            if len(head) < 12 or head[:2] != b"\x1f\x8b" or not head[3] & 4:
+                raise ValueError(f"{path}: no member header at byte {offset}")
+            extra = f.read(struct.unpack("<H", head[10:12])[0])
+            i, member = 0, None
+            while i + 4 <= len(extra):
+                field, flen = extra[i:i + 2], struct.unpack("<H", extra[i + 2:i + 4])[0]
+                if field == b"BC" and flen == 2:
+                    member = struct.unpack("<H", extra[i + 4:i + 6])[0] + 1
+                elif field == GZIP_MEMBER_FIELD and flen == 4:
+                    member = struct.unpack("<I", extra[i + 4:i + 8])[0]
+                i += 4 + flen
+            if not member:
+                raise ValueError(f"{path}: member at byte {offset} has no size field")
+            offset += member
+            if offset - start >= group_bytes:
+                yield start, offset - start
+                start = offset
+    if offset > start:
+        yield start, offset - start
+
+
+def _bz2_ranges(path, group_bytes, scan_bytes=16 * MiB):
+    """(offset, length) groups of whole bzip2 streams, split where a stream header starts."""
+    size = os.path.getsize(path)
+    starts = [0]
+    tail = b""
+    pos = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(scan_bytes), b""):
+            buf = tail + chunk
+            base = pos - len(tail)
+            i = buf.find(b"BZh", 1 if base == 0 else 0)
+            while i != -1:
+                if buf[i + 3:i + 4].isdigit() and buf[i + 4:i + 10] == BZ2_STREAM_MAGIC and base + i > starts[-1]:
+                    if base + i - starts[-1] >= group_bytes:
+                        starts.append(base + i)
+                i = buf.find(b"BZh", i + 1)
+            tail = buf[-9:]
+            pos += len(chunk)
+    bounds = starts + [size]
+    return [(a, b - a) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def _decompress_sequential(src, dst, codec):
+    """Single-stream decode for files without a usable block layout."""
+    started, cpu = time.perf_counter(), time.process_time()
+    opener = bz2.open if codec == "bz2" else gzip.open
+    with opener(src, "rb") as f, open(dst + ".part", "wb") as out:
+        for block in iter(lambda: f.read(4 * MiB), b""):
+            out.write(block)
+    os.replace(dst + ".part", dst)
+    return _rates({"source": src, "output": dst, "size_in": os.path.getsize(src), "size_out": os.path.getsize(dst),
+                   "seconds": round(time.perf_counter() - started, 3),
+                   "cpu_sec": round(time.process_time() - cpu, 3)}, "size_out")
+
+
+def _strip_suffix(path):
+    for suffix in (".bz2", ".gz", ".bgz"):
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path + ".out"
+
+
+def decompress_paths(paths, workers=None, outdir=None, group_mb=4, on_file=None):
+    """Decompress .bz2/.gz files, in parallel where their member layout allows it.
+
+    A file whose block layout does not check out (a false bzip2 magic
+    match inside compressed data, a foreign member appended to our
+    output) is redone sequentially.
+    """
+    workers = workers or os.cpu_count() or 1
+    reports = []
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        for root in paths:
+            for src in iter_files([root]):
+                if src != root and not src.endswith((".bz2", ".gz", ".bgz")):
+                    continue
+                codec = detect_codec(src)
+                if codec is None:
+                    print(f"[SKIP] {src}: not a gzip/bzip2 file", file=sys.stderr)
+                    continue
+                dst = _output_path(_strip_suffix(src), root, outdir, "")
+                if codec == "gzip-plain":
+                    report = _decompress_sequential(src, dst, "gzip")
+                else:
+                    try:
+                        ranges = (_bz2_ranges(src, group_mb * MiB) if codec == "bz2"
+                                  else list(_member_ranges(src, group_mb * MiB))) or [(0, 0)]
+                        job = FileJob(src, dst, os.path.getsize(src))
+                        tasks = [(codec, src, off, length) for off, length in ranges]
+                        report = _run_ordered(ex, [(job, _decompress_range, tasks, b"")], 2 * workers, "size_out")[0]
+                    except (ValueError, OSError, EOFError) as e:
+                        print(f"[SEQUENTIAL] {src}: {e}", file=sys.stderr)
+                        report = _decompress_sequential(src, dst, "bz2" if codec == "bz2" else "gzip")
+                reports.append(report)
+                if on_file:
+                    on_file(report)
+    return reports
+
+
+# ---- CLI ----
+
+def print_report(report):
+    print(f"[OK] {report['source']} -> {report['output']} | {report['size_in']/MiB:.1f} MiB -> "
+          f"{report['size_out']/MiB:.1f} MiB (ratio {report['ratio']:.2f}) | {report['seconds']:.2f}s | "
+          f"{report['MBps']:.1f} MB/s | {report['cpu_cores']:.1f} cores")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Block-parallel bz2/gzip/BGZF compression and decompression")
+    sub = ap.add_subparsers(dest="command", required=True)
+    c = sub.add_parser("compress", help="Compress files or directory trees")
+    c.add_argument("paths", nargs="+", help="Files or directories")
+    c.add_argument("--codec", choices=CODECS, default="bz2", help="Output format (default bz2)")
+    c.add_argument("--level", type=int, default=None, help="Codec level (default bz2 9, gzip/bgzf 6)")
+    c.add_argument("--block-mb", type=int, default=None, help="Independent block size in MiB (default bz2 8, gzip/bgzf 4)")
+    d = sub.add_parser("decompress", help="Decompress .bz2/.gz files, in parallel when possible")
+    d.add_argument("paths", nargs="+", help="Files or directories")
+    for p in (c, d):
+        p.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (default: CPU count)")
+        p.add_argument("--outdir", default=None, help="Write outputs here, keeping relative paths (default: next to each input)")
+        p.add_argument("--remove", action="store_true", help="Delete each input once its output is complete")
+        p.add_argument("--report", default=None, help="Also write the per-file reports as JSON to this path")
+    args = ap.parse_args()
+
+    def on_file(report):
+        print_report(report)
+        if args.remove:
+            os.remove(report["source"])
+
+    t0 = time.perf_counter()
+    if args.command == "compress":
+        reports = compress_paths(args.paths, args.codec, args.level, args.block_mb, args.workers, args.outdir,
+                                 on_file=on_file)
+    else:
+        reports = decompress_paths(args.paths, args.workers, args.outdir, on_file=on_file)
+    seconds = time.perf_counter() - t0
+    size_in = sum(r["size_in"] for r in reports)
+    size_out = sum(r["size_out"] for r in reports)
+    raw = size_in if args.command == "compress" else size_out
+    print(f"Done: {len(reports)} files, {size_in/MiB:.1f} MiB -> {size_out/MiB:.1f} MiB in {seconds:.2f}s "
+          f"({raw/MiB/max(seconds, 1e-6):.1f} MB/s, {sum(r['cpu_sec'] for r in reports)/max(seconds, 1e-6):.1f} cores)")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"command": args.command, "seconds": round(seconds, 3), "files": reports}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
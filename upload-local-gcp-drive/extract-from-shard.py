@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+import argparse, json, sys, tarfile
+from pathlib import Path
+from google.cloud import storage
+
+def split_gs_uri(uri: str):
+    if not uri.startswith("gs://"):
+        raise ValueError(f"Not a gs:// URI: {uri}")
+    bucket, _, name = uri[len("gs://"):].partition("/")
+    return bucket, name
+
+def load_index(client, index_uri: str):
+    """Read a <shard>.index.jsonl sidecar written by upload-to-gcp.py --bundle-under-kb."""
+    bucket, name = split_gs_uri(index_uri)
+    body = client.bucket(bucket).blob(name).download_as_text()
+    return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+def read_member(client, entry) -> bytes:
+    """Return the bytes of one bundled file without downloading the whole shard.
+
+    Uncompressed shards are read with a single ranged GET at the recorded
+    offset. Gzip shards have no random access, so the shard is streamed and
+    decompressed only up to the wanted member.
+    """
+    bucket, name = split_gs_uri(entry["shard"])
+    blob = client.bucket(bucket).blob(name)
+    if entry.get("compression", "none") == "none":
+        if entry["size"] == 0:
+            return b""
+        return blob.download_as_bytes(start=entry["offset"], end=entry["offset"] + entry["size"] - 1)
+    with blob.open("rb") as raw, tarfile.open(fileobj=raw, mode="r|gz") as tar:
+        for info in tar:
+            if info.name == entry["path"]:
+                return tar.extractfile(info).read()
+    raise KeyError(f"{entry['path']} not found in {entry['shard']}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Extract files from tar shards uploaded by upload-to-gcp.py --bundle-under-kb")
+    ap.add_argument("index_uri", help="gs://bucket/.../<shard>.index.jsonl")
+    ap.add_argument("paths", nargs="*", help="Bundled paths to extract (default: list the index)")
+    ap.add_argument("--out", default=".", help="Output directory (default: current directory)")
+    args = ap.parse_args()
+
+    client = storage.Client()
+    entries = load_index(client, args.index_uri)
+    if not args.paths:
+        for e in entries:
+            print(f"{e['path']}\t{e['size']}\t{e['offset']}")
+        return
+
+    by_path = {e["path"]: e for e in entries}
+    out_dir = Path(args.out)
+    missing = 0
+    for p in args.paths:
+        entry = by_path.get(p)
+        if entry is None:
+            print(f"[FAIL] {p}: not in index", file=sys.stderr)
+            missing += 1
+            continue
+        dest = out_dir / entry["path"]
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_bytes(read_member(client, entry))
+        print(f"[OK] {entry['shard']}#{entry['path']} -> {dest}")
+    if missing:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
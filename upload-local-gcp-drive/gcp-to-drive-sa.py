@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""Copy GCS -> Drive with several service accounts at once, each within its daily quota.
+
+gcp-to-drive-sa.sh uses one service account (SA) at a time and moves to
+the next only after a 750 GB/day cap or a 403, so throughput is one
+account's worth. Here the source listing is split by bytes across every
+SA that still has quota, and all of them copy concurrently.
+
+Bytes each SA uploads are recorded in a SQLite ledger. Remaining quota
+is therefore known across runs (rolling 24 h, as Drive counts it). When
+an SA hits its cap or upload limit, its unfinished files go to the SAs
+that still have room. Copied files are recorded too, so a rerun only
+copies what is left.
+
+The transfer backend is `RcloneBackend`, which runs rclone through
+--rclone; a stub executable with the same CLI can replace it in tests.
+"""
+import argparse, json, os, re, sqlite3, subprocess, sys, tempfile, threading, time
+from collections import deque
+from pathlib import Path
+
+DAY_SEC = 24 * 3600
+# a plain number is KiB, as in rclone; "B" means bytes
+UNITS = {"": 1 << 10, "B": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+# rclone exit codes that mean "this account is done for now"
+EXHAUSTED_CODES = {7: "fatal error (upload limit with --drive-stop-on-upload-limit)", 8: "--max-transfer reached"}
+
+
+def parse_size(text: str) -> int:
+    """rclone-style size: 750G, 64M, 1.5T, 1024B; a plain number is KiB."""
+    m = re.fullmatch(r"\s*([\d.]+)\s*([BKMGT]?)(?:I?B)?\s*", text.upper())
+    if not m:
+        raise argparse.ArgumentTypeError(f"bad size: {text}")
+    return int(float(m.group(1)) * UNITS[m.group(2)])
+
+
+def fmt_size(n: int) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(n) < 1024:
+            return f"{n:.1f} {unit}" if unit != "B" else f"{n} B"
+        n /= 1024
+    return f"{n:.1f} TiB"
+
+
+class QuotaLedger:
+    """SQLite record of bytes uploaded per SA, exhaustion events, and files already copied."""
+
+    def __init__(self, path: Path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS usage (sa TEXT NOT NULL, bytes INTEGER NOT NULL, at REAL NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS exhausted (sa TEXT PRIMARY KEY, at REAL NOT NULL, reason TEXT)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS copied ("
+                " src TEXT NOT NULL, dst TEXT NOT NULL, path TEXT NOT NULL, size_bytes INTEGER NOT NULL,"
+                " sa TEXT NOT NULL, at REAL NOT NULL, PRIMARY KEY (src, dst, path))"
+            )
+            self._conn.commit()
+
+    def used(self, sa: str, now: float = None) -> int:
+        """Bytes uploaded by `sa` in the last 24 h."""
+        now = now or time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM usage WHERE sa = ? AND at > ?",
+                                     (sa, now - DAY_SEC)).fetchone()
+        return row[0]
+
+    def add(self, sa: str, nbytes: int):
+        if nbytes <= 0:
+            return
+        with self._lock:
+            self._conn.execute("INSERT INTO usage VALUES (?, ?, ?)", (sa, nbytes, time.time()))
+            self._conn.commit()
+
+    def exhausted_until(self, sa: str) -> float:
+        """When an SA that hit a limit may be tried again (0 if it never did)."""
+        with self._lock:
+            row = self._conn.execute("SELECT at FROM exhausted WHERE sa = ?", (sa,)).fetchone()
+        return row[0] + DAY_SEC if row else 0.0
+
+    def mark_exhausted(self, sa: str, reason: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO exhausted VALUES (?, ?, ?)", (sa, time.time(), reason))
+            self._conn.commit()
+
+    def copied(self, src: str, dst: str):
+        with self._lock:
+            return {r[0] for r in self._conn.execute("SELECT path FROM copied WHERE src = ? AND dst = ?", (src, dst))}
+
+    def mark_copied(self, src: str, dst: str, files, sa: str):
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO copied VALUES (?, ?, ?, ?, ?, ?)",
+                                   [(src, dst, f["Path"], f["Size"], sa, time.time()) for f in files])
+            self._conn.commit()
+
+    def prune(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM usage WHERE at < ?", (time.time() - 2 * DAY_SEC,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RcloneBackend:
+    """Lists with `rclone lsjson` and copies a file list with `rclone copy --files-from-raw`."""
+
+    def __init__(self, rclone: str = "rclone", transfers: int = 4, checkers: int = 8, chunk: str = "64M",
+                 bwlimit: str = "", shared: bool = False, log_level: str = "INFO", log_dir: Path = None):
+        self.rclone = rclone
+        self.transfers = transfers
+        self.checkers = checkers
+        self.chunk = chunk
+        self.bwlimit = bwlimit
+        self.shared = shared
+        self.log_level = log_level
+        self.log_dir = log_dir
+
+    def list(self, src: str):
+        """[{"Path", "Size"}] of every file under src."""
+        out = subprocess.run([self.rclone, "lsjson", "-R", "--files-only", "--fast-list", src],
+                             check=True, capture_output=True, text=True).stdout
+        return [{"Path": e["Path"], "Size": int(e.get("Size", 0))} for e in json.loads(out or "[]")]
+
+    def copy(self, src: str, dst: str, files, sa_file: str, max_transfer: int, on_copied, on_bytes):
+        """Copy `files` with one SA; returns rclone's exit code.
+
+        Reads rclone's JSON log as it runs: each "Copied" line calls
+        `on_copied(path)`, each stats line calls `on_bytes(bytes_so_far)`.
+        """
+        with tempfile.NamedTemporaryFile("w", suffix=".files", delete=False) as fl:
+            fl.write("".join(f["Path"] + "\n" for f in files))
+        cmd = [self.rclone, "copy", src, dst, "--files-from-raw", fl.name,
+               "--drive-service-account-file", sa_file, "--drive-stop-on-upload-limit",
+               "--max-transfer", f"{max_transfer}B", "--cutoff-mode", "soft",
+               f"--transfers={self.transfers}", f"--checkers={self.checkers}", f"--drive-chunk-size={self.chunk}",
+               "--ignore-existing", "--no-traverse", "--use-json-log", f"--log-level={self.log_level}",
+               "--stats", "5s", "--stats-log-level", self.log_level]
+        if self.bwlimit:
+            cmd += ["--bwlimit", self.bwlimit]
+        if self.shared:
+            cmd.append("--drive-shared-with-me")
+        log = open(self.log_dir / f"rclone_{Path(sa_file).stem}.log", "a") if self.log_dir else None
+        try:
+            proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            for line in proc.stderr:
+                if log:
+                    log.write(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if "stats" in entry:
+                    on_bytes(int(entry["stats"].get("bytes", 0)))
+                elif entry.get("object") and "Copied" in entry.get("msg", ""):
+                    on_copied(entry["object"])
+            return proc.wait()
+        finally:
+            if log:
+                log.close()
+            os.remove(fl.name)
+
+
+class Account:
+    def __init__(self, sa_file: str, quota: int):
+        self.sa_file = sa_file
+        self.name = Path(sa_file).stem
+        self.quota = quota
+        self.queue = deque()
+        self.used = 0          # bytes in the last 24 h, from the ledger plus this run
+        self.copied_bytes = 0  # this run only
+        self.state = "idle"
+        self.reason = ""
+
+    @property
+    def headroom(self) -> int:
+        return max(0, self.quota - self.used)
+
+
+class MultiSATransfer:
+    """Splits a listing across accounts by bytes and runs one copy loop per account.
+
+    Each account copies its share in batches of up to `batch_bytes`.
+    It never goes past what is left of its quota. An account whose own
+    share is done takes files from the account with the most bytes still
+    queued. On an exhausting exit code the account is recorded as
+    exhausted for 24 h, and its remaining files go back to the others.
+    """
+
+    def __init__(self, backend, ledger: QuotaLedger, accounts, src: str, dst: str,
+                 batch_bytes: int, retries: int = 2, progress_interval: float = 10, sleep_sec: float = 5):
+        self.backend = backend
+        self.ledger = ledger
+        self.accounts = accounts
+        self.src = src
+        self.dst = dst
+        self.batch_bytes = batch_bytes
+        self.retries = retries
+        self.progress_interval = progress_interval
+        self.sleep_sec = sleep_sec
+        self.total_files = 0
+        self.total_bytes = 0
+        self.done_bytes = 0
+        self.done_files = 0
+        self.failed = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def plan(self, files):
+        """Assign files (largest first) to the active account with the most unassigned headroom."""
+        active = [a for a in self.accounts if a.state != "exhausted"]
+        planned = {a.name: 0 for a in active}
+        leftover = []
+        for f in sorted(files, key=lambda f: -f["Size"]):
+            best = max(active, key=lambda a: a.headroom - planned[a.name], default=None)
+            if best is None or best.headroom - planned[best.name] < f["Size"]:
+                leftover.append(f)
+                continue
+            best.queue.append(f)
+            planned[best.name] += f["Size"]
+        self.total_files = len(files)
+        self.total_bytes = sum(f["Size"] for f in files)
+        return leftover
+
+    def _take(self, acct: Account):
+        """Next batch for `acct`: its own queue first, else steal from the busiest queue."""
+        with self._lock:
+            limit = min(self.batch_bytes, acct.headroom)
+            batch, size = [], 0
+            sources = [acct.queue] + sorted((a.queue for a in self.accounts if a is not acct),
+                                            key=lambda q: -sum(f["Size"] for f in q))
+            for queue in sources:
+                skipped = deque()
+                while queue and (not batch or size + queue[0]["Size"] <= limit):
+                    f = queue.popleft()
+                    if f["Size"] > acct.headroom:
+                        skipped.append(f)
+                        continue
+                    batch.append(f)
+                    size += f["Size"]
+                queue.extendleft(reversed(skipped))
+                if batch:
+                    return batch
+            return batch
+
+    def _give_back(self, acct: Account, files):
+        """Hand files to the accounts that still have room (most headroom first)."""
+        with self._lock:
+            files = list(files) + list(acct.queue)
+            acct.queue.clear()
+            others = sorted((a for a in self.accounts if a.state != "exhausted"), key=lambda a: -a.headroom)
+            for i, f in enumerate(sorted(files, key=lambda f: -f["Size"])):
+                if others:
+                    others[i % len(others)].queue.append(f)
+                else:
+                    acct.queue.append(f)  # nobody has room; reported as left over at the end
+
+    def _worker(self, acct: Account):
+        attempts = 0
+        while not self._stop.is_set():
+            if acct.headroom <= 0:  # --max-transfer 0 would mean unlimited
+                acct.state, acct.reason = "exhausted", "quota used up"
+                self._give_back(acct, [])
+                return
+            batch = self._take(acct)
+            if not batch:
+                # an account still copying may yet give files back when it runs out of quota
+                if any(a.state == "copying" for a in self.accounts if a is not acct):
+                    acct.state = "waiting"
+                    time.sleep(1)
+                    continue
+                acct.state = "done"
+                return
+            acct.state = "copying"
+            pending = {f["Path"]: f for f in batch}
+            seen = {"bytes": 0}
+
+            def on_copied(path, acct=acct, pending=pending):
+                f = pending.pop(path, None)
+                if f:
+                    self.ledger.mark_copied(self.src, self.dst, [f], acct.name)
+                    with self._lock:
+                        self.done_files += 1
+                        self.done_bytes += f["Size"]
+                        acct.copied_bytes += f["Size"]
+
+            def on_bytes(total, acct=acct, seen=seen):
+                # stats are cumulative per rclone run; record the increase against the quota
+                delta = total - seen["bytes"]
+                if delta > 0:
+                    seen["bytes"] = total
+                    self.ledger.add(acct.name, delta)
+                    with self._lock:
+                        acct.used += delta
+
+            code = self.backend.copy(self.src, self.dst, batch, acct.sa_file, acct.headroom, on_copied, on_bytes)
+            if code == 0:
+                # --ignore-existing skips files already at the destination without a "Copied" line
+                if pending:
+                    self.ledger.mark_copied(self.src, self.dst, list(pending.values()), acct.name)
+                    with self._lock:
+                        self.done_files += len(pending)
+                        self.done_bytes += sum(f["Size"] for f in pending.values())
+                attempts = 0
+                continue
+            if code in EXHAUSTED_CODES:
+                acct.state, acct.reason = "exhausted", EXHAUSTED_CODES[code]
+                self.ledger.mark_exhausted(acct.name, acct.reason)
+                print(f"[SA] {acct.name} exhausted ({acct.reason}) after {fmt_size(acct.used)} in 24h; "
+                      f"reassigning {len(pending) + len(acct.queue)} files", file=sys.stderr)
+                self._give_back(acct, pending.values())
+                return
+            attempts += 1
+            if attempts > self.retries:
+                with self._lock:
+                    self.failed += list(pending.values())
+                print(f"[SA] {acct.name}: rclone exited {code}, giving up on {len(pending)} files", file=sys.stderr)
+                attempts = 0
+                continue
+            print(f"[SA] {acct.name}: rclone exited {code}, retrying {len(pending)} files in {self.sleep_sec}s",
+                  file=sys.stderr)
+            with self._lock:
+                acct.queue.extendleft(reversed(list(pending.values())))
+            time.sleep(self.sleep_sec)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "files": f"{self.done_files}/{self.total_files}",
+                "bytes": self.done_bytes,
+                "total_bytes": self.total_bytes,
+                "accounts": {a.name: {"state": a.state, "used_24h": a.used, "copied": a.copied_bytes,
+                                      "queued": len(a.queue)} for a in self.accounts},
+            }
+
+    def _progress(self, started: float):
+        last_bytes, last_t = 0, started
+        while not self._stop.wait(self.progress_interval):
+            s = self.snapshot()
+            now = time.time()
+            rate = (s["bytes"] - last_bytes) / max(now - last_t, 1e-6) / (1 << 20)
+            last_bytes, last_t = s["bytes"], now
+            active = sum(1 for a in s["accounts"].values() if a["state"] == "copying")
+            print(f"[PROGRESS] {s['files']} files, {fmt_size(s['bytes'])}/{fmt_size(s['total_bytes'])}, "
+                  f"{rate:.1f} MB/s, {active} SA copying", file=sys.stderr)
+
+    def run(self):
+        started = time.time()
+        threads = [threading.Thread(target=self._worker, args=(a,), name=f"sa-{a.name}", daemon=True)
+                   for a in self.accounts if a.queue or a.state != "exhausted"]
+        progress = threading.Thread(target=self._progress, args=(started,), daemon=True) if self.progress_interval else None
+        if progress:
+            progress.start()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self._stop.set()
+        return [f for a in self.accounts for f in a.queue]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Copy GCS -> Drive with several service accounts concurrently, tracking each account's daily quota")
+    ap.add_argument("--sa-dir", required=True, help="Directory of service account JSON files")
+    ap.add_argument("--src", required=True, help="Source remote, e.g. gcs:bucket/path")
+    ap.add_argument("--dst", required=True, help="Destination remote, e.g. gdrive_sa:folder/path")
+    ap.add_argument("--accounts", type=int, default=0, help="How many SAs copy at once (default: all with quota left)")
+    ap.add_argument("--quota", type=parse_size, default=parse_size("750G"), help="Upload quota per SA per 24h (default 750G)")
+    ap.add_argument("--batch", type=parse_size, default=parse_size("50G"), help="Bytes per rclone run (default 50G)")
+    ap.add_argument("--transfers", type=int, default=4, help="rclone --transfers per SA (default 4)")
+    ap.add_argument("--checkers", type=int, default=8, help="rclone --checkers per SA (default 8)")
+    ap.add_argument("--chunk", default="64M", help="Drive chunk size (default 64M)")
+    ap.add_argument("--bwlimit", default="", help="rclone --bwlimit per SA (default none)")
+    ap.add_argument("--shared", action="store_true", help="Include --drive-shared-with-me")
+    ap.add_argument("--retries", type=int, default=2, help="Retries of a failed batch on the same SA (default 2)")
+    ap.add_argument("--sleep-sec", type=float, default=5, help="Wait before retrying a failed batch (default 5)")
+    ap.add_argument("--progress-interval", type=float, default=10, help="Seconds between [PROGRESS] lines (default 10, 0=off)")
+    ap.add_argument("--ledger", default=None, help="SQLite quota ledger (default ./logs/sa_quota.sqlite)")
+    ap.add_argument("--log-level", default="INFO", help="rclone log level (default INFO)")
+    ap.add_argument("--dry-run", action="store_true", help="Only print how the files would be split")
+    ap.add_argument("--rclone", default=os.environ.get("RCLONE", "rclone"), help="rclone executable (env RCLONE)")
+    args = ap.parse_args()
+
+    sa_files = sorted(str(p) for p in Path(args.sa_dir).glob("*.json"))
+    if not sa_files:
+        print(f"No Service Account JSON found in: {args.sa_dir}")
+        sys.exit(1)
+    log_dir = Path("./logs"); log_dir.mkdir(parents=True, exist_ok=True)
+    ledger = QuotaLedger(Path(args.ledger) if args.ledger else log_dir / "sa_quota.sqlite")
+    ledger.prune()
+
+    now = time.time()
+    accounts = []
+    for sa in sa_files:
+        acct = Account(sa, args.quota)
+        acct.used = ledger.used(acct.name, now)
+        if ledger.exhausted_until(acct.name) > now or acct.headroom == 0:
+            acct.state = "exhausted"
+        accounts.append(acct)
+    usable = [a for a in accounts if a.state != "exhausted"]
+    if args.accounts:
+        usable = sorted(usable, key=lambda a: -a.headroom)[:args.accounts]
+    print(f"{len(usable)} of {len(accounts)} service accounts have quota left: "
+          + ", ".join(f"{a.name} {fmt_size(a.headroom)}" for a in usable))
+
+    backend = RcloneBackend(args.rclone, args.transfers, args.checkers, args.chunk, args.bwlimit, args.shared,
+                            args.log_level, log_dir)
+    listing = backend.list(args.src)
+    done = ledger.copied(args.src, args.dst)
+    todo = [f for f in listing if f["Path"] not in done]
+    print(f"{len(listing)} files in {args.src}, {len(listing) - len(todo)} already copied, "
+          f"{len(todo)} to copy ({fmt_size(sum(f['Size'] for f in todo))})")
+
+    transfer = MultiSATransfer(backend, ledger, usable, args.src, args.dst, args.batch, args.retries,
+                               args.progress_interval, args.sleep_sec)
+    leftover = transfer.plan(todo)
+    for a in usable:
+        print(f"  {a.name}: {len(a.queue)} files, {fmt_size(sum(f['Size'] for f in a.queue))}")
+    if leftover:
+        print(f"  no quota today for {len(leftover)} files ({fmt_size(sum(f['Size'] for f in leftover))})")
+    if args.dry_run:
+        return
+
+    t0 = time.time()
+    leftover += transfer.run()
+    seconds = time.time() - t0
+    s = transfer.snapshot()
+    print(f"Copied {s['files']} files, {fmt_size(s['bytes'])} in {seconds:.1f}s "
+          f"({s['bytes'] / max(seconds, 1e-6) / (1 << 20):.1f} MB/s)")
+    for a in accounts:
+        print(f"  {a.name}: {a.state}{' (' + a.reason + ')' if a.reason else ''}, "
+              f"{fmt_size(a.copied_bytes)} this run, {fmt_size(a.used)} of {fmt_size(a.quota)} in 24h")
+    ledger.close()
+    if transfer.failed:
+        print(f">> {len(transfer.failed)} files failed; rerun to retry them.")
+    if leftover:
+        print(f">> All Service Accounts exhausted with {len(leftover)} files left. Add more SA or rerun after the quota resets.")
+    sys.exit(1 if transfer.failed else 2 if leftover else 0)
+
+
+if __name__ == "__main__":
+    main()
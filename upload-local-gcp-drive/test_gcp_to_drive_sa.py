@@ -0,0 +1,125 @@
+"""MultiSATransfer against a stub rclone: reassignment on an exhausted SA and the quota ledger.
+
+Run with `python -m unittest test_gcp_to_drive_sa` (or pytest) from this directory.
+"""
+import importlib.util
+import json
+import os
+import stat
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+_spec = importlib.util.spec_from_file_location("gcp_to_drive_sa", HERE / "gcp-to-drive-sa.py")
+sa = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(sa)
+
+# Same CLI as `rclone copy ... --use-json-log`. The size of each file is the part of its
+# path after the last "-". An SA listed in STUB_UPLOAD_LIMITS stops with exit code 7 once
+# the next file would take it past that many bytes, as --drive-stop-on-upload-limit does.
+STUB = r'''#!{python}
+import json, os, sys
+from pathlib import Path
+argv = sys.argv[1:]
+opt = lambda name: argv[argv.index(name) + 1]
+state = Path(os.environ["STUB_DIR"])
+sa = Path(opt("--drive-service-account-file")).stem
+max_transfer = opt("--max-transfer")
+with open(state / "calls.jsonl", "a") as f:
+    f.write(json.dumps({{"sa": sa, "max_transfer": max_transfer}}) + "\n")
+assert max_transfer.endswith("B"), max_transfer
+max_bytes = int(max_transfer[:-1])
+limit = json.loads(os.environ.get("STUB_UPLOAD_LIMITS", "{{}}")).get(sa)
+uploaded = state / f"uploaded_{{sa}}"
+done = int(uploaded.read_text()) if uploaded.exists() else 0
+sent = 0
+for path in Path(opt("--files-from-raw")).read_text().split():
+    size = int(path.rsplit("-", 1)[1])
+    if limit is not None and done + size > limit:
+        sys.exit(7)
+    if sent + size > max_bytes:
+        sys.exit(8)
+    done += size
+    sent += size
+    uploaded.write_text(str(done))
+    with open(state / "copied", "a") as f:
+        f.write(f"{{sa}} {{path}}\n")
+    print(json.dumps({{"level": "info", "msg": "Copied (new)", "object": path}}), file=sys.stderr)
+    print(json.dumps({{"level": "info", "msg": "stats", "stats": {{"bytes": sent}}}}), file=sys.stderr)
+'''
+
+
+class MultiSATransferTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        rclone = self.dir / "rclone"
+        rclone.write_text(STUB.format(python=sys.executable))
+        rclone.chmod(rclone.stat().st_mode | stat.S_IEXEC)
+        os.environ["STUB_DIR"] = str(self.dir)
+        self.backend = sa.RcloneBackend(str(rclone))
+        self.ledger = sa.QuotaLedger(self.dir / "quota.sqlite")
+
+    def tearDown(self):
+        self.ledger.close()
+        os.environ.pop("STUB_DIR", None)
+        os.environ.pop("STUB_UPLOAD_LIMITS", None)
+        self.tmp.cleanup()
+
+    def transfer(self, accounts, files, batch_bytes=2000):
+        t = sa.MultiSATransfer(self.backend, self.ledger, accounts, "gcs:src", "drive:dst", batch_bytes,
+                               retries=0, progress_interval=0, sleep_sec=0)
+        leftover = t.plan(files)
+        return t, leftover + t.run()
+
+    def copied(self):
+        lines = (self.dir / "copied").read_text().split("\n")
+        return [tuple(line.split()) for line in lines if line]
+
+    def calls(self):
+        return [json.loads(line) for line in (self.dir / "calls.jsonl").read_text().splitlines()]
+
+    def test_exhausted_account_hands_its_files_to_the_others(self):
+        os.environ["STUB_UPLOAD_LIMITS"] = json.dumps({"sa1": 3000})
+        files = [{"Path": f"data/f{i:02d}-500", "Size": 500} for i in range(20)]
+        accounts = [sa.Account("sa1.json", 1 << 20), sa.Account("sa2.json", 1 << 20)]
+        t, leftover = self.transfer(accounts, files)
+
+        self.assertEqual(leftover, [])
+        self.assertEqual(t.failed, [])
+        copied = self.copied()
+        self.assertEqual(sorted(p for _, p in copied), sorted(f["Path"] for f in files))
+        self.assertEqual(sum(1 for s, _ in copied if s == "sa1"), 6)
+        self.assertEqual(accounts[0].state, "exhausted")
+        self.assertEqual(accounts[0].reason, sa.EXHAUSTED_CODES[7])
+        self.assertGreater(self.ledger.exhausted_until("sa1"), 0)
+        self.assertEqual(self.ledger.exhausted_until("sa2"), 0)
+        self.assertEqual(self.ledger.copied("gcs:src", "drive:dst"), {f["Path"] for f in files})
+        self.assertEqual(self.ledger.used("sa1"), 3000)
+        self.assertEqual(self.ledger.used("sa2"), 7000)
+
+    def test_max_transfer_is_the_headroom_in_bytes(self):
+        files = [{"Path": f"data/f{i:02d}-400", "Size": 400} for i in range(10)]
+        sa1 = sa.Account("sa1.json", 2000)
+        sa1.used = 400
+        sa2 = sa.Account("sa2.json", 2400)
+        t, leftover = self.transfer([sa1, sa2], files, batch_bytes=10000)
+
+        self.assertEqual(leftover, [])
+        first = next(c for c in self.calls() if c["sa"] == "sa1")
+        self.assertEqual(first["max_transfer"], "1600B")
+        self.assertEqual(sa1.used, 2000)
+        self.assertEqual(sa1.state, "exhausted")
+        self.assertEqual(len(self.ledger.copied("gcs:src", "drive:dst")), 10)
+
+    def test_parse_size_reads_plain_numbers_as_kib(self):
+        self.assertEqual(sa.parse_size("750G"), 750 << 30)
+        self.assertEqual(sa.parse_size("64MiB"), 64 << 20)
+        self.assertEqual(sa.parse_size("1024B"), 1024)
+        self.assertEqual(sa.parse_size("100"), 100 << 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
-import argparse, csv, os, sys, time, math, random
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse, base64, csv, hashlib, io, json, os, sqlite3, sys, tarfile, tempfile, threading, time, math, random
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 from datetime import timezone, timedelta
+import google_crc32c
+import requests
 from google.cloud import storage
 from google.api_core.retry import Retry
 
+try:
+    import zstandard
+except ImportError:  # optional, only needed for --compress zstd
+    zstandard = None
+
+import blockzip  # sibling module, standard library only
+
 # ---- Timezone (robust) ----
 try:
     from zoneinfo import ZoneInfo
@@ -14,13 +24,930 @@ except Exception:
     # Fallback to fixed UTC+7 if tz database missing
     TZ = timezone(timedelta(hours=7))
 
-def iter_files(src: Path):
+MiB = 1024 * 1024
+# GCS compose accepts at most 32 source objects per request
+COMPOSE_MAX_SOURCES = 32
+
+CSV_FIELDS = [
+    "timestamp_local",
+    "source_path",
+    "gcs_uri",
+    "size_bytes",
+    "duration_sec",
+    "throughput_MBps",
+    "wire_bytes",
+    "wire_MBps",
+    "status",
+    "crc32c",
+    "md5",
+    "chunk_mb",
+    "workers_limit",
+    "retries",
+]
+
+def scan_files(src: Path):
+    """Yield (path, stat_result) for every file under src, streaming.
+
+    Uses os.scandir so the stat result comes from the directory walk and is
+    handed to the uploader instead of being re-fetched per file.
+    """
     if src.is_file():
-        yield src
-    else:
-        for p in src.rglob("*"):
-            if p.is_file():
-                yield p
+        yield src, src.stat()
+        return
+    stack = [str(src)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError as e:
+            print(f"[SKIP] {e}", file=sys.stderr)
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        yield Path(entry.path), entry.stat()
+                except OSError as e:
+                    print(f"[SKIP] {entry.path}: {e}", file=sys.stderr)
+
+def schedule(entries, order: str, window: int):
+    """Reorder a stream of (path, stat) within a bounded look-ahead window.
+
+    'scan' keeps discovery order; 'largest-first' starts big files early so
+    one of them does not finish last; 'interleave' alternates largest and
+    smallest so big and small uploads share the link.
+    """
+    if order == "scan":
+        yield from entries
+        return
+    buf = []
+
+    def flush():
+        buf.sort(key=lambda e: e[1].st_size, reverse=True)
+        if order == "largest-first":
+            yield from buf
+        else:
+            lo, hi = 0, len(buf) - 1
+            while lo <= hi:
+                yield buf[lo]
+                if lo != hi:
+                    yield buf[hi]
+                lo += 1; hi -= 1
+        buf.clear()
+
+    for e in entries:
+        buf.append(e)
+        if len(buf) >= window:
+            yield from flush()
+    yield from flush()
+
+def blob_name_for(local_path: Path, dest_prefix: str, source_root: Path) -> str:
+    rel = local_path.relative_to(source_root) if source_root.is_dir() else local_path.name
+    return f"{dest_prefix}{rel}".replace("\\", "/")
+
+def file_crc32c(path: Path) -> str:
+    """Base64 big-endian CRC32C of a local file, the same encoding GCS reports."""
+    crc = google_crc32c.Checksum()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(8 * MiB), b""):
+            crc.update(block)
+    return base64.b64encode(crc.digest()).decode("ascii")
+
+def list_remote(client, bucket_name: str, dest_prefix: str):
+    """One paginated listing of the destination prefix: {blob_name: (size, crc32c)}.
+
+    Compressed objects report the size/crc32c of their source file (src-size,
+    src-crc32c metadata), so they compare directly against local files.
+    """
+    remote = {}
+    for b in client.list_blobs(
+        bucket_name, prefix=dest_prefix or None, fields="items(name,size,crc32c,metadata),nextPageToken"
+    ):
+        meta = b.metadata or {}
+        if "src-size" in meta:
+            remote[b.name] = (int(meta["src-size"]), meta.get("src-crc32c"))
+        else:
+            remote[b.name] = (b.size, b.crc32c)
+    return remote
+
+class Manifest:
+    """Local SQLite record of (size, mtime, crc32c) for every file already in the bucket.
+
+    Lets --sync skip unchanged files without opening them: if size and mtime
+    still match the manifest, the recorded crc32c stands in for the file.
+    """
+
+    def __init__(self, path: Path):
+        self._conn = sqlite3.connect(str(path))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " source_path TEXT NOT NULL, gcs_uri TEXT NOT NULL,"
+            " size_bytes INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+            " crc32c TEXT NOT NULL, updated_local TEXT NOT NULL,"
+            " PRIMARY KEY (source_path, gcs_uri))"
+        )
+        self._pending = 0
+
+    def load(self, uri_prefix: str):
+        """{(source_path, gcs_uri): (size, mtime_ns, crc32c)} for one destination prefix."""
+        rows = self._conn.execute(
+            "SELECT source_path, gcs_uri, size_bytes, mtime_ns, crc32c FROM files"
+            " WHERE substr(gcs_uri, 1, ?) = ?",
+            (len(uri_prefix), uri_prefix),
+        )
+        return {(r[0], r[1]): (r[2], r[3], r[4]) for r in rows}
+
+    def load_bundled(self, uri_prefix: str):
+        """{source_path: (size, mtime_ns, crc32c, member_uri)} for files packed into shards under a prefix.
+
+        Bundled members are stored with gcs_uri `<shard uri>#<offset>`; the
+        latest row wins when a file was bundled more than once.
+        """
+        rows = self._conn.execute(
+            "SELECT source_path, gcs_uri, size_bytes, mtime_ns, crc32c FROM files"
+            " WHERE substr(gcs_uri, 1, ?) = ? AND instr(gcs_uri, '#') > 0 ORDER BY updated_local",
+            (len(uri_prefix), uri_prefix),
+        )
+        return {r[0]: (r[2], r[3], r[4], r[1]) for r in rows}
+
+    def put(self, source_path: str, gcs_uri: str, size_bytes: int, mtime_ns: int, crc32c: str):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+            (source_path, gcs_uri, size_bytes, mtime_ns, crc32c,
+             time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime())),
+        )
+        self._pending += 1
+        if self._pending >= 500:
+            self._conn.commit()
+            self._pending = 0
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+class Journal:
+    """Local SQLite journal of open resumable upload sessions.
+
+    The session URI and the last offset GCS confirmed are written as each
+    chunk lands, so a rerun after a crash can continue from that byte.
+    Shared by all upload threads.
+    """
+
+    def __init__(self, path: Path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " source_path TEXT NOT NULL, gcs_uri TEXT NOT NULL,"
+                " size_bytes INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+                " session_url TEXT NOT NULL, offset INTEGER NOT NULL,"
+                " updated_local TEXT NOT NULL,"
+                " PRIMARY KEY (source_path, gcs_uri))"
+            )
+            self._conn.commit()
+
+    def get(self, source_path: str, gcs_uri: str):
+        """(size_bytes, mtime_ns, session_url, offset) or None."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT size_bytes, mtime_ns, session_url, offset FROM sessions"
+                " WHERE source_path = ? AND gcs_uri = ?",
+                (source_path, gcs_uri),
+            ).fetchone()
+
+    def start(self, source_path: str, gcs_uri: str, size_bytes: int, mtime_ns: int, session_url: str):
+        self._write(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, 0, ?)",
+            (source_path, gcs_uri, size_bytes, mtime_ns, session_url, self._now()),
+        )
+
+    def advance(self, source_path: str, gcs_uri: str, offset: int):
+        self._write(
+            "UPDATE sessions SET offset = ?, updated_local = ? WHERE source_path = ? AND gcs_uri = ?",
+            (offset, self._now(), source_path, gcs_uri),
+        )
+
+    def finish(self, source_path: str, gcs_uri: str):
+        self._write("DELETE FROM sessions WHERE source_path = ? AND gcs_uri = ?", (source_path, gcs_uri))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _write(self, sql, params):
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._conn.commit()
+
+    @staticmethod
+    def _now():
+        return time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime())
+
+def sync_check(local_path: Path, st, gcs_uri: str, remote_entry, known):
+    """Return the crc32c if the remote object already matches local_path, else None.
+
+    `known` is the manifest row for this file; it is only trusted while size and
+    mtime are unchanged, otherwise the file is hashed once and compared.
+    """
+    if remote_entry is None:
+        return None
+    remote_size, remote_crc = remote_entry
+    if remote_size != st.st_size or not remote_crc:
+        return None
+    if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+        return remote_crc if known[2] == remote_crc else None
+    local_crc = file_crc32c(local_path)
+    return local_crc if local_crc == remote_crc else None
+
+def bundle_sync_check(st, known, remote, bucket_name: str):
+    """(member uri, crc32c) if a small file is unchanged since it was bundled and its shard still exists, else (None, None).
+
+    `known` is the manifest row from Manifest.load_bundled. Only size and
+    mtime are compared: re-hashing every small file would cost as much as
+    bundling it again.
+    """
+    if not known or known[0] != st.st_size or known[1] != st.st_mtime_ns:
+        return None, None
+    shard_uri = known[3].rsplit("#", 1)[0]
+    if shard_uri[len(f"gs://{bucket_name}/"):] not in remote:
+        return None, None
+    return known[3], known[2]
+
+class AutoTuner:
+    """AIMD controller behind --auto.
+
+    Upload threads report bytes read and retries; the main loop calls tick()
+    about once a second. Every `interval_sec` the controller compares aggregate
+    throughput with the previous window: any retry halves the number of active
+    uploads, a throughput gain adds one, a clear loss takes one back. The
+    resumable chunk size for new files follows the observed per-stream rate,
+    so a chunk carries roughly `chunk_target_sec` seconds of data.
+    """
+
+    def __init__(self, workers: int, min_workers: int, max_workers: int, chunk_mb: int,
+                 interval_sec: float = 10.0, chunk_target_sec: float = 5.0,
+                 chunk_min_mb: int = 4, chunk_max_mb: int = 256):
+        self.limit = max(min_workers, min(workers, max_workers))
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.interval_sec = interval_sec
+        self.chunk_target_sec = chunk_target_sec
+        self.chunk_min_mb = chunk_min_mb
+        self.chunk_max_mb = chunk_max_mb
+        self._chunk_mb = chunk_mb
+        self._stream_mbps = None
+        self._prev_mbps = None
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._retries = 0
+        self._window_start = time.perf_counter()
+        self.decisions = []
+
+    def record_bytes(self, n: int):
+        with self._lock:
+            self._bytes += n
+
+    def record_retry(self, *_):
+        with self._lock:
+            self._retries += 1
+
+    @property
+    def chunk_mb(self) -> int:
+        with self._lock:
+            return self._chunk_mb
+
+    def chunk_mb_for(self, size_bytes: int) -> int:
+        """Chunk size for a file starting now, never larger than the file itself."""
+        return max(1, min(self.chunk_mb, math.ceil(size_bytes / MiB)))
+
+    def tick(self, inflight: int):
+        now = time.perf_counter()
+        elapsed = now - self._window_start
+        if elapsed < self.interval_sec:
+            return
+        with self._lock:
+            window_bytes, retries = self._bytes, self._retries
+            self._bytes = self._retries = 0
+            self._window_start = now
+        mbps = window_bytes / MiB / elapsed
+
+        if inflight:
+            per_stream = mbps / inflight
+            self._stream_mbps = per_stream if self._stream_mbps is None else 0.5 * self._stream_mbps + 0.5 * per_stream
+            chunk = int(self._stream_mbps * self.chunk_target_sec)
+            with self._lock:
+                self._chunk_mb = max(self.chunk_min_mb, min(self.chunk_max_mb, chunk))
+
+        old = self.limit
+        if retries:
+            new, reason = max(self.min_workers, old // 2), f"{retries} retries"
+        elif inflight < old:
+            # Not saturated (discovery or tail of the run): nothing to learn
+            new, reason = old, None
+        elif self._prev_mbps is None or mbps > self._prev_mbps * 1.05:
+            new, reason = min(self.max_workers, old + 1), "throughput up"
+        elif mbps < self._prev_mbps * 0.9:
+            new, reason = max(self.min_workers, old - 1), "throughput down"
+        else:
+            new, reason = old, None
+        self._prev_mbps = mbps
+
+        if new != old:
+            self.limit = new
+            ts = time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime())
+            self.decisions.append({
+                "timestamp_local": ts, "workers_from": old, "workers_to": new,
+                "throughput_MBps": round(mbps, 2), "chunk_mb": self._chunk_mb, "reason": reason,
+            })
+            print(f"[AUTO] workers {old} -> {new} ({reason}, {mbps:.2f} MB/s, chunk {self._chunk_mb} MiB)", file=sys.stderr)
+
+class Progress:
+    """Live run metrics for --progress-interval, printed to stderr and/or appended to a JSONL file.
+
+    Upload threads add bytes and retries as they happen; the main loop
+    reports in-flight count and finished-file latencies. Percentiles are
+    over the most recent 10000 files so the cost stays flat on huge runs.
+    """
+
+    def __init__(self, interval_sec: float, metrics_path: Path = None, to_stderr: bool = True):
+        self.interval_sec = interval_sec
+        self.metrics_path = metrics_path
+        self.to_stderr = to_stderr
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._bytes = 0
+        self._retries = 0
+        self._done = 0
+        self._failed = 0
+        self._inflight = 0
+        self._latencies = deque(maxlen=10000)
+        self._last = (self._start, 0)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record_bytes(self, n: int):
+        with self._lock:
+            self._bytes += n
+
+    def record_retry(self, *_):
+        with self._lock:
+            self._retries += 1
+
+    def set_inflight(self, n: int):
+        self._inflight = n
+
+    def file_done(self, duration_sec: float, ok: bool = True):
+        with self._lock:
+            if ok:
+                self._done += 1
+                self._latencies.append(duration_sec)
+            else:
+                self._failed += 1
+
+    def snapshot(self):
+        now = time.perf_counter()
+        with self._lock:
+            total, retries, done, failed = self._bytes, self._retries, self._done, self._failed
+            lat = sorted(self._latencies)
+        last_t, last_b = self._last
+        self._last = (now, total)
+
+        def pct(q):
+            return round(lat[min(len(lat) - 1, int(q * len(lat)))], 3) if lat else None
+
+        return {
+            "timestamp_local": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime()),
+            "elapsed_sec": round(now - self._start, 1),
+            "bytes_total": total,
+            "MBps_now": round((total - last_b) / MiB / (now - last_t), 2) if now > last_t else 0.0,
+            "MBps_avg": round(total / MiB / (now - self._start), 2) if now > self._start else 0.0,
+            "inflight": self._inflight,
+            "files_done": done,
+            "files_failed": failed,
+            "retries": retries,
+            "latency_p50_sec": pct(0.50),
+            "latency_p95_sec": pct(0.95),
+        }
+
+    def emit(self):
+        snap = self.snapshot()
+        if self.to_stderr:
+            print(f"[PROGRESS] {snap['MBps_now']} MB/s (avg {snap['MBps_avg']}), in-flight {snap['inflight']}, "
+                  f"done {snap['files_done']}, failed {snap['files_failed']}, retries {snap['retries']}, "
+                  f"p50 {snap['latency_p50_sec']}s, p95 {snap['latency_p95_sec']}s", file=sys.stderr)
+        if self.metrics_path:
+            with open(self.metrics_path, "a") as f:
+                f.write(json.dumps(snap) + "\n")
+
+    def _run(self):
+        while not self._stop.wait(self.interval_sec):
+            self.emit()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="progress", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.emit()
+
+class Shard:
+    """One finished tar shard waiting to be uploaded, plus its index entries."""
+
+    def __init__(self, local_path: Path, blob_name: str, compression: str):
+        self.local_path = local_path
+        self.blob_name = blob_name
+        self.compression = compression
+        self.entries = []
+
+class Bundler:
+    """Packs small files into tar shards of about target_bytes (uncompressed).
+
+    Offsets in the index are positions in the uncompressed tar stream, so for
+    uncompressed shards a member can be fetched with a single ranged GET.
+    """
+
+    def __init__(self, bucket_name: str, dest_prefix: str, target_bytes: int, compression: str, tmp_dir=None):
+        self._bucket_name = bucket_name
+        self._dest_prefix = dest_prefix
+        self._target_bytes = target_bytes
+        self._compression = compression
+        self._tmp_dir = tmp_dir
+        self._run_id = time.strftime("%Y%m%d_%H%M%S", time.localtime())
+        self._seq = 0
+        self._tar = None
+        self._shard = None
+
+    def _open(self):
+        suffix = ".tar.gz" if self._compression == "gz" else ".tar"
+        fd, tmp = tempfile.mkstemp(prefix="gcs_bundle_", suffix=suffix, dir=self._tmp_dir)
+        os.close(fd)
+        blob_name = f"{self._dest_prefix}_bundles/{self._run_id}-{self._seq:05d}{suffix}"
+        self._seq += 1
+        self._shard = Shard(Path(tmp), blob_name, self._compression)
+        self._tar = tarfile.open(tmp, "w:gz" if self._compression == "gz" else "w")
+
+    def add(self, local_path: Path, st, arcname: str):
+        """Append one file; returns the finished Shard once the target size is reached."""
+        # Small by definition, so read it whole: a file that changes size
+        # mid-copy can then never leave a truncated member in the shard.
+        with open(local_path, "rb") as fh:
+            data = fh.read()
+        if self._tar is None:
+            self._open()
+        info = tarfile.TarInfo(arcname)
+        info.size = len(data)
+        info.mtime = int(st.st_mtime)
+        info.mode = st.st_mode & 0o777
+        self._tar.addfile(info, io.BytesIO(data))
+        padded = (len(data) + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE * tarfile.BLOCKSIZE
+        self._shard.entries.append({
+            "path": arcname,
+            "source_path": str(local_path),
+            "shard": f"gs://{self._bucket_name}/{self._shard.blob_name}",
+            "offset": self._tar.offset - padded,
+            "size": len(data),
+            "mtime": st.st_mtime,
+            "crc32c": base64.b64encode(google_crc32c.Checksum(data).digest()).decode("ascii"),
+            "compression": self._compression,
+        })
+        if self._tar.offset >= self._target_bytes:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """Close the current shard (if any) and return it."""
+        if self._tar is None:
+            return None
+        self._tar.close()
+        shard, self._tar, self._shard = self._shard, None, None
+        return shard
+
+class ChecksumMismatch(Exception):
+    pass
+
+def b64_crc32c(value: int) -> str:
+    return base64.b64encode(value.to_bytes(4, "big")).decode("ascii")
+
+def _gf2_times(mat, vec):
+    total, i = 0, 0
+    while vec:
+        if vec & 1:
+            total ^= mat[i]
+        vec >>= 1
+        i += 1
+    return total
+
+def _gf2_square(mat):
+    return [_gf2_times(mat, mat[n]) for n in range(32)]
+
+def crc32c_combine(crc1: int, crc2: int, len2: int) -> int:
+    """CRC32C of A+B from crc(A), crc(B) and len(B) (zlib's crc32_combine, Castagnoli polynomial)."""
+    if len2 <= 0:
+        return crc1
+    odd = [0x82F63B78] + [1 << n for n in range(31)]
+    even = _gf2_square(odd)
+    odd = _gf2_square(even)
+    while True:
+        even = _gf2_square(odd)
+        if len2 & 1:
+            crc1 = _gf2_times(even, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+        odd = _gf2_square(even)
+        if len2 & 1:
+            crc1 = _gf2_times(odd, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+    return crc1 ^ crc2
+
+class FileSlice(io.RawIOBase):
+    """Read-only view of bytes [offset, offset+length) of a file.
+
+    Positions are relative to the slice, so the resumable upload code can
+    seek back to 0 on recovery without touching the rest of the file.
+
+    Bytes are hashed (CRC32C, optionally MD5) as the uploader reads them, so
+    verification costs no second pass over the file. Re-reads after a seek
+    back are not hashed twice.
+    """
+
+    def __init__(self, path: Path, offset: int, length: int, on_read=None, md5: bool = False):
+        self.on_read = on_read
+        self._fh = open(path, "rb")
+        self._offset = offset
+        self._length = length
+        self._pos = 0
+        self._fh.seek(offset)
+        self._crc = google_crc32c.Checksum()
+        self._md5 = hashlib.md5() if md5 else None
+        self._hashed = 0
+
+    @property
+    def fully_hashed(self) -> bool:
+        return self._hashed == self._length
+
+    @property
+    def crc32c_value(self) -> int:
+        return int.from_bytes(self._crc.digest(), "big")
+
+    @property
+    def crc32c(self) -> str:
+        return base64.b64encode(self._crc.digest()).decode("ascii")
+
+    @property
+    def md5(self) -> str:
+        return base64.b64encode(self._md5.digest()).decode("ascii") if self._md5 else ""
+
+    def finish_hash(self):
+        """Hash whatever the uploader did not read (e.g. a zero-length slice)."""
+        if not self.fully_hashed:
+            # a local read for the checksum only; it was not sent, so the tuner and progress must not count it
+            on_read, self.on_read = self.on_read, None
+            try:
+                self.seek(self._hashed)
+                while self.read(8 * MiB):
+                    pass
+            finally:
+                self.on_read = on_read
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self._length
+        self._pos = max(0, min(pos, self._length))
+        self._fh.seek(self._offset + self._pos)
+        return self._pos
+
+    def read(self, size=-1):
+        remaining = self._length - self._pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        start = self._pos
+        data = self._fh.read(size)
+        self._pos += len(data)
+        if start <= self._hashed < self._pos:
+            # Normally the read starts exactly at the hash frontier and the
+            # buffer is hashed as-is; only a partial re-read gets sliced.
+            fresh = data if self._hashed == start else data[self._hashed - start:]
+            self._crc.update(fresh)
+            if self._md5:
+                self._md5.update(fresh)
+            self._hashed = self._pos
+        if self.on_read:
+            self.on_read(len(data))
+        return data
+
+    def close(self):
+        self._fh.close()
+        super().close()
+
+def backoff_delay(attempt: int) -> float:
+    base = min(30.0, 2 ** (attempt - 1))
+    return base + random.uniform(0, 0.5 * base)
+
+def with_attempts(fn, label, max_attempts: int, on_retry=None):
+    """Call fn() up to max_attempts times with exponential backoff + jitter."""
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_attempts:
+                raise
+            if on_retry:
+                on_retry(e)
+            sleep_s = backoff_delay(attempt)
+            print(f"[RETRY {attempt}/{max_attempts-1}] {label} due to: {e}. Sleeping {sleep_s:.1f}s", file=sys.stderr)
+            time.sleep(sleep_s)
+
+CODEC_SUFFIX = {"gzip": ".gz", "bgzf": ".gz", "bz2": ".bz2", "zstd": ".zst"}
+CODEC_CONTENT_TYPE = {"gzip": "application/gzip", "bgzf": "application/gzip", "bz2": "application/x-bzip2",
+                      "zstd": "application/zstd"}
+DEFAULT_SKIP_EXT = ".gz,.bgz,.bz2,.xz,.zip,.zst,.7z,.bam,.cram,.sra,.png,.jpg,.jpeg"
+
+class CompressRule:
+    """Which files --compress applies to, and with what codec settings."""
+
+    def __init__(self, codec: str, threads: int, level: int = None, skip_ext: str = DEFAULT_SKIP_EXT, only_ext: str = ""):
+        self.codec = codec
+        self.threads = max(1, threads)
+        self.level = level
+        self.skip_ext = tuple(e.strip().lower() for e in skip_ext.split(",") if e.strip())
+        self.only_ext = tuple(e.strip().lower() for e in only_ext.split(",") if e.strip())
+
+    def codec_for(self, path: Path):
+        name = path.name.lower()
+        if self.skip_ext and name.endswith(self.skip_ext):
+            return None
+        if self.only_ext and not name.endswith(self.only_ext):
+            return None
+        return self.codec
+
+class WireWriter:
+    """Forwards compressed bytes to the blob writer, hashing and counting them."""
+
+    def __init__(self, out, md5: bool = False):
+        self._out = out
+        self._crc = google_crc32c.Checksum()
+        self._md5 = hashlib.md5() if md5 else None
+        self.bytes_written = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._crc.update(data)
+        if self._md5:
+            self._md5.update(data)
+        self.bytes_written += len(data)
+        return self._out.write(data)
+
+    def flush(self):
+        pass
+
+    @property
+    def crc32c(self) -> str:
+        return base64.b64encode(self._crc.digest()).decode("ascii")
+
+    @property
+    def md5(self) -> str:
+        return base64.b64encode(self._md5.digest()).decode("ascii") if self._md5 else ""
+
+    def finish_hash(self):
+        pass
+
+def compress_stream(src, out, rule: CompressRule, block_size: int = 4 * MiB):
+    """Compress src into out on rule.threads threads without touching disk.
+
+    gzip/bgzf/bz2: blockzip cuts src into independent blocks, compresses
+    them on a thread pool (zlib and bz2 drop the GIL) and writes them in
+    order. The result is a standard multi-member .gz/.bz2 that
+    gzip/zcat/bzcat read as one file and blockzip.py decompresses in parallel.
+    zstd: zstandard's own multi-threaded compressor.
+    """
+    if rule.codec == "zstd":
+        cctx = zstandard.ZstdCompressor(level=rule.level or 3, threads=rule.threads)
+        with cctx.stream_writer(out, closefd=False) as zw:
+            for block in iter(lambda: src.read(block_size), b""):
+                zw.write(block)
+        return
+    with ThreadPoolExecutor(max_workers=rule.threads) as ex:
+        for data in blockzip.compress_blocks(src.read, rule.codec, ex, level=rule.level,
+                                             block_size=None if rule.codec == "bz2" else block_size,
+                                             window=rule.threads * 2):
+            out.write(data)
+
+def verify_upload(blob, fh: FileSlice, label):
+    """Compare the hashes computed while uploading with what GCS stored."""
+    fh.finish_hash()
+    problems = []
+    if blob.crc32c != fh.crc32c:
+        problems.append(f"crc32c local={fh.crc32c} remote={blob.crc32c}")
+    if fh.md5 and blob.md5_hash and blob.md5_hash != fh.md5:
+        problems.append(f"md5 local={fh.md5} remote={blob.md5_hash}")
+    if problems:
+        try:
+            blob.delete()
+        except Exception:
+            pass
+        raise ChecksumMismatch(f"{label}: " + ", ".join(problems))
+
+class SessionExpired(Exception):
+    pass
+
+def session_status(http, session_url: str, size_bytes: int, timeout: float):
+    """Ask GCS how much of a resumable session it has committed.
+
+    Returns the next byte to send (size_bytes when the object is complete);
+    raises SessionExpired once GCS has dropped the session.
+    """
+    r = http.put(session_url, headers={"Content-Range": f"bytes */{size_bytes}"}, timeout=timeout)
+    if r.status_code in (200, 201):
+        return size_bytes
+    if r.status_code == 308:
+        rng = r.headers.get("Range")
+        return int(rng.rsplit("-", 1)[1]) + 1 if rng else 0
+    if r.status_code in (404, 410):
+        raise SessionExpired(session_url)
+    r.raise_for_status()
+    raise RuntimeError(f"Unexpected status {r.status_code} for resumable session")
+
+def upload_journaled(
+    blob,
+    local_path: Path,
+    size_bytes: int,
+    mtime_ns: int,
+    journal: Journal,
+    chunk_bytes: int,
+    write_timeout_sec: float,
+    max_attempts: int,
+    md5: bool = False,
+    on_read=None,
+    on_retry=None,
+):
+    """Resumable upload whose session survives process restarts.
+
+    Speaks the resumable protocol directly so the session URI and committed
+    offset can be journaled after every chunk. On rerun a journaled session
+    for the same (size, mtime) is queried and continued; only an expired
+    session starts over from byte zero. Returns (crc32c, md5).
+    """
+    source_path = str(local_path)
+    gcs_uri = f"gs://{blob.bucket.name}/{blob.name}"
+    http = requests.Session()  # the session URI itself authorises the upload
+
+    pos = None
+    known = journal.get(source_path, gcs_uri)
+    if known and known[0] == size_bytes and known[1] == mtime_ns:
+        session_url = known[2]
+        try:
+            pos = session_status(http, session_url, size_bytes, write_timeout_sec)
+            print(f"[RESUME] {local_path} from byte {pos}/{size_bytes}", file=sys.stderr)
+        except SessionExpired:
+            print(f"[RESUME] {local_path}: session expired, starting over", file=sys.stderr)
+    if pos is None:
+        session_url = blob.create_resumable_upload_session(size=size_bytes, timeout=write_timeout_sec, checksum=None)
+        journal.start(source_path, gcs_uri, size_bytes, mtime_ns, session_url)
+        pos = 0
+
+    with FileSlice(local_path, 0, size_bytes, None, md5=md5) as fh:
+        # Bytes committed by an earlier process still have to be hashed for
+        # verification; that is a local read, not a re-upload.
+        while fh.tell() < pos and fh.read(min(8 * MiB, pos - fh.tell())):
+            pass
+        fh.on_read = on_read
+        failures = 0
+        while pos < size_bytes:
+            fh.seek(pos)
+            data = fh.read(chunk_bytes)
+            end = pos + len(data) - 1
+            try:
+                r = http.put(
+                    session_url, data=data,
+                    headers={"Content-Range": f"bytes {pos}-{end}/{size_bytes}"},
+                    timeout=write_timeout_sec,
+                )
+                if r.status_code in (200, 201):
+                    pos = size_bytes
+                elif r.status_code == 308:
+                    rng = r.headers.get("Range")
+                    pos = int(rng.rsplit("-", 1)[1]) + 1 if rng else 0
+                    failures = 0
+                elif r.status_code in (404, 410):
+                    journal.finish(source_path, gcs_uri)
+                    raise SessionExpired(session_url)
+                else:
+                    r.raise_for_status()
+                    raise RuntimeError(f"Unexpected status {r.status_code}")
+            except (requests.RequestException, RuntimeError) as e:
+                status = getattr(getattr(e, "response", None), "status_code", None)
+                if status and 400 <= status < 500 and status not in (408, 429):
+                    raise  # bad request, auth or permission: another PUT gets the same answer
+                failures += 1
+                if failures >= max_attempts:
+                    raise
+                if on_retry:
+                    on_retry(e)
+                sleep_s = backoff_delay(failures)
+                print(f"[RETRY {failures}/{max_attempts-1}] {local_path} @ {pos} due to: {e}. Sleeping {sleep_s:.1f}s", file=sys.stderr)
+                time.sleep(sleep_s)
+                try:
+                    pos = session_status(http, session_url, size_bytes, write_timeout_sec)
+                except SessionExpired:
+                    journal.finish(source_path, gcs_uri)
+                    raise
+                except requests.RequestException:
+                    pass  # keep pos; the next PUT will tell us where GCS is
+                continue
+            journal.advance(source_path, gcs_uri, pos)
+
+        blob.reload(timeout=write_timeout_sec)
+        try:
+            verify_upload(blob, fh, blob.name)
+        finally:
+            journal.finish(source_path, gcs_uri)
+        return fh.crc32c, fh.md5
+
+def slice_ranges(size_bytes: int, slices: int):
+    """Split [0, size_bytes) into at most `slices` contiguous (offset, length) ranges."""
+    slices = max(1, min(slices, COMPOSE_MAX_SOURCES, size_bytes or 1))
+    step = math.ceil(size_bytes / slices)
+    return [(off, min(step, size_bytes - off)) for off in range(0, size_bytes, step)]
+
+def upload_sliced(
+    bucket,
+    blob,
+    local_path: Path,
+    size_bytes: int,
+    slices: int,
+    write_timeout_sec: float,
+    chunk_mb: int,
+    max_attempts: int,
+    retry_policy,
+    on_read=None,
+    on_retry=None,
+):
+    """Upload byte ranges of one file concurrently, then compose them into `blob`.
+
+    Each range goes to a temporary part object next to the destination; the
+    parts are deleted once the compose succeeds (or the upload gives up).
+    Every part is verified against its own CRC32C, and the composite object's
+    CRC32C against the combination of the part CRCs. Returns the file CRC32C.
+    """
+    ranges = slice_ranges(size_bytes, slices)
+    part_names = [f"{blob.name}.__part{i:02d}of{len(ranges):02d}" for i in range(len(ranges))]
+
+    def send_part(name, offset, length):
+        part = bucket.blob(name)
+        if chunk_mb and chunk_mb > 0:
+            part.chunk_size = chunk_mb * MiB
+
+        def attempt():
+            with FileSlice(local_path, offset, length, on_read) as fh:
+                part.upload_from_file(fh, size=length, timeout=write_timeout_sec, retry=retry_policy, checksum=None)
+                verify_upload(part, fh, part.name)
+                return part, fh.crc32c_value
+
+        return with_attempts(attempt, f"{local_path} [{offset}+{length}]", max_attempts, on_retry)
+
+    parts = []
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges)) as ex:
+            futs = [ex.submit(send_part, name, off, length) for name, (off, length) in zip(part_names, ranges)]
+            results = [fut.result() for fut in futs]
+        parts = [part for part, _ in results]
+        crc = results[0][1]
+        for (_, part_crc), (_, length) in zip(results[1:], ranges[1:]):
+            crc = crc32c_combine(crc, part_crc, length)
+        expected = b64_crc32c(crc)
+
+        def compose():
+            blob.compose(parts, timeout=write_timeout_sec, retry=retry_policy)
+            if blob.crc32c != expected:
+                raise ChecksumMismatch(f"{blob.name}: composite crc32c local={expected} remote={blob.crc32c}")
+
+        with_attempts(compose, f"{local_path} [compose]", max_attempts, on_retry)
+        return expected
+    finally:
+        for name in part_names:
+            try:
+                bucket.blob(name).delete(timeout=write_timeout_sec)
+            except Exception:
+                pass  # part never uploaded or already gone
 
 def upload_one(
     client,
@@ -31,15 +958,53 @@ def upload_one(
     write_timeout_sec: float,
     chunk_mb: int,
     max_attempts: int,
+    slice_threshold_mb: int = 0,
+    slices: int = 1,
+    size_bytes: int = None,
+    blob_name: str = None,
+    tuner: AutoTuner = None,
+    md5: bool = False,
+    compress: CompressRule = None,
+    journal: Journal = None,
+    journal_min_mb: int = 64,
+    mtime_ns: int = None,
+    progress: Progress = None,
 ):
     bucket = client.bucket(bucket_name)
-    rel = local_path.relative_to(source_root) if source_root.is_dir() else local_path.name
-    blob_name = f"{dest_prefix}{rel}".replace("\\", "/")
+    codec = compress.codec_for(local_path) if compress else None
+    if blob_name is None:
+        blob_name = blob_name_for(local_path, dest_prefix, source_root) + CODEC_SUFFIX.get(codec, "")
     blob = bucket.blob(blob_name)
 
+    start_total = time.perf_counter()
+    if size_bytes is None or mtime_ns is None:
+        st = local_path.stat()
+        size_bytes, mtime_ns = st.st_size, st.st_mtime_ns
+
+    retries = 0
+    def on_retry(_exc):
+        nonlocal retries
+        retries += 1
+        if tuner:
+            tuner.record_retry()
+        if progress:
+            progress.record_retry()
+
+    sinks = [s.record_bytes for s in (tuner, progress) if s]
+    if len(sinks) > 1:
+        def on_read(n):
+            for sink in sinks:
+                sink(n)
+    else:
+        on_read = sinks[0] if sinks else None
+    workers_limit = tuner.limit if tuner else ""
+
+    if tuner:
+        chunk_mb = tuner.chunk_mb_for(size_bytes)
+
     # Force resumable upload and smaller HTTP writes for flaky links
     if chunk_mb and chunk_mb > 0:
-        blob.chunk_size = chunk_mb * 1024 * 1024  # bytes
+        blob.chunk_size = chunk_mb * MiB  # bytes
 
     # Retry transient network errors and 5xx
     retry_policy = Retry(
@@ -47,43 +1012,123 @@ def upload_one(
         maximum=32.0,         # cap backoff between attempts
         multiplier=2.0,       # exponential
         deadline=write_timeout_sec + 60,  # internal deadline per attempt
+        on_error=on_retry,
     )
 
-    start_total = time.perf_counter()
-    size_bytes = local_path.stat().st_size
-    last_err = None
+    wire_bytes = size_bytes
+    if codec:
+        # Compressed on the fly into a resumable upload; nothing hits disk.
+        # The raw file is hashed as it is read (src-* metadata), the wire
+        # bytes as they are written (verified against the object).
+        def attempt():
+            with FileSlice(local_path, 0, size_bytes, on_read, md5=md5) as src:
+                blob.content_type = CODEC_CONTENT_TYPE[codec]
+                with blob.open("wb", chunk_size=blob.chunk_size, retry=retry_policy,
+                               timeout=write_timeout_sec, checksum=None) as bw:
+                    wire = WireWriter(bw, md5=md5)
+                    compress_stream(src, wire, compress)
+                blob.reload(timeout=write_timeout_sec, retry=retry_policy)
+                verify_upload(blob, wire, blob.name)
+                src.finish_hash()
+                return src.crc32c, src.md5, wire.bytes_written
 
-    for attempt in range(1, max_attempts + 1):
-        try:
-            # timeout here is per HTTP request/chunk, not whole file
-            blob.upload_from_filename(
-                str(local_path),
-                timeout=write_timeout_sec,
-                retry=retry_policy,
+        crc32c, md5_b64, wire_bytes = with_attempts(attempt, local_path, max_attempts, on_retry)
+    elif slice_threshold_mb and slices > 1 and size_bytes >= slice_threshold_mb * MiB:
+        # Large file: parallel composite upload, one stream per slice.
+        # MD5 needs one sequential pass, so sliced uploads carry CRC32C only.
+        crc32c = upload_sliced(
+            bucket, blob, local_path, size_bytes, slices,
+            write_timeout_sec, chunk_mb, max_attempts, retry_policy,
+            on_read, on_retry,
+        )
+        md5_b64 = ""
+    elif journal and size_bytes >= max(1, journal_min_mb) * MiB:
+        # Big enough that losing progress on a crash hurts: journaled session.
+        # upload_journaled retries each chunk itself; only a session GCS has
+        # dropped mid-upload, or an object that failed verification (already
+        # deleted), is worth one more go, from byte zero.
+        chunk_bytes = (chunk_mb if chunk_mb and chunk_mb > 0 else 8) * MiB
+        def attempt():
+            return upload_journaled(
+                blob, local_path, size_bytes, mtime_ns, journal, chunk_bytes,
+                write_timeout_sec, max_attempts, md5, on_read, on_retry,
             )
-            dur = time.perf_counter() - start_total
-            mbps = (size_bytes / (1024 * 1024)) / dur if dur > 0 else 0.0
-            ts = time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime())
-            return {
-                "timestamp_local": ts,
-                "source_path": str(local_path),
-                "gcs_uri": f"gs://{bucket_name}/{blob_name}",
-                "size_bytes": size_bytes,
-                "duration_sec": round(dur, 3),
-                "throughput_MBps": round(mbps, 2),
-            }
-        except Exception as e:
-            last_err = e
-            if attempt >= max_attempts:
-                raise
-            # Exponential backoff with jitter
-            base = 2 ** (attempt - 1)
-            sleep_s = min(30.0, base) + random.uniform(0, 0.5 * min(30.0, base))
-            print(f"[RETRY {attempt}/{max_attempts-1}] {local_path} due to: {e}. Sleeping {sleep_s:.1f}s", file=sys.stderr)
-            time.sleep(sleep_s)
 
-    # Should not reach here
-    raise last_err
+        try:
+            crc32c, md5_b64 = attempt()
+        except (SessionExpired, ChecksumMismatch) as e:
+            on_retry(e)
+            print(f"[RETRY] {local_path} from byte 0 due to: {e!r}", file=sys.stderr)
+            crc32c, md5_b64 = attempt()
+    else:
+        def attempt():
+            with FileSlice(local_path, 0, size_bytes, on_read, md5=md5) as fh:
+                # timeout here is per HTTP request/chunk, not whole file.
+                # The library's own checksum is off: FileSlice already hashes
+                # the same bytes on their way out.
+                blob.upload_from_file(
+                    fh,
+                    size=size_bytes,
+                    timeout=write_timeout_sec,
+                    retry=retry_policy,
+                    checksum=None,
+                )
+                verify_upload(blob, fh, blob.name)
+                return fh.crc32c, fh.md5
+
+        crc32c, md5_b64 = with_attempts(attempt, local_path, max_attempts, on_retry)
+
+    if codec:
+        # The object's own crc32c/md5Hash describe the compressed bytes, so the
+        # verified source checksums go into metadata for --sync and downstream
+        # tools. They are only known once the upload is done, hence the PATCH.
+        # Uncompressed objects need none: their crc32c/md5Hash are the source's.
+        meta = {"src-crc32c": crc32c, "src-size": str(size_bytes), "src-codec": codec}
+        if md5_b64:
+            meta["src-md5"] = md5_b64
+        blob.metadata = {**(blob.metadata or {}), **meta}
+        with_attempts(lambda: blob.patch(timeout=write_timeout_sec, retry=retry_policy), f"{local_path} [metadata]", max_attempts, on_retry)
+
+    dur = time.perf_counter() - start_total
+    # Effective throughput counts source bytes, so compression shows up as speed
+    mbps = (size_bytes / MiB) / dur if dur > 0 else 0.0
+    wire_mbps = (wire_bytes / MiB) / dur if dur > 0 else 0.0
+    ts = time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime())
+    return {
+        "timestamp_local": ts,
+        "source_path": str(local_path),
+        "gcs_uri": f"gs://{bucket_name}/{blob_name}",
+        "size_bytes": size_bytes,
+        "duration_sec": round(dur, 3),
+        "throughput_MBps": round(mbps, 2),
+        "wire_bytes": wire_bytes,
+        "wire_MBps": round(wire_mbps, 2),
+        "status": "uploaded",
+        "crc32c": crc32c,
+        "md5": md5_b64,
+        "chunk_mb": chunk_mb,
+        "workers_limit": workers_limit,
+        "retries": retries,
+    }
+
+def upload_shard(client, bucket_name: str, shard: Shard, **upload_kwargs):
+    """Upload a finished tar shard and its <shard>.index.jsonl sidecar, then drop the local copy."""
+    try:
+        row = upload_one(
+            client, bucket_name, shard.local_path, "", shard.local_path.parent,
+            # a shard is a fresh temp file each run, so a journaled session could never be resumed
+            blob_name=shard.blob_name, **{**upload_kwargs, "compress": None, "journal": None},
+        )
+        index_blob = client.bucket(bucket_name).blob(f"{shard.blob_name}.index.jsonl")
+        index_body = "".join(json.dumps(e) + "\n" for e in shard.entries)
+        with_attempts(
+            lambda: index_blob.upload_from_string(index_body, content_type="application/x-ndjson"),
+            f"{shard.blob_name}.index.jsonl",
+            upload_kwargs.get("max_attempts", 6),
+        )
+    finally:
+        shard.local_path.unlink(missing_ok=True)
+    return row
 
 def main():
     ap = argparse.ArgumentParser(description="Upload to GCS with per-file time report (robust timeouts/retries)")
@@ -94,6 +1139,31 @@ def main():
     ap.add_argument("--timeout-sec", type=float, default=900, help="Per-request (per-chunk) timeout, seconds (default 900=15m)")
     ap.add_argument("--chunk-mb", type=int, default=8, help="Resumable chunk size in MiB (default 8; try 8–32 on flaky links)")
     ap.add_argument("--max-attempts", type=int, default=6, help="Total attempts per file (default 6)")
+    ap.add_argument("--slice-threshold-mb", type=int, default=0, help="Upload files >= this size (MiB) as parallel slices composed server-side (default 0=off)")
+    ap.add_argument("--slices", type=int, default=8, help=f"Slices per large file, max {COMPOSE_MAX_SOURCES} (default 8)")
+    ap.add_argument("--sync", action="store_true", help="Skip files whose size and crc32c already match the bucket")
+    ap.add_argument("--manifest", default=None, help="SQLite manifest for --sync (default: ./logs/gcs_manifest.sqlite)")
+    ap.add_argument("--order", choices=["scan", "largest-first", "interleave"], default="scan", help="Upload order within the look-ahead window (default scan)")
+    ap.add_argument("--order-window", type=int, default=10000, help="Files buffered for --order (default 10000)")
+    ap.add_argument("--bundle-under-kb", type=int, default=0, help="Pack files smaller than this (KiB) into tar shards (default 0=off)")
+    ap.add_argument("--bundle-target-mb", type=int, default=256, help="Target uncompressed shard size in MiB (default 256)")
+    ap.add_argument("--bundle-compress", choices=["none", "gz"], default="none", help="Shard compression (default none; gz disables ranged reads)")
+    ap.add_argument("--bundle-dir", default=None, help="Scratch directory for shards being built (default: system temp)")
+    ap.add_argument("--md5", action="store_true", help="Also compute and verify MD5 (not for sliced uploads); CRC32C is always verified")
+    ap.add_argument("--compress", choices=["none", "gzip", "bgzf", "bz2", "zstd"], default="none", help="Compress on the fly while uploading (default none; zstd needs the zstandard package)")
+    ap.add_argument("--compress-threads", type=int, default=os.cpu_count() or 1, help="Compression threads per file (default: CPU count)")
+    ap.add_argument("--compress-level", type=int, default=None, help="Codec level (default gzip/bgzf 6, bz2 9, zstd 3)")
+    ap.add_argument("--compress-skip-ext", default=DEFAULT_SKIP_EXT, help="Comma-separated suffixes uploaded as-is (already compressed)")
+    ap.add_argument("--compress-only-ext", default="", help="If set, only compress files with these comma-separated suffixes (e.g. .fastq,.sam,.vcf)")
+    ap.add_argument("--journal", default=None, help="SQLite journal of resumable sessions (default: ./logs/gcs_journal.sqlite)")
+    ap.add_argument("--no-journal", action="store_true", help="Do not persist resumable sessions across runs")
+    ap.add_argument("--journal-min-mb", type=int, default=64, help="Journal sessions for files >= this size in MiB (default 64)")
+    ap.add_argument("--auto", action="store_true", help="Tune active uploads (AIMD) and chunk size from live throughput/retries; --workers/--chunk-mb become starting points")
+    ap.add_argument("--min-workers", type=int, default=1, help="Lower bound for --auto (default 1)")
+    ap.add_argument("--max-workers", type=int, default=32, help="Upper bound for --auto (default 32)")
+    ap.add_argument("--auto-interval-sec", type=float, default=10, help="Seconds per --auto measurement window (default 10)")
+    ap.add_argument("--progress-interval", type=float, default=0, help="Print live bytes/s, in-flight, retries and p50/p95 latency every N seconds (default 0=off)")
+    ap.add_argument("--metrics-file", default=None, help="Append the live progress snapshots as JSON lines to this file")
     ap.add_argument("--log", default=None, help="CSV log path (default: ./logs/gcs_upload_<timestamp>.csv)")
     args = ap.parse_args()
 
@@ -102,62 +1172,213 @@ def main():
         print(f"Source not found: {source}", file=sys.stderr)
         sys.exit(1)
 
+    compress = None
+    if args.compress != "none":
+        if args.compress == "zstd" and zstandard is None:
+            print("--compress zstd needs the zstandard package (pip install zstandard)", file=sys.stderr)
+            sys.exit(1)
+        compress = CompressRule(args.compress, args.compress_threads, args.compress_level,
+                                args.compress_skip_ext, args.compress_only_ext)
+
     ts_name = time.strftime("%Y%m%d_%H%M%S", time.localtime())
     log_dir = Path("./logs"); log_dir.mkdir(parents=True, exist_ok=True)
     log_path = Path(args.log) if args.log else log_dir / f"gcs_upload_{ts_name}.csv"
 
     client = storage.Client()
-    files = list(iter_files(source))
-    if not files:
-        print("No files to upload.")
-        return
+    journal = None if args.no_journal else Journal(Path(args.journal) if args.journal else log_dir / "gcs_journal.sqlite")
 
     prefix = args.prefix
     if prefix and not prefix.endswith("/"):
         prefix += "/"
 
-    print(f"Uploading {len(files)} file(s) to gs://{args.bucket}/{prefix} ...")
+    manifest = None
+    remote = known = bundled = {}
+    if args.sync:
+        manifest = Manifest(Path(args.manifest) if args.manifest else log_dir / "gcs_manifest.sqlite")
+        t0 = time.perf_counter()
+        remote = list_remote(client, args.bucket, prefix)
+        known = manifest.load(f"gs://{args.bucket}/{prefix}")
+        bundled = manifest.load_bundled(f"gs://{args.bucket}/{prefix}")
+        print(f"Sync: {len(remote)} object(s) under gs://{args.bucket}/{prefix}, "
+              f"{len(known)} manifest row(s) ({time.perf_counter() - t0:.1f}s)")
+
+    print(f"Uploading {source} to gs://{args.bucket}/{prefix} ...")
     with open(log_path, "w", newline="") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=[
-                "timestamp_local",
-                "source_path",
-                "gcs_uri",
-                "size_bytes",
-                "duration_sec",
-                "throughput_MBps",
-            ],
-        )
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
         writer.writeheader()
 
-        successes = 0
-        with ThreadPoolExecutor(max_workers=args.workers) as ex:
-            futs = {
-                ex.submit(
-                    upload_one,
-                    client,
-                    args.bucket,
-                    p,
-                    prefix,
-                    source,
-                    args.timeout_sec,
-                    args.chunk_mb,
-                    args.max_attempts,
-                ): p
-                for p in files
-            }
-            for fut in as_completed(futs):
-                p = futs[fut]
+        successes = skipped = failed = 0
+        # Bounded in-flight set: discovery only runs ahead of the uploads by a
+        # couple of files per worker, so memory stays flat on huge trees.
+        # With --auto the pool is sized for the upper bound and the number of
+        # submitted futures *is* the concurrency the controller allows.
+        def inflight_cap():
+            return tuner.limit if tuner else max(1, args.workers) * 2
+        pending = {}
+
+        progress = None
+        if args.progress_interval > 0 or args.metrics_file:
+            progress = Progress(args.progress_interval or 10, Path(args.metrics_file) if args.metrics_file else None,
+                                to_stderr=args.progress_interval > 0)
+            progress.start()
+
+        tuner = None
+        if args.auto:
+            tuner = AutoTuner(args.workers, args.min_workers, args.max_workers, args.chunk_mb, args.auto_interval_sec)
+        pool_size = args.max_workers if tuner else args.workers
+
+        upload_kwargs = dict(
+            write_timeout_sec=args.timeout_sec,
+            chunk_mb=args.chunk_mb,
+            max_attempts=args.max_attempts,
+            slice_threshold_mb=args.slice_threshold_mb,
+            slices=args.slices,
+            tuner=tuner,
+            md5=args.md5,
+            compress=compress,
+            journal=journal,
+            journal_min_mb=args.journal_min_mb,
+            progress=progress,
+        )
+        bundler = None
+        if args.bundle_under_kb > 0:
+            bundler = Bundler(args.bucket, prefix, args.bundle_target_mb * MiB, args.bundle_compress, args.bundle_dir)
+
+        def collect(block):
+            nonlocal successes, failed
+            timeout = (1.0 if tuner or progress else None) if block else 0
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if tuner:
+                tuner.tick(len(pending))
+            if progress:
+                progress.set_inflight(sum(1 for f in pending if f.running()))
+            for fut in done:
+                p, st = pending.pop(fut)
+                if isinstance(p, Shard):
+                    try:
+                        row = fut.result()
+                        writer.writerow(row)
+                        for e in p.entries:
+                            writer.writerow({
+                                "timestamp_local": row["timestamp_local"],
+                                "source_path": e["source_path"],
+                                "gcs_uri": e["shard"],
+                                "size_bytes": e["size"],
+                                "duration_sec": 0,
+                                "throughput_MBps": 0,
+                                "wire_bytes": 0,
+                                "wire_MBps": 0,
+                                "status": "bundled",
+                                "crc32c": "",
+                            })
+                        successes += len(p.entries)
+                        if manifest:
+                            for e in p.entries:
+                                manifest.put(e["source_path"], f"{e['shard']}#{e['offset']}", e["size"],
+                                             bundled_mtime_ns.pop(e["source_path"]), e["crc32c"])
+                        if progress:
+                            progress.file_done(row["duration_sec"])
+                        print(f"[OK] {len(p.entries)} file(s) -> {row['gcs_uri']} ({row['duration_sec']}s, {row['throughput_MBps']} MB/s)")
+                    except Exception as e:
+                        failed += len(p.entries)
+                        for entry in p.entries:
+                            bundled_mtime_ns.pop(entry["source_path"], None)
+                        if progress:
+                            progress.file_done(0, ok=False)
+                        print(f"[FAIL] shard {p.blob_name} ({len(p.entries)} file(s)): {e}", file=sys.stderr)
+                    continue
                 try:
                     row = fut.result()
                     writer.writerow(row)
                     successes += 1
+                    if progress:
+                        progress.file_done(row["duration_sec"])
+                    if manifest and row["crc32c"]:
+                        manifest.put(str(p), row["gcs_uri"], st.st_size, st.st_mtime_ns, row["crc32c"])
                     print(f"[OK] {p} -> {row['gcs_uri']} ({row['duration_sec']}s, {row['throughput_MBps']} MB/s)")
                 except Exception as e:
+                    failed += 1
+                    if progress:
+                        progress.file_done(0, ok=False)
                     print(f"[FAIL] {p}: {e}", file=sys.stderr)
 
-    print(f"Done. Success: {successes}/{len(files)}. Log: {log_path}")
+        # mtime of each file sitting in an unfinished shard, for its manifest row once the shard lands
+        bundled_mtime_ns = {}
+        with ThreadPoolExecutor(max_workers=pool_size) as ex:
+            for p, st in schedule(scan_files(source), args.order, args.order_window):
+                to_bundle = bundler is not None and st.st_size < args.bundle_under_kb * 1024
+                if args.sync and to_bundle:
+                    gcs_uri, crc = bundle_sync_check(st, bundled.get(str(p)), remote, args.bucket)
+                elif args.sync:
+                    codec = compress.codec_for(p) if compress else None
+                    blob_name = blob_name_for(p, prefix, source) + CODEC_SUFFIX.get(codec, "")
+                    gcs_uri = f"gs://{args.bucket}/{blob_name}"
+                    crc = sync_check(p, st, gcs_uri, remote.get(blob_name), known.get((str(p), gcs_uri)))
+                if args.sync and crc:
+                    if not to_bundle:
+                        manifest.put(str(p), gcs_uri, st.st_size, st.st_mtime_ns, crc)
+                    writer.writerow({
+                        "timestamp_local": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime()),
+                        "source_path": str(p),
+                        "gcs_uri": gcs_uri,
+                        "size_bytes": st.st_size,
+                        "duration_sec": 0,
+                        "throughput_MBps": 0,
+                        "wire_bytes": 0,
+                        "wire_MBps": 0,
+                        "status": "skipped",
+                        "crc32c": crc,
+                    })
+                    skipped += 1
+                    continue
+                while len(pending) >= inflight_cap():
+                    collect(block=True)
+                if to_bundle:
+                    rel = p.relative_to(source) if source.is_dir() else p.name
+                    try:
+                        shard = bundler.add(p, st, str(rel).replace("\\", "/"))
+                    except OSError as e:
+                        failed += 1
+                        print(f"[FAIL] {p}: {e}", file=sys.stderr)
+                        continue
+                    bundled_mtime_ns[str(p)] = st.st_mtime_ns
+                    if shard:
+                        pending[ex.submit(upload_shard, client, args.bucket, shard, **upload_kwargs)] = (shard, None)
+                    continue
+                fut = ex.submit(
+                    upload_one,
+                    client,
+                    args.bucket,
+                    p,
+                    prefix,
+                    source,
+                    size_bytes=st.st_size,
+                    mtime_ns=st.st_mtime_ns,
+                    **upload_kwargs,
+                )
+                pending[fut] = (p, st)
+                if len(pending) > (tuner.limit if tuner else args.workers):
+                    collect(block=False)
+            shard = bundler.flush() if bundler else None
+            if shard:
+                pending[ex.submit(upload_shard, client, args.bucket, shard, **upload_kwargs)] = (shard, None)
+            while pending:
+                collect(block=True)
+        if progress:
+            progress.stop()
+
+    if manifest:
+        manifest.close()
+    if journal:
+        journal.close()
+    if tuner:
+        print(f"Auto: final workers {tuner.limit}, chunk {tuner.chunk_mb} MiB, {len(tuner.decisions)} adjustment(s)")
+        for d in tuner.decisions:
+            print(f"  {d['timestamp_local']} workers {d['workers_from']} -> {d['workers_to']} "
+                  f"({d['reason']}, {d['throughput_MBps']} MB/s, chunk {d['chunk_mb']} MiB)")
+    if successes + failed + skipped == 0:
+        print("No files to upload.")
+    print(f"Done. Success: {successes}/{successes + failed}, skipped (unchanged): {skipped}. Log: {log_path}")
 
 if __name__ == "__main__":
     main()